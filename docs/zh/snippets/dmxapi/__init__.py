@@ -0,0 +1,129 @@
+"""DMXAPI 示例代码共用的辅助模块
+
+docs/zh/snippets 下的客户端类通过 `from dmxapi import ...` 引用这里的公共组件。
+在仓库中直接运行 `python kling-*.py` 时脚本所在目录会加入 sys.path，无需额外安装；单独使用示例代码时
+先执行 `pip install ./docs/zh/snippets` 安装本包，见 docs/zh/models/kling/dmxapi-helpers.md。
+"""
+import importlib
+
+# 公共名称 -> 所在模块。子模块在第一次访问对应名称时才导入，
+# 命令行等短进程只加载用到的部分，不为 asyncio、http.server 等付出启动时间
+_EXPORTS = {
+    "AsyncConnectionPool": "aio",
+    "AsyncKlingClient": "aio",
+    "FileBase64": "body",
+    "FileChangedError": "body",
+    "StreamingJSONBody": "body",
+    "DownloadError": "download",
+    "Downloader": "download",
+    "download_results": "download",
+    "get_downloader": "download",
+    "EncodingCache": "encode_cache",
+    "configure_encoding_cache": "encode_cache",
+    "get_encoding_cache": "encode_cache",
+    "generate_many": "fanout",
+    "AdaptiveSchedule": "intervals",
+    "CompletionStats": "intervals",
+    "TaskJournal": "journal",
+    "configure_journal": "journal",
+    "get_journal": "journal",
+    "disable_metrics": "metrics",
+    "enable_metrics": "metrics",
+    "prometheus_text": "metrics",
+    "serve_metrics": "metrics",
+    "Poller": "poller",
+    "StatusEvent": "poller",
+    "TaskFailedError": "poller",
+    "get_poller": "poller",
+    "ConnectionPool": "pool",
+    "PooledResponse": "pool",
+    "get_pool": "pool",
+    "pool_stats": "pool",
+    "ImagePreprocessor": "preprocess",
+    "configure_preprocess": "preprocess",
+    "get_preprocessor": "preprocess",
+    "ResultCache": "result_cache",
+    "configure_result_cache": "result_cache",
+    "get_result_cache": "result_cache",
+    "CircuitBreaker": "retry",
+    "CircuitOpenError": "retry",
+    "RetryBudget": "retry",
+    "RetryPolicy": "retry",
+    "get_retry_policy": "retry",
+    "DeadlineExceededError": "scheduler",
+    "QueueTimeoutError": "scheduler",
+    "SubmitScheduler": "scheduler",
+    "get_scheduler": "scheduler",
+    "SingleFlight": "singleflight",
+    "get_single_flight": "singleflight",
+    "payload_key": "singleflight",
+    "WebhookReceiver": "webhook",
+    "enable_webhook": "webhook",
+}
+
+__all__ = [
+    "AdaptiveSchedule",
+    "AsyncConnectionPool",
+    "AsyncKlingClient",
+    "CircuitBreaker",
+    "CircuitOpenError",
+    "CompletionStats",
+    "ConnectionPool",
+    "DeadlineExceededError",
+    "DownloadError",
+    "Downloader",
+    "EncodingCache",
+    "FileBase64",
+    "FileChangedError",
+    "ImagePreprocessor",
+    "Poller",
+    "PooledResponse",
+    "QueueTimeoutError",
+    "ResultCache",
+    "RetryBudget",
+    "RetryPolicy",
+    "SingleFlight",
+    "StatusEvent",
+    "StreamingJSONBody",
+    "SubmitScheduler",
+    "TaskFailedError",
+    "TaskJournal",
+    "WebhookReceiver",
+    "configure_encoding_cache",
+    "configure_journal",
+    "configure_preprocess",
+    "configure_result_cache",
+    "disable_metrics",
+    "download_results",
+    "enable_metrics",
+    "enable_webhook",
+    "generate_many",
+    "get_downloader",
+    "get_encoding_cache",
+    "get_journal",
+    "get_poller",
+    "get_pool",
+    "get_preprocessor",
+    "get_result_cache",
+    "get_retry_policy",
+    "get_scheduler",
+    "get_single_flight",
+    "payload_key",
+    "pool_stats",
+    "prometheus_text",
+    "serve_metrics",
+]
+
+
+def __getattr__(name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f"{__name__}.{module_name}"), name)
+    # 缓存到模块字典，之后的访问不再经过 __getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,693 @@
+import asyncio
+import json
+import ssl
+import time
+
+from dmxapi import endpoints, metrics
+from dmxapi.body import FileBase64, StreamingJSONBody
+from dmxapi.poller import STATUS_TIMEOUT, StatusEvent, TaskFailedError
+from dmxapi.pool import PooledResponse, split_api_url
+from dmxapi.preprocess import get_preprocessor
+from dmxapi.retry import (CONNECTION, CircuitOpenError, RequestNotSentError, classify_error, classify_response,
+                          get_retry_policy)
+from dmxapi.scheduler import get_scheduler
+
+# 单个事件循环默认使用的连接数，数千个任务的提交与轮询共享这些连接
+DEFAULT_MAXSIZE = 16
+
+
+class AsyncConnectionPool:
+    def __init__(self, api_url, maxsize=DEFAULT_MAXSIZE, timeout=60):
+        """初始化基于 asyncio 的 keep-alive 连接池
+
+        参数:
+            api_url: API 节点地址
+            maxsize: 同时存在的最大连接数
+            timeout: 单个请求的超时时间（秒）
+        """
+        self.scheme, self.host = split_api_url(api_url)
+        hostname, _, port = self.host.partition(":")
+        self.hostname = hostname
+        self.port = int(port) if port else (443 if self.scheme == "https" else 80)
+        self.maxsize = maxsize
+        self.timeout = timeout
+        # 空闲连接栈，元素为 (reader, writer)
+        self._idle = []
+        # 信号量与连接都属于创建它们的事件循环，在第一次请求时于运行中的循环里创建，
+        # 连接池可以在 asyncio.run 之外构造，也可以先后用于多个 asyncio.run
+        self._slots = None
+        self._loop = None
+        self.hits = 0
+        self.misses = 0
+        self.reconnects = 0
+        # 与同步连接池共享节点的重试策略与熔断器
+        self.retry = get_retry_policy(api_url)
+
+    def _bind_loop(self):
+        """返回当前事件循环的信号量，事件循环变化时丢弃属于旧循环的空闲连接"""
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            for _, writer in self._idle:
+                try:
+                    writer.close()
+                except RuntimeError:
+                    # 旧的事件循环已关闭
+                    pass
+            self._idle = []
+            self._slots = asyncio.Semaphore(self.maxsize)
+            self._loop = loop
+        return self._slots
+
+    async def _open(self):
+        ssl_context = ssl.create_default_context() if self.scheme == "https" else None
+        try:
+            return await asyncio.open_connection(self.hostname, self.port, ssl=ssl_context)
+        except OSError as e:
+            raise RequestNotSentError(f"无法连接 {self.host}: {e}") from e
+
+    async def _checkout(self):
+        """取出一条连接
+
+        返回:
+            conn: (reader, writer)
+            reused: bool, 是否为复用的空闲连接
+            connect: float, 新建连接的耗时（秒），复用时为 None
+        """
+        while self._idle:
+            reader, writer = self._idle.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                self.hits += 1
+                return (reader, writer), True, None
+            writer.close()
+        self.misses += 1
+        start = time.perf_counter()
+        conn = await self._open()
+        return conn, False, time.perf_counter() - start
+
+    async def _send(self, conn, method, path, body, headers):
+        reader, writer = conn
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        # 流式请求体预先给出长度，各段在发送时才生成
+        content_length = getattr(body, "content_length", None)
+        if content_length is None:
+            content_length = len(body or b"")
+        start = time.perf_counter()
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {self.host}", "Connection: keep-alive"]
+        lines += [f"{key}: {value}" for key, value in (headers or {}).items()]
+        if body is not None:
+            lines.append(f"Content-Length: {content_length}")
+        try:
+            writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+            if isinstance(body, bytes):
+                writer.write(body)
+            elif body is not None:
+                # 文件读取与 base64 编码在线程中逐段进行，每写出一段就等待缓冲区排空，
+                # 内存中最多只有一段编码结果，不会先把整个请求体收集到列表里
+                segments = iter(body)
+                while True:
+                    segment = await asyncio.to_thread(next, segments, None)
+                    if segment is None:
+                        break
+                    writer.write(segment)
+                    await writer.drain()
+            await writer.drain()
+        except OSError as e:
+            # 请求没有完整写出，服务端收不到完整的请求体，不可能受理
+            raise RequestNotSentError(f"请求未完整发出: {e}") from e
+        sent = time.perf_counter()
+
+        # 解析状态行，空行说明对端已关闭连接
+        status_line = await reader.readline()
+        first_byte = time.perf_counter()
+        if not status_line:
+            raise ConnectionResetError("连接已被服务端关闭")
+        # 原因短语可以为空（例如 "HTTP/1.1 200"）
+        _, _, status_reason = status_line.decode("latin-1").rstrip("\r\n").partition(" ")
+        status, _, reason = status_reason.partition(" ")
+        # 解析响应头
+        response_headers = []
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            key, _, value = line.decode("latin-1").partition(":")
+            response_headers.append((key.strip(), value.strip()))
+        lookup = {key.lower(): value for key, value in response_headers}
+
+        # 读取响应体：chunked、Content-Length 或读到连接关闭
+        keep_alive = lookup.get("connection", "").lower() != "close"
+        if lookup.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    await reader.readline()
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readline()
+            data = b"".join(chunks)
+        elif "content-length" in lookup:
+            data = await reader.readexactly(int(lookup["content-length"]))
+        else:
+            data = await reader.read()
+            keep_alive = False
+        timings = {
+            "connect": None,
+            "tls": None,
+            "send": sent - start,
+            "ttfb": first_byte - sent,
+            "read": time.perf_counter() - first_byte,
+            "request_bytes": content_length,
+            "response_bytes": len(data),
+        }
+        return PooledResponse(int(status), reason, response_headers, data, timings), keep_alive
+
+    async def request(self, method, path, body=None, headers=None, route=None, retry=True):
+        """通过连接池发送一次请求，重试与熔断规则与 ConnectionPool.request 一致
+
+        参数:
+            method: str, 请求方法
+            path: str, 请求路径
+            body: str、bytes 或 StreamingJSONBody（流式请求体，逐段写出不拼接）, 请求体
+            headers: dict, 请求头
+            route: str, 可选，指标和熔断器使用的路径模板，默认为 path
+            retry: bool, 是否按重试策略重试
+        返回:
+            PooledResponse, 已读取完毕的响应，重试用尽时为最后一次的响应
+        """
+        route = route or path
+        breaker = self.retry.breaker(route)
+        self.retry.budget.deposit()
+        attempt = 0
+        while True:
+            breaker.before()
+            try:
+                res = await self._request_once(method, path, body, headers, route)
+            except Exception as e:
+                category, wait = self.retry.plan(method, route, attempt if retry else None, error=e)
+                if wait is None:
+                    raise
+            else:
+                category, wait = self.retry.plan(method, route, attempt if retry else None, res=res)
+                if wait is None:
+                    return res
+            if category == CONNECTION:
+                await self.close()
+            # 退避期间不占用连接名额
+            await asyncio.sleep(wait)
+            attempt += 1
+
+    async def _request_once(self, method, path, body, headers, route):
+        async with self._bind_loop():
+            conn, reused, connect = await self._checkout()
+            keep_alive = False
+            try:
+                try:
+                    res, keep_alive = await asyncio.wait_for(
+                        self._send(conn, method, path, body, headers), self.timeout)
+                except (ConnectionError, asyncio.IncompleteReadError) as e:
+                    # 复用连接被服务端断开时，请求没有写完才换新连接重发；已经发出的请求服务端可能已受理，
+                    # 只有幂等请求立即重发，规则与 ConnectionPool._request_once 一致
+                    unsent = isinstance(e, RequestNotSentError)
+                    if not (reused and unsent) and (unsent or method not in ("GET", "HEAD")):
+                        raise
+                    conn[1].close()
+                    self.reconnects += 1
+                    start = time.perf_counter()
+                    conn = await self._open()
+                    reused, connect = False, time.perf_counter() - start
+                    res, keep_alive = await asyncio.wait_for(
+                        self._send(conn, method, path, body, headers), self.timeout)
+                if metrics.ENABLED:
+                    # asyncio 的建连包含 TLS 握手，不单独拆分
+                    res.timings["connect"] = connect
+                    metrics.record_request(method, route, res.status, res.timings, reused)
+                return res
+            finally:
+                if keep_alive:
+                    self._idle.append(conn)
+                else:
+                    conn[1].close()
+
+    def stats(self):
+        """返回连接池计数"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "reconnects": self.reconnects,
+            "idle": len(self._idle),
+            "maxsize": self.maxsize,
+        }
+
+    async def close(self):
+        """关闭所有空闲连接"""
+        idle, self._idle = self._idle, []
+        for _, writer in idle:
+            writer.close()
+
+
+class AsyncKlingClient:
+    def __init__(self, api_token, api_url, maxsize=DEFAULT_MAXSIZE):
+        """初始化 Kling 异步客户端，一个事件循环内的所有任务共享同一个连接池
+
+        参数:
+            api_token: API 密钥
+            api_url: API 节点地址
+            maxsize: 连接池最大连接数
+        """
+        self.api_url = api_url
+        self.api_token = api_token
+        self.pool = AsyncConnectionPool(api_url, maxsize=maxsize)
+        # 提交限制与同步客户端共享，同一节点的所有客户端一起计数
+        self.scheduler = get_scheduler(api_url)
+        # 设置请求头
+        self.headers = {
+            'Authorization': f'Bearer {self.api_token}',
+            'Content-Type': 'application/json'
+        }
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        await self.pool.close()
+
+    @staticmethod
+    async def _media_data(value, label, endpoint=None, aspect_ratio=None, lossless=False):
+        """URL 直接透传，本地文件返回 FileBase64 占位符，提交时才在线程中经共享编码缓存编码
+
+        提供 endpoint 的本地图片在开启图片预处理时先在线程中处理（见 dmxapi.preprocess），不阻塞事件循环
+        """
+        if endpoints.is_url(value):
+            return value
+        try:
+            if endpoint is not None and get_preprocessor().enabled:
+                value = await asyncio.to_thread(get_preprocessor().prepare, value, endpoint, aspect_ratio, lossless)
+            return FileBase64(value)
+        except Exception as e:
+            raise ValueError(f"无法读取{label}文件: {str(e)}")
+
+    async def submit(self, endpoint, payload):
+        """提交任务
+
+        参数:
+            endpoint: str, 提交接口
+            payload: dict, 请求体，本地文件可以是 FileBase64
+        返回:
+            task_id: 生成任务的 id
+        """
+        # 请求体切分为 JSON 片段和 base64 缓冲区，发送时在线程中逐段读取编码并写出，避免阻塞事件循环；
+        # 缓存命中的文件直接引用缓存中的编码结果，不会复制出完整的请求体
+        res = await self.pool.request("POST", endpoint, StreamingJSONBody(payload), self.headers)
+        json_data = json.loads(res.read().decode("utf-8"))
+        if 'code' in json_data and json_data['code'] == 0:
+            return json_data['data']['task_id']
+        raise Exception(f"API调用失败：{json_data['message']}")
+
+    async def query(self, endpoint, task_id):
+        """查询任务
+
+        参数:
+            endpoint: str, 提交接口
+            task_id: str, 任务 id
+        返回:
+            data: dict, 查询结果中的 data 字段
+        """
+        res = await self.pool.request("GET", endpoints.query_path(endpoint, task_id), None, self.headers,
+                                      route=endpoints.query_path(endpoint, "{task_id}"))
+        return self._query_data(res)
+
+    @staticmethod
+    def _query_data(res):
+        json_data = json.loads(res.read().decode("utf-8"))
+        if json_data['code'] == 0:
+            return json_data['data']
+        raise Exception(f"查询失败: {json_data['message']}")
+
+    async def _poll_once(self, endpoint, task_id):
+        """轮询中的一次查询，可恢复的失败（连接中断、限流、5xx、熔断）返回 None
+
+        与 Poller 一致，查询失败时不在本次查询内退避重试，由轮询间隔充当退避，任务仍在服务端运行，
+        到下次查询时间再试；参数错误、鉴权失败等永久错误直接抛出
+        """
+        try:
+            res = await self.pool.request("GET", endpoints.query_path(endpoint, task_id), None, self.headers,
+                                          route=endpoints.query_path(endpoint, "{task_id}"), retry=False)
+        except Exception as e:
+            if classify_error(e)[0] is None and not isinstance(e, CircuitOpenError):
+                raise
+            return None
+        if classify_response(res)[0] is not None:
+            return None
+        return self._query_data(res)
+
+    async def _watch(self, endpoint, task_id, interval, timeout, events):
+        """轮询单个任务，状态变化时把 StatusEvent 放入 events，到达最终状态或超时后结束；查询暂时失败时继续轮询到截止时间"""
+        start_time = time.monotonic()
+        polls = 0
+        processing_at = None
+        status = None
+        while True:
+            data = await self._poll_once(endpoint, task_id)
+            polls += 1
+            now = time.monotonic()
+            if data is not None:
+                if processing_at is None and data['task_status'] != endpoints.STATUS_SUBMITTED:
+                    processing_at = now
+                if data['task_status'] != status:
+                    events.put_nowait(StatusEvent(task_id, data['task_status'], status,
+                                                  data.get('task_status_msg', ""), data, now - start_time))
+                    status = data['task_status']
+                if status in endpoints.FINAL_STATUSES:
+                    if metrics.ENABLED:
+                        metrics.record_task(endpoint, status, polls, now - start_time, processing_at - start_time,
+                                            now - processing_at)
+                    return
+            if now - start_time > timeout:
+                if metrics.ENABLED:
+                    metrics.record_task(endpoint, "timeout", polls, now - start_time)
+                events.put_nowait(StatusEvent(task_id, STATUS_TIMEOUT, status, "", None, now - start_time))
+                return
+            await asyncio.sleep(interval)
+
+    async def iter_status(self, endpoint, task_ids, interval=1, timeout=600):
+        """轮询一个或多个任务，按发生顺序产出状态变化，与 Poller.iter_status 对应的异步版本
+
+        每个任务一个协程，共用客户端的连接池。任务以 succeed、failed（立即结束，不再等到超时）或 timeout 结束；
+        调用方提前停止迭代时其余任务的轮询随即取消。
+
+        参数:
+            endpoint: str, 提交接口
+            task_ids: str 或 list, 任务 id
+            interval: float, 轮询间隔（秒）
+            timeout: int, 每个任务的超时时间（秒）
+        返回:
+            异步生成器，产出 StatusEvent
+        """
+        if isinstance(task_ids, str):
+            task_ids = [task_ids]
+        events = asyncio.Queue()
+        watchers = []
+        for task_id in dict.fromkeys(task_ids):
+            watcher = asyncio.ensure_future(self._watch(endpoint, task_id, interval, timeout, events))
+            # 协程结束时放入自身，排在它产出的最后一个状态之后
+            watcher.add_done_callback(events.put_nowait)
+            watchers.append(watcher)
+        remaining = len(watchers)
+        try:
+            while remaining:
+                event = await events.get()
+                if isinstance(event, StatusEvent):
+                    yield event
+                    continue
+                remaining -= 1
+                if not event.cancelled() and event.exception() is not None:
+                    raise event.exception()
+        finally:
+            for watcher in watchers:
+                watcher.cancel()
+
+    async def wait(self, endpoint, task_id, interval, timeout):
+        """轮询等待任务结束，等待期间只占用协程，不占用线程
+
+        参数:
+            endpoint: str, 提交接口
+            task_id: str, 任务 id
+            interval: float, 轮询间隔（秒）
+            timeout: int, 超时时间（秒）
+        返回:
+            data: dict, 任务成功时的 data 字段，超时返回 None；任务失败时立即抛出 TaskFailedError
+        """
+        events = self.iter_status(endpoint, task_id, interval, timeout)
+        try:
+            async for event in events:
+                if event.status == endpoints.STATUS_SUCCEED:
+                    return event.data
+                if event.status == endpoints.STATUS_FAILED:
+                    raise TaskFailedError(task_id, event.message)
+        finally:
+            await events.aclose()
+        return None
+
+    async def run(self, endpoint, payload, interval, timeout, model_name="", mode="", priority="normal"):
+        """取得提交许可后提交任务并等待结束，超出提交限制时在本地按优先级和截止时间排队
+
+        参数:
+            endpoint: str, 提交接口
+            payload: dict, 请求体
+            interval: float, 轮询间隔（秒）
+            timeout: int, 超时时间（秒），排队超过该时间的任务放弃提交
+            model_name: str, 模型名称，用于匹配提交限制
+            mode: str, 生成模式，用于匹配提交限制
+            priority: str, 提交优先级：interactive、normal 或 batch
+        返回:
+            data: dict, 任务成功时的 data 字段，超时返回 None；任务失败时抛出 TaskFailedError
+        """
+        with await self.scheduler.acquire_async(endpoint, model_name, mode, priority=priority,
+                                                deadline=time.time() + timeout):
+            task_id = await self.submit(endpoint, payload)
+            return await self.wait(endpoint, task_id, interval, timeout)
+
+    async def generate_image(self, model_name, prompt, negative_prompt="", output_format="png", n=1,
+                             aspect_ratio="16:9", callback_url="", timeout=60, priority="normal"):
+        """文生图，参数与 KlingTextToImage.generate_image 一致
+
+        返回:
+            image_url: 图像 url 列表，超时返回 None
+        """
+        payload = {
+            "model_name": model_name,
+            "prompt": prompt,
+            "negative_prompt": negative_prompt,
+            "output_format": output_format,
+            "n": n,
+            "aspect_ratio": aspect_ratio,
+            "callback_url": callback_url,
+        }
+        data = await self.run(endpoints.TEXT_TO_IMAGE, payload, 1, timeout, model_name, priority=priority)
+        return endpoints.image_urls(data) if data else None
+
+    async def generate_image2image(self, model_name, prompt, image, image_reference="subject",
+                                   image_fidelity=0.5, human_fidelity=0.5, output_format="png", n=1,
+                                   aspect_ratio="16:9", callback_url="", timeout=120, priority="normal"):
+        """图生图，参数与 KlingImageToImage.generate_image 一致
+
+        返回:
+            image_url: 图像 url 列表，超时返回 None
+        """
+        payload = {
+            "model_name": model_name,
+            "prompt": prompt,
+            "image": await self._media_data(image, "图像", endpoints.IMAGE_TO_IMAGE, aspect_ratio),
+            "image_reference": image_reference,
+            "image_fidelity": image_fidelity,
+            "human_fidelity": human_fidelity,
+            "output_format": output_format,
+            "n": n,
+            "aspect_ratio": aspect_ratio,
+            "callback_url": callback_url
+        }
+        data = await self.run(endpoints.IMAGE_TO_IMAGE, payload, 1, timeout, model_name, priority=priority)
+        return endpoints.image_urls(data) if data else None
+
+    async def generate_text2video(self, model_name, prompt, negative_prompt="", cfg_scale=0.5,
+                                  mode="std", aspect_ratio="16:9", duration="5",
+                                  camera_control=None, callback_url="", external_task_id="", timeout=600,
+                                  priority="normal"):
+        """文生视频，参数与 KlingTextToVideo.generate_video 一致
+
+        返回:
+            video_url, video_id: 超时返回 (None, None)
+        """
+        payload = {
+            "model_name": model_name,
+            "prompt": prompt,
+            "negative_prompt": negative_prompt,
+            "cfg_scale": cfg_scale,
+            "mode": mode,
+            "aspect_ratio": aspect_ratio,
+            "duration": duration,
+            "callback_url": callback_url,
+            "external_task_id": external_task_id
+        }
+        if camera_control:
+            payload["camera_control"] = camera_control
+        data = await self.run(endpoints.TEXT_TO_VIDEO, payload, 3, timeout, model_name, mode, priority=priority)
+        return endpoints.video_result(data) if data else (None, None)
+
+    async def generate_image2video(self, model_name, image, prompt, image_tail=None, negative_prompt="",
+                                   cfg_scale=0.5, mode="std", duration="5",
+                                   camera_control=None, static_mask=None, dynamic_masks=None,
+                                   callback_url="", external_task_id="", timeout=600, priority="normal"):
+        """图生视频，参数与 KlingImageToVideo.generate_video 一致
+
+        返回:
+            video_url, video_id: 超时返回 (None, None)
+        """
+        payload = {
+            "model_name": model_name,
+            "image": await self._media_data(image, "起始图像", endpoints.IMAGE_TO_VIDEO),
+            "prompt": prompt,
+            "negative_prompt": negative_prompt,
+            "cfg_scale": cfg_scale,
+            "mode": mode,
+            "duration": duration,
+            "callback_url": callback_url
+        }
+        if image_tail:
+            payload["image_tail"] = await self._media_data(image_tail, "结束图像", endpoints.IMAGE_TO_VIDEO)
+        if camera_control:
+            payload["camera_control"] = camera_control
+        if static_mask:
+            payload["static_mask"] = await self._media_data(static_mask, "静态遮罩", endpoints.IMAGE_TO_VIDEO,
+                                                           lossless=True)
+        if dynamic_masks:
+            processed_masks = []
+            for mask_item in dynamic_masks:
+                processed_item = mask_item.copy()
+                if mask_item.get('mask'):
+                    processed_item['mask'] = await self._media_data(mask_item['mask'], "动态遮罩",
+                                                                     endpoints.IMAGE_TO_VIDEO, lossless=True)
+                processed_masks.append(processed_item)
+            payload["dynamic_masks"] = processed_masks
+        if external_task_id:
+            payload["external_task_id"] = external_task_id
+        data = await self.run(endpoints.IMAGE_TO_VIDEO, payload, 3, timeout, model_name, mode, priority=priority)
+        return endpoints.video_result(data) if data else (None, None)
+
+    async def extend_video(self, task_id, video_id, prompt, negative_prompt="", cfg_scale=0.5,
+                           callback_url="", timeout=300, priority="normal"):
+        """视频延长，参数与 KlingVideoExtend.extend_video 一致
+
+        返回:
+            video_url, video_id: 超时返回 (None, None)
+        """
+        payload = {
+            "task_id": task_id,
+            "video_id": video_id,
+            "prompt": prompt,
+            "negative_prompt": negative_prompt,
+            "cfg_scale": cfg_scale,
+            "callback_url": callback_url
+        }
+        data = await self.run(endpoints.VIDEO_EXTEND, payload, 1, timeout, priority=priority)
+        return endpoints.video_result(data) if data else (None, None)
+
+    @staticmethod
+    def _lip_sync_video_source(input_data, video_source, video_id, task_id):
+        """设置口型同步的视频来源，规则与 KlingLipSync 一致"""
+        if video_source:
+            if endpoints.is_url(video_source):
+                input_data["video_url"] = video_source
+            else:
+                if not video_id:
+                    raise ValueError("当提供任务ID时，必须同时提供视频ID")
+                input_data["task_id"] = video_source
+                input_data["video_id"] = video_id
+        elif task_id and video_id:
+            input_data["task_id"] = task_id
+            input_data["video_id"] = video_id
+        else:
+            raise ValueError("必须提供视频来源(URL或任务ID)和视频ID")
+
+    async def _lip_sync(self, input_data, callback_url, timeout, priority):
+        if callback_url:
+            input_data["callback_url"] = callback_url
+        data = await self.run(endpoints.LIP_SYNC, {"input": input_data}, 2, timeout, "", input_data["mode"],
+                              priority=priority)
+        return endpoints.video_result(data) if data else (None, None)
+
+    async def generate_text2video_lip_sync(self, video_source=None, video_id=None, task_id=None,
+                                           text="", voice_id="", voice_language="zh", voice_speed=1.0,
+                                           callback_url="", timeout=300, priority="normal"):
+        """文本转口型同步视频，参数与 KlingLipSync.generate_text2video_lip_sync 一致
+
+        返回:
+            video_url, video_id: 超时返回 (None, None)
+        """
+        input_data = {
+            "mode": "text2video",
+            "text": text,
+            "voice_id": voice_id,
+            "voice_language": voice_language,
+            "voice_speed": voice_speed
+        }
+        self._lip_sync_video_source(input_data, video_source, video_id, task_id)
+        return await self._lip_sync(input_data, callback_url, timeout, priority)
+
+    async def generate_audio2video_lip_sync(self, video_source=None, video_id=None, task_id=None,
+                                            audio_source=None, callback_url="", timeout=300, priority="normal"):
+        """音频转口型同步视频，参数与 KlingLipSync.generate_audio2video_lip_sync 一致
+
+        返回:
+            video_url, video_id: 超时返回 (None, None)
+        """
+        input_data = {
+            "mode": "audio2video"
+        }
+        self._lip_sync_video_source(input_data, video_source, video_id, task_id)
+        if not audio_source:
+            raise ValueError("必须提供音频来源(URL或本地文件路径)")
+        if endpoints.is_url(audio_source):
+            input_data["audio_type"] = "url"
+            input_data["audio_url"] = audio_source
+        else:
+            input_data["audio_type"] = "file"
+            input_data["audio_file"] = await self._media_data(audio_source, "音频")
+        return await self._lip_sync(input_data, callback_url, timeout, priority)
+
+    async def generate_effects(self, effect_scene, model_name="kling-v1-6", image=None, images=None,
+                               mode="std", duration="5", callback_url="", external_task_id="", timeout=600,
+                               priority="normal"):
+        """视频特效，单图特效传 image，双人互动特效传 images
+
+        参数:
+            effect_scene: str, 场景名称，例如 expansion、hug
+            model_name: str, 模型名称
+            image: str, 单图特效的图片URL或本地文件路径
+            images: list, 双人互动特效的图片URL或本地文件路径列表
+            mode: str, 生成模式：std 或 pro
+            duration: str, 视频时长(秒)：5 或 10
+            callback_url: str, 回调地址
+            external_task_id: str, 自定义任务ID
+            timeout: int, 超时时间（秒）
+            priority: str, 提交优先级：interactive、normal 或 batch
+        返回:
+            video_url, video_id: 超时返回 (None, None)
+        """
+        input_data = {
+            "model_name": model_name,
+            "mode": mode,
+            "duration": duration
+        }
+        if image:
+            input_data["image"] = await self._media_data(image, "图像", endpoints.VIDEO_EFFECTS)
+        if images:
+            input_data["images"] = [await self._media_data(item, "图像", endpoints.VIDEO_EFFECTS) for item in images]
+        payload = {"effect_scene": effect_scene, "input": input_data}
+        if callback_url:
+            payload["callback_url"] = callback_url
+        if external_task_id:
+            payload["external_task_id"] = external_task_id
+        data = await self.run(endpoints.VIDEO_EFFECTS, payload, 3, timeout, model_name, mode, priority=priority)
+        return endpoints.video_result(data) if data else (None, None)
+
+    async def generate_try_on(self, model_name, human_image, cloth_image, callback_url="", timeout=120,
+                              priority="normal"):
+        """虚拟试穿，参数与 KlingVirtualTryOn.generate_try_on 一致
+
+        返回:
+            result_image: 结果图像 url，超时返回 None
+        """
+        payload = {
+            "model_name": model_name,
+            "human_image": await self._media_data(human_image, "人物图像", endpoints.VIRTUAL_TRY_ON),
+            "cloth_image": await self._media_data(cloth_image, "服饰图像", endpoints.VIRTUAL_TRY_ON),
+            "callback_url": callback_url
+        }
+        data = await self.run(endpoints.VIRTUAL_TRY_ON, payload, 1, timeout, model_name, priority=priority)
+        return endpoints.image_urls(data)[0] if data else None
@@ -0,0 +1,306 @@
+"""JSONL 批量任务执行器
+
+任务文件每行一个 JSON 对象:
+    {"id": "job-1", "kind": "text2image", "params": {"model_name": "kling-v1-5", "prompt": "..."}}
+
+kind 可选值见 dmxapi.jobs.JOB_KINDS，params 即对应 API 的请求体，媒体字段可以直接填写本地文件路径。
+可选的 priority（interactive / normal / batch，默认 batch）和 deadline（需要完成的 Unix 时间戳）决定
+超出提交限制时的排队顺序，按历史耗时已无法在 deadline 前完成的任务不再提交，结果状态为 expired。
+
+用法:
+    python -m dmxapi.batch jobs.jsonl results.jsonl --concurrency 32
+    # 结果由回调推送，服务端需能访问 --public-url
+    python -m dmxapi.batch jobs.jsonl results.jsonl --webhook-port 8099 --public-url https://your-server.com
+    # 按接口、模型限制提交速率和进行中的任务数，超出的任务在本地排队
+    python -m dmxapi.batch jobs.jsonl results.jsonl --limits limits.json
+    # 上传前在进程池中缩小、重新编码本地图片（需要 Pillow），汇总中输出节省的字节数
+    python -m dmxapi.batch jobs.jsonl results.jsonl --preprocess --crop
+
+限制文件为 JSON 列表，每项为 SubmitScheduler.set_limit 的参数:
+    [{"model_name": "kling-v1-6", "mode": "pro", "rate": 1, "max_in_flight": 3},
+     {"endpoint": "/mj/submit/imagine", "mode": "RELAX", "max_in_flight": 5}]
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dmxapi import jobs
+from dmxapi.download import get_downloader
+from dmxapi.poller import TaskFailedError, get_poller
+from dmxapi.pool import get_pool
+from dmxapi.preprocess import DEFAULT_QUALITY, configure_preprocess, get_preprocessor
+from dmxapi.scheduler import DeadlineExceededError, get_scheduler
+from dmxapi.webhook import enable_webhook
+
+DEFAULT_API_URL = "www.dmxapi.cn"
+
+
+def percentile(samples, q):
+    """返回样本的 q 分位数（0~100），样本为空时返回 None"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def read_jsonl(path):
+    """逐行读取 JSONL 文件，文件不存在时返回空列表，忽略写了一半的末行"""
+    records = []
+    if not os.path.exists(path):
+        return records
+    with open(path, "r", encoding="utf-8") as jsonl_file:
+        for line in jsonl_file:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return records
+
+
+class BatchRunner:
+    def __init__(self, api_token, api_url, results_path, checkpoint_path=None,
+                 max_in_flight=16, submit_workers=4, timeout=600, download_dir=None):
+        """初始化批量任务执行器
+
+        每个任务提交成功后立即把 task_id 写入检查点文件；重新运行时，已写入结果的任务被跳过，
+        只在检查点中出现的任务直接恢复轮询，不会重复提交。
+
+        参数:
+            api_token: API 密钥
+            api_url: API 节点地址
+            results_path: str, 结果 JSONL 文件路径（追加写入）
+            checkpoint_path: str, 检查点文件路径，默认为 "结果文件.checkpoint"
+            max_in_flight: int, 最多同时未完成的任务数
+            submit_workers: int, 提交线程数
+            timeout: int, 单个任务从提交开始的超时时间（秒）
+            download_dir: str, 可选，设置后任务成功时立即把结果下载到 "download_dir/任务id/"，
+                下载完成后才写入结果，结果中的 files 为本地文件路径
+        """
+        self.api_url = api_url
+        self.headers = {
+            'Authorization': f'Bearer {api_token}',
+            'Content-Type': 'application/json'
+        }
+        self.pool = get_pool(api_url)
+        self.poller = get_poller(api_url)
+        self.scheduler = get_scheduler(api_url)
+        self.results_path = results_path
+        self.checkpoint_path = checkpoint_path or f"{results_path}.checkpoint"
+        self.max_in_flight = max_in_flight
+        self.submit_workers = submit_workers
+        self.timeout = timeout
+        self.download_dir = download_dir
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._write_lock = threading.Lock()
+        self._outstanding = 0
+        self._idle = threading.Condition(self._write_lock)
+        self.latencies = []
+        self.counts = {"succeed": 0, "failed": 0, "timeout": 0, "error": 0, "expired": 0, "skipped": 0,
+                       "resumed": 0}
+
+    def _append(self, path, record):
+        with open(path, "a", encoding="utf-8") as jsonl_file:
+            jsonl_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def _finish(self, job, task_id, submitted_at, status, result=None, error=None, files=None):
+        """写入一条结果并释放并发名额"""
+        latency = time.time() - submitted_at
+        record = {
+            "id": job["id"],
+            "kind": job["kind"],
+            "task_id": task_id,
+            "status": status,
+            "result": result,
+            "error": error,
+            "latency": round(latency, 3),
+        }
+        if files is not None:
+            record["files"] = files
+        with self._write_lock:
+            self._append(self.results_path, record)
+            self.counts[status] += 1
+            if status == "succeed":
+                self.latencies.append(latency)
+            self._outstanding -= 1
+            self._idle.notify_all()
+        self._slots.release()
+
+    def _watch(self, job, task_id, submitted_at, permit, push=None):
+        """注册轮询，任务结束时归还提交许可并写入结果"""
+        remaining = max(1, self.timeout - (time.time() - submitted_at))
+
+        def on_done(future):
+            permit.release()
+            try:
+                data = future.result()
+            except TaskFailedError as e:
+                self._finish(job, task_id, submitted_at, "failed", error=e.message)
+                return
+            except Exception as e:
+                self._finish(job, task_id, submitted_at, "error", error=str(e))
+                return
+            if data is None:
+                self._finish(job, task_id, submitted_at, "timeout")
+            elif self.download_dir:
+                self._download(job, task_id, submitted_at, jobs.job_result(job["kind"], data))
+            else:
+                self._finish(job, task_id, submitted_at, "succeed", result=jobs.job_result(job["kind"], data))
+
+        jobs.register_job(self.poller, self.headers, job["kind"], task_id, remaining, callback=on_done,
+                          stats_key=jobs.stats_key(job["kind"], job["params"]), push=push)
+
+    def _download(self, job, task_id, submitted_at, result):
+        """把结果交给共享下载器，全部文件下载完成后写入结果"""
+        urls = jobs.result_urls(job["kind"], result)
+        if not urls:
+            self._finish(job, task_id, submitted_at, "succeed", result=result, files=[])
+            return
+        dest_dir = os.path.join(self.download_dir, str(job["id"]))
+        futures = [get_downloader().submit(url, dest_dir) for url in urls]
+        remaining = [len(futures)]
+        lock = threading.Lock()
+
+        def on_file(_):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            errors = [str(future.exception()) for future in futures if future.exception()]
+            if errors:
+                self._finish(job, task_id, submitted_at, "error", result=result, error="; ".join(errors))
+            else:
+                self._finish(job, task_id, submitted_at, "succeed", result=result,
+                             files=[future.result() for future in futures])
+
+        for future in futures:
+            future.add_done_callback(on_file)
+
+    def _submit(self, job):
+        """提交线程：取得提交许可、提交任务、写检查点、注册轮询"""
+        # 超出接口或模型限制时在这里排队，不会提交后被服务端拒绝
+        try:
+            permit = self.scheduler.acquire(*jobs.limit_key(job["kind"], job["params"]),
+                                            priority=job.get("priority", "batch"), deadline=job.get("deadline"),
+                                            expected=self.poller.estimate(jobs.stats_key(job["kind"], job["params"])))
+        except DeadlineExceededError as e:
+            self._finish(job, None, time.time(), "expired", error=str(e))
+            return
+        submitted_at = time.time()
+        try:
+            task_id = jobs.submit_job(self.pool, self.headers, job["kind"], job["params"],
+                                      callback_url=self.poller.callback_url())
+        except Exception as e:
+            permit.release()
+            self._finish(job, None, submitted_at, "error", error=str(e))
+            return
+        with self._write_lock:
+            self._append(self.checkpoint_path, {
+                "id": job["id"], "kind": job["kind"], "task_id": task_id, "submitted_at": submitted_at,
+            })
+        self._watch(job, task_id, submitted_at, permit)
+
+    def run(self, jobs_path):
+        """执行任务文件中的全部任务，Ctrl-C 中断后可重新运行以继续
+
+        参数:
+            jobs_path: str, 任务 JSONL 文件路径
+        返回:
+            dict, 执行统计
+        """
+        done = {record["id"] for record in read_jsonl(self.results_path)}
+        checkpoint = {record["id"]: record for record in read_jsonl(self.checkpoint_path)}
+        start_time = time.time()
+        executor = ThreadPoolExecutor(max_workers=self.submit_workers, thread_name_prefix="dmxapi-submit")
+        try:
+            for line_no, job in enumerate(read_jsonl(jobs_path), 1):
+                job.setdefault("id", f"line-{line_no}")
+                job.setdefault("params", {})
+                jobs.get_kind(job["kind"])
+                if job["id"] in done:
+                    self.counts["skipped"] += 1
+                    continue
+                # 控制同时未完成的任务数，超出时在本地等待
+                self._slots.acquire()
+                with self._write_lock:
+                    self._outstanding += 1
+                entry = checkpoint.get(job["id"])
+                if entry:
+                    # 已提交但没有结果的任务，恢复轮询
+                    self.counts["resumed"] += 1
+                    # 任务仍在服务端进行中，同样占用进行中任务数，以最高优先级计入
+                    permit = self.scheduler.acquire(*jobs.limit_key(job["kind"], job["params"]), priority="interactive")
+                    # 之前运行时的回调地址已失效，按普通任务轮询
+                    self._watch(job, entry["task_id"], entry["submitted_at"], permit, push=False)
+                else:
+                    executor.submit(self._submit, job)
+            with self._idle:
+                while self._outstanding:
+                    self._idle.wait(1)
+        except KeyboardInterrupt:
+            print("已中断，已提交的任务记录在检查点中，重新运行即可继续轮询", flush=True)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        return self.summary(time.time() - start_time)
+
+    def summary(self, elapsed):
+        """汇总吞吐与尾延迟，开启图片预处理时附带节省的上传字节数"""
+        finished = sum(self.counts[key] for key in ("succeed", "failed", "timeout", "error", "expired"))
+        preprocessor = get_preprocessor()
+        return {
+            **self.counts,
+            "elapsed": round(elapsed, 3),
+            "jobs_per_min": round(finished / elapsed * 60, 2) if elapsed else 0,
+            "p50": percentile(self.latencies, 50),
+            "p95": percentile(self.latencies, 95),
+            "p99": percentile(self.latencies, 99),
+            **({"preprocess": preprocessor.stats()} if preprocessor.enabled else {}),
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批量提交 DMXAPI 任务并写出结果")
+    parser.add_argument("jobs", help="任务 JSONL 文件")
+    parser.add_argument("results", help="结果 JSONL 文件（追加写入）")
+    parser.add_argument("--api-url", default=os.environ.get("DMXAPI_URL", DEFAULT_API_URL), help="API 节点地址")
+    parser.add_argument("--token", default=os.environ.get("DMXAPI_TOKEN"), help="API 密钥，默认读取 DMXAPI_TOKEN")
+    parser.add_argument("--concurrency", type=int, default=16, help="最多同时未完成的任务数")
+    parser.add_argument("--submit-workers", type=int, default=4, help="提交线程数")
+    parser.add_argument("--timeout", type=int, default=600, help="单个任务超时时间（秒）")
+    parser.add_argument("--checkpoint", help="检查点文件，默认为 结果文件.checkpoint")
+    parser.add_argument("--download-dir", help="结果下载目录，设置后任务成功时立即下载结果文件")
+    parser.add_argument("--webhook-host", default="0.0.0.0", help="回调接收器监听地址")
+    parser.add_argument("--webhook-port", type=int, help="回调接收器端口，设置后任务结果由回调推送")
+    parser.add_argument("--public-url", help="服务端可访问的回调接收器外部地址")
+    parser.add_argument("--limits", help="提交限制 JSON 文件，格式见模块说明")
+    parser.add_argument("--preprocess", action="store_true", help="上传前缩小、重新编码本地图片（需要 Pillow）")
+    parser.add_argument("--quality", type=int, default=DEFAULT_QUALITY, help="预处理的 JPEG 编码质量")
+    parser.add_argument("--crop", action="store_true", help="预处理时按任务的 aspect_ratio 居中裁剪")
+    args = parser.parse_args(argv)
+    if not args.token:
+        parser.error("请通过 --token 或环境变量 DMXAPI_TOKEN 提供 API 密钥")
+    if args.webhook_port is not None:
+        if not args.public_url:
+            parser.error("启用回调时需要通过 --public-url 提供服务端可访问的地址")
+        enable_webhook(args.api_url, host=args.webhook_host, port=args.webhook_port, public_url=args.public_url)
+    if args.limits:
+        with open(args.limits, "r", encoding="utf-8") as limits_file:
+            get_scheduler(args.api_url).load_limits(json.load(limits_file))
+    if args.preprocess:
+        configure_preprocess(quality=args.quality, crop=args.crop)
+
+    runner = BatchRunner(args.token, args.api_url, args.results, checkpoint_path=args.checkpoint,
+                         max_in_flight=args.concurrency, submit_workers=args.submit_workers, timeout=args.timeout,
+                         download_dir=args.download_dir)
+    summary = runner.run(args.jobs)
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
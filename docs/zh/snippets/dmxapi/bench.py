@@ -0,0 +1,364 @@
+"""示例客户端吞吐与延迟基准测试
+
+在本地模拟服务（dmxapi.mock_server）上按不同的未完成任务数驱动示例客户端，统计:
+    - 提交速率（submissions/s）
+    - 每个完成任务的状态查询次数
+    - 端到端延迟 p50/p95/p99
+    - 客户端 CPU 时间与峰值 RSS
+
+每个 (场景, 并发) 组合在独立子进程中运行，CPU 与 RSS 互不影响；模拟服务也运行在单独的进程中。
+
+--payload 对比大请求体（图生视频的 image、image_tail、static_mask、dynamic_masks[].mask 四个本地文件）
+在几种构建与发送方式下单次提交的 CPU 时间、Python 分配峰值和进程峰值 RSS:
+    - dumps: 示例函数的写法，base64 字符串放入 dict 后 json.dumps，再由 http.client 编码为 bytes
+    - streaming: StreamingJSONBody 作为可迭代请求体交给 http.client 逐块发送
+    - segmented: StreamingJSONBody 经连接池以 sendmsg 分段写出
+    - segmented_cached: 同上，文件编码结果命中共享编码缓存
+
+用法:
+    python -m dmxapi.bench --concurrency 1,10,100,1000 --output bench.json
+    # 与上一版本的结果对比
+    python -m dmxapi.bench --output bench-new.json --baseline bench.json
+    # 大请求体对比，每个文件 3 MB
+    python -m dmxapi.bench --payload --payload-mb 3
+"""
+import argparse
+import base64
+import http.client
+import importlib.util
+import io
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import redirect_stdout
+
+from dmxapi import endpoints
+from dmxapi.batch import percentile
+from dmxapi.body import FileBase64, StreamingJSONBody
+from dmxapi.encode_cache import configure_encoding_cache
+from dmxapi.pool import ConnectionPool, split_api_url
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块，不统计峰值 RSS
+    resource = None
+
+# 示例代码目录，即 dmxapi 包的上一级
+SNIPPETS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ("text2image", "image2video", "lip_sync", "midjourney")
+DEFAULT_CONCURRENCY = (1, 10, 100, 1000)
+BENCH_TOKEN = "sk-bench"
+PAYLOAD_MODES = ("dumps", "streaming", "segmented", "segmented_cached")
+# 对比时关注的指标，以及数值越大越好还是越小越好
+COMPARED_METRICS = {
+    "submissions_per_s": "higher",
+    "status_requests_per_task": "lower",
+    "p50": "lower",
+    "p95": "lower",
+    "p99": "lower",
+    "cpu_seconds": "lower",
+    "peak_rss_mb": "lower",
+}
+
+
+def load_snippet(relative_path):
+    """按文件路径加载示例代码（文件名中带有 "-"，不能直接 import）"""
+    path = os.path.join(SNIPPETS_DIR, relative_path)
+    name = "bench_" + os.path.splitext(os.path.basename(path))[0].replace("-", "_")
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 单位为字节
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 2)
+
+
+def _mock_admin(api_url, path, method="GET"):
+    request = urllib.request.Request(f"{api_url}{path}", method=method, data=b"" if method == "POST" else None)
+    with urllib.request.urlopen(request, timeout=10) as res:
+        return json.loads(res.read().decode("utf-8"))
+
+
+def _make_runner(scenario, api_url, media_dir, timeout):
+    """返回执行单个端到端任务的函数"""
+    image_path = os.path.join(media_dir, "bench.png")
+    audio_path = os.path.join(media_dir, "bench.mp3")
+    if scenario == "text2image":
+        client = load_snippet("kling-text-to-image.py").KlingTextToImage(BENCH_TOKEN, api_url)
+        return lambda i: client.generate_image("kling-v1", f"bench {i}", timeout=timeout)
+    if scenario == "image2video":
+        client = load_snippet("kling-image-to-video.py").KlingImageToVideo(BENCH_TOKEN, api_url)
+        return lambda i: client.generate_video("kling-v1", image_path, f"bench {i}", timeout=timeout)
+    if scenario == "lip_sync":
+        client = load_snippet("kling-lip-sync.py").KlingLipSync(BENCH_TOKEN, api_url)
+        return lambda i: client.generate_audio2video_lip_sync(task_id="bench", video_id="bench",
+                                                              audio_source=audio_path, timeout=timeout)
+    if scenario == "midjourney":
+        from dmxapi import jobs
+        from dmxapi.poller import get_poller
+        module = load_snippet("midjourney/api/image-to-image-api.py")
+        # 示例函数固定使用 HTTPS 连接 API_URL，这里改为连接本地模拟服务
+        module.API_URL = api_url.split("://", 1)[1]
+        module.DMX_API_TOKEN = BENCH_TOKEN
+        module.http = types.SimpleNamespace(client=types.SimpleNamespace(HTTPSConnection=http.client.HTTPConnection))
+        headers = {'Authorization': f'Bearer {BENCH_TOKEN}', 'Content-Type': 'application/json'}
+        poller = get_poller(api_url)
+
+        def run(i):
+            task_id = module.midjourney_generate_image(image_path)
+            return jobs.register_job(poller, headers, "mj_imagine", task_id, timeout).result()
+        return run
+    raise ValueError(f"未知的场景: {scenario}，可选值: {', '.join(SCENARIOS)}")
+
+
+def run_level(scenario, concurrency, tasks, api_url, timeout):
+    """在当前进程中以固定并发执行一组任务，返回统计结果"""
+    media_dir = tempfile.mkdtemp(prefix="dmxapi-bench-")
+    # 使用空的耗时统计，避免本机历史数据影响轮询间隔
+    os.environ["DMXAPI_POLL_STATS"] = os.path.join(media_dir, "poll-stats.json")
+    with open(os.path.join(media_dir, "bench.png"), "wb") as media_file:
+        media_file.write(os.urandom(64 * 1024))
+    with open(os.path.join(media_dir, "bench.mp3"), "wb") as media_file:
+        media_file.write(os.urandom(256 * 1024))
+    runner = _make_runner(scenario, api_url, media_dir, timeout)
+
+    def timed(i):
+        start = time.perf_counter()
+        try:
+            ok = runner(i) is not None
+        except Exception:
+            ok = False
+        return ok, time.perf_counter() - start
+
+    _mock_admin(api_url, "/mock/reset", "POST")
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    # 示例代码会打印提交结果，压测期间屏蔽输出
+    with redirect_stdout(io.StringIO()), ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(timed, range(tasks)))
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    server = _mock_admin(api_url, "/mock/stats")
+
+    latencies = [latency for ok, latency in outcomes if ok]
+    completed = len(latencies)
+    submit_span = (server["last_submit"] or 0) - (server["first_submit"] or 0)
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "tasks": tasks,
+        "completed": completed,
+        "errors": tasks - completed,
+        "wall_seconds": round(wall, 3),
+        "submissions_per_s": round(server["submits"] / submit_span, 2) if submit_span > 0 else None,
+        "status_requests_per_task": round(server["queries"] / completed, 2) if completed else None,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "cpu_seconds": round(cpu, 3),
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def _payload_files(media_dir, size):
+    paths = []
+    for name in ("image", "image_tail", "static_mask", "dynamic_mask"):
+        path = os.path.join(media_dir, f"{name}.png")
+        with open(path, "wb") as media_file:
+            media_file.write(os.urandom(size))
+        paths.append(path)
+    return paths
+
+
+def _image2video_payload(paths, media):
+    """按 KlingImageToVideo 的请求体结构填入四个媒体字段"""
+    image, image_tail, static_mask, dynamic_mask = (media(path) for path in paths)
+    return {
+        "model_name": "kling-v1",
+        "image": image,
+        "image_tail": image_tail,
+        "static_mask": static_mask,
+        "dynamic_masks": [{"mask": dynamic_mask, "trajectories": [{"x": 1, "y": 1}, {"x": 2, "y": 2}]}],
+        "prompt": "bench",
+        "mode": "pro",
+        "duration": "5",
+    }
+
+
+def _encode_file(path):
+    with open(path, "rb") as media_file:
+        return base64.b64encode(media_file.read()).decode("utf-8")
+
+
+def run_payload(mode, api_url, size, rounds):
+    """在当前进程中按指定方式提交 rounds 次大请求体，返回单次提交的平均开销"""
+    media_dir = tempfile.mkdtemp(prefix="dmxapi-payload-")
+    paths = _payload_files(media_dir, size)
+    headers = {'Authorization': f'Bearer {BENCH_TOKEN}', 'Content-Type': 'application/json'}
+    # 只有 segmented_cached 使用编码缓存，其余方式每次都重新读取并编码文件
+    configure_encoding_cache(max_bytes=256 * 1024 * 1024 if mode == "segmented_cached" else 0,
+                             max_entry_bytes=size)
+    pool = ConnectionPool(api_url)
+    scheme, host = split_api_url(api_url)
+    conn = http.client.HTTPConnection(host) if scheme == "http" else http.client.HTTPSConnection(host)
+
+    def submit():
+        if mode == "dumps":
+            conn.request("POST", endpoints.IMAGE_TO_VIDEO, json.dumps(_image2video_payload(paths, _encode_file)),
+                         headers)
+            res = conn.getresponse()
+            data = res.read()
+        elif mode == "streaming":
+            body = StreamingJSONBody(_image2video_payload(paths, FileBase64))
+            conn.request("POST", endpoints.IMAGE_TO_VIDEO, iter(body),
+                         dict(headers, **{"Content-Length": str(body.content_length)}))
+            res = conn.getresponse()
+            data = res.read()
+        else:
+            res = pool.request("POST", endpoints.IMAGE_TO_VIDEO,
+                               StreamingJSONBody(_image2video_payload(paths, FileBase64)), headers)
+            data = res.read()
+        if res.status != 200 or json.loads(data)["code"] != 0:
+            raise RuntimeError(f"提交失败: {res.status} {data[:200]}")
+
+    # 预热连接与缓存，不计入统计
+    submit()
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    for _ in range(rounds):
+        submit()
+    cpu = (time.process_time() - cpu_start) / rounds
+    wall = (time.perf_counter() - wall_start) / rounds
+    # 单独跑一次统计 Python 分配峰值，tracemalloc 本身的开销不计入 CPU 时间
+    tracemalloc.start()
+    submit()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "mode": mode,
+        "payload_mb": round(size * 4 * 4 / 3 / 1024 / 1024, 2),
+        "cpu_ms": round(cpu * 1000, 2),
+        "wall_ms": round(wall * 1000, 2),
+        "peak_alloc_mb": round(peak / 1024 / 1024, 2),
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def start_mock(profile):
+    """在子进程中启动模拟服务，返回 (进程, API 地址)"""
+    process = subprocess.Popen(
+        [sys.executable, "-m", "dmxapi.mock_server", "--port", "0", "--profile", profile],
+        cwd=SNIPPETS_DIR, stdout=subprocess.PIPE, text=True,
+    )
+    line = process.stdout.readline()
+    api_url = next((word for word in line.split() if word.startswith("http://")), None)
+    if api_url is None:
+        process.kill()
+        raise RuntimeError(f"模拟服务启动失败: {line}")
+    return process, api_url
+
+
+def compare(results, baseline):
+    """与基线结果逐项对比，返回变化超过 10% 的指标说明"""
+    previous = {(row["scenario"], row["concurrency"]): row for row in baseline.get("results", [])}
+    lines = []
+    for row in results:
+        old = previous.get((row["scenario"], row["concurrency"]))
+        if not old:
+            continue
+        for metric, better in COMPARED_METRICS.items():
+            before, after = old.get(metric), row.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            if abs(change) < 0.1:
+                continue
+            worse = change < 0 if better == "higher" else change > 0
+            lines.append(f"{'退化' if worse else '改进'} {row['scenario']}@{row['concurrency']} "
+                         f"{metric}: {before} -> {after} ({change:+.0%})")
+    return lines
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SNIPPETS_DIR, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="示例客户端吞吐与延迟基准测试")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="逗号分隔的场景列表")
+    parser.add_argument("--concurrency", default=",".join(map(str, DEFAULT_CONCURRENCY)),
+                        help="逗号分隔的未完成任务数")
+    parser.add_argument("--rounds", type=int, default=2, help="每个并发级别执行的任务数为 并发数 × rounds")
+    parser.add_argument("--profile", default="fast", help="模拟服务的预置配置")
+    parser.add_argument("--api-url", help="使用已启动的模拟服务，而不是自动启动")
+    parser.add_argument("--timeout", type=int, default=600, help="单个任务超时时间（秒）")
+    parser.add_argument("--output", default="bench.json", help="结果文件")
+    parser.add_argument("--baseline", help="基线结果文件，输出变化超过 10% 的指标")
+    parser.add_argument("--payload", action="store_true", help="改为对比大请求体的构建与发送方式")
+    parser.add_argument("--payload-mb", type=float, default=3, help="--payload 时每个媒体文件的大小（MB）")
+    args = parser.parse_args(argv)
+
+    process = None
+    api_url = args.api_url
+    if not api_url:
+        process, api_url = start_mock(args.profile)
+    results = []
+    context = multiprocessing.get_context("spawn")
+    try:
+        if args.payload:
+            size = int(args.payload_mb * 1024 * 1024)
+            for mode in PAYLOAD_MODES:
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    row = executor.submit(run_payload, mode, api_url, size, args.rounds * 5).result()
+                results.append(row)
+                print(json.dumps(row, ensure_ascii=False), flush=True)
+        for scenario in args.scenarios.split(",") if not args.payload else ():
+            for concurrency in map(int, args.concurrency.split(",")):
+                tasks = max(concurrency * args.rounds, 10)
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    row = executor.submit(run_level, scenario, concurrency, tasks, api_url, args.timeout).result()
+                results.append(row)
+                print(json.dumps(row, ensure_ascii=False), flush=True)
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "profile": args.profile if not args.api_url else None,
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as output_file:
+        json.dump(report, output_file, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {args.output}")
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as baseline_file:
+            for line in compare(results, json.load(baseline_file)) or ["与基线相比没有超过 10% 的变化"]:
+                print(line)
+
+
+if __name__ == "__main__":
+    main()
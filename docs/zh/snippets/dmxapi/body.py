@@ -0,0 +1,113 @@
+import base64
+import json
+import os
+
+from dmxapi import encode_cache
+
+# 每次读取的原始字节数，必须是 3 的倍数，保证分块编码结果可以直接拼接
+READ_CHUNK_SIZE = 3 * 64 * 1024
+
+
+class FileChangedError(Exception):
+    """文件大小在创建请求体之后发生变化，实际发送的长度与已声明的 Content-Length 不一致"""
+
+
+class FileBase64:
+    def __init__(self, path, chunk_size=READ_CHUNK_SIZE):
+        """本地文件的 base64 占位符，序列化请求体时才分块读取并编码
+
+        参数:
+            path: str, 本地文件路径，文件不存在时立即抛出 OSError
+            chunk_size: int, 每次读取的字节数，需为 3 的倍数
+        """
+        if chunk_size % 3:
+            raise ValueError("chunk_size 必须是 3 的倍数")
+        self.path = path
+        self.size = os.path.getsize(path)
+        self.chunk_size = chunk_size
+
+    @property
+    def encoded_length(self):
+        """base64 编码后的长度，无需读取文件即可计算"""
+        return (self.size + 2) // 3 * 4
+
+    def iter_encoded(self):
+        """产出 base64 编码后的 bytes
+
+        不超过缓存上限的文件从共享编码缓存取整块结果，同一文件在批量任务中只编码一次；
+        更大的文件逐块读取并编码，峰值内存与文件大小无关。
+        Content-Length 按创建时的文件大小计算，实际读到的字节数不同时抛出 FileChangedError，
+        调用方（连接池）随之关闭连接，不会在 keep-alive 连接上留下长度错误的请求。
+        """
+        cache = encode_cache.get_encoding_cache()
+        if cache.cacheable(self.size):
+            encoded = cache.get_encoded(self.path)
+            if len(encoded) != self.encoded_length:
+                raise self._changed(os.path.getsize(self.path))
+            yield encoded
+            return
+        with open(self.path, "rb") as media_file:
+            # 发送前先检查一次，文件已变化时不写出任何内容
+            size = os.fstat(media_file.fileno()).st_size
+            if size != self.size:
+                raise self._changed(size)
+            read = 0
+            while read < self.size:
+                chunk = media_file.read(min(self.chunk_size, self.size - read))
+                if not chunk:
+                    raise self._changed(read)
+                read += len(chunk)
+                yield base64.b64encode(chunk)
+            # 读取过程中文件变长
+            if media_file.read(1):
+                raise self._changed(os.fstat(media_file.fileno()).st_size)
+
+    def _changed(self, size):
+        return FileChangedError(f"文件在创建请求体后被修改: {self.path} 创建时 {self.size} 字节，发送时 {size} 字节")
+
+    def read_encoded(self):
+        """一次性返回完整的 base64 字符串，仅在确实需要字符串时使用"""
+        return b"".join(self.iter_encoded()).decode("ascii")
+
+
+class StreamingJSONBody:
+    def __init__(self, obj):
+        """可流式发送的 JSON 请求体
+
+        请求体中的 FileBase64 占位符在发送时才被逐块编码写入 socket，其余部分预先序列化，
+        Content-Length 在发送前即可算出，单次提交的峰值内存与文件大小无关。
+
+        参数:
+            obj: dict, 请求体，值可以包含 FileBase64
+        """
+        # 随机标记只用于在序列化结果中定位占位符；不用 uuid 模块，它会连带导入 platform
+        marker = f"dmxapi-file-{os.urandom(16).hex()}-"
+        files = []
+
+        def default(value):
+            if isinstance(value, FileBase64):
+                files.append(value)
+                return f"{marker}{len(files) - 1}"
+            raise TypeError(f"无法序列化 {type(value).__name__}")
+
+        text = json.dumps(obj, default=default)
+        # 按占位符切分，得到 [JSON 片段, 文件, JSON 片段, 文件, ...]
+        self.segments = []
+        for index, media in enumerate(files):
+            head, _, text = text.partition(f'"{marker}{index}"')
+            self.segments.append(head.encode("utf-8") + b'"')
+            self.segments.append(media)
+            text = '"' + text
+        self.segments.append(text.encode("utf-8"))
+        self.content_length = sum(
+            segment.encoded_length if isinstance(segment, FileBase64) else len(segment)
+            for segment in self.segments
+        )
+
+    def __iter__(self):
+        # 每次迭代都重新读取文件，连接池重发请求时可以再次发送
+        for segment in self.segments:
+            if isinstance(segment, FileBase64):
+                yield from segment.iter_encoded()
+            else:
+                yield segment
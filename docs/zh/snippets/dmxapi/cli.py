@@ -0,0 +1,344 @@
+"""dmx 命令行工具
+
+一条命令覆盖全部示例能力，无需修改示例代码中的常量。参数即对应 API 文档中的请求体字段，
+常用字段有专门的选项，其余字段用 --set 填写；媒体字段可以直接填写本地文件路径。
+
+用法（`pip install ./docs/zh/snippets` 安装后即有 dmx 命令；不安装时在 docs/zh/snippets 目录下
+用 `alias dmx="python -m dmxapi.cli"`）:
+    export DMXAPI_TOKEN=sk-XXXXXXXXXXXXX
+    dmx t2i --prompt "一只猫" --model kling-v1-5 --set n=2
+    dmx i2v --image cat.png --prompt "猫在跳舞" --mode pro --download-dir out
+    dmx t2v --prompt "海边日落" --no-wait          # 只提交，输出 task_id
+    dmx fetch t2v TASK_ID                           # 查询一次任务状态
+    dmx mj-imagine --prompt "吉卜力风格" --image frame.png
+    dmx mj-fetch TASK_ID --wait
+
+结果以 JSON 输出到标准输出，任务失败或超时时退出码非 0。
+
+命令行常被 shell 循环和定时任务成千上万次调用，启动时间比单次请求还长时就成了瓶颈。
+因此这里只在模块顶层导入 argparse 等轻量模块，`import dmxapi` 本身也按需加载子模块：
+提交任务只导入连接池和任务参数处理，图片预处理在参数中有本地文件时才导入，轮询器、下载器在需要等待结果、
+下载文件时才导入。
+"""
+import argparse
+import json
+import os
+import sys
+
+DEFAULT_API_URL = "www.dmxapi.cn"
+DEFAULT_TIMEOUT = 600
+
+# 选项 -> 请求体字段，嵌套字段用 "." 连接；第三项为 add_argument 的额外参数
+_MODEL = ("--model", "model_name", {"help": "模型名称"})
+_PROMPT = ("--prompt", "prompt", {"help": "正向提示词"})
+_NEGATIVE = ("--negative-prompt", "negative_prompt", {"help": "负向提示词"})
+_ASPECT = ("--aspect-ratio", "aspect_ratio", {"help": "画面纵横比，例如 16:9"})
+_MODE = ("--mode", "mode", {"help": "生成模式：std 或 pro"})
+_DURATION = ("--duration", "duration", {"help": "视频时长（秒）"})
+_CFG = ("--cfg-scale", "cfg_scale", {"type": float, "help": "提示词相关性 [0, 1]"})
+_COUNT = ("-n", "n", {"type": int, "help": "生成数量"})
+
+
+class Command:
+    def __init__(self, kind, summary, options=(), prepare=None):
+        """一个提交任务的子命令
+
+        参数:
+            kind: str, 任务类型，见 dmxapi.jobs.JOB_KINDS
+            summary: str, 子命令说明
+            options: tuple, (选项, 请求体字段, add_argument 额外参数)
+            prepare: 可选，以 (请求参数, 命令行参数) 调用，处理选项与字段不是一一对应的情况
+        """
+        self.kind = kind
+        self.summary = summary
+        self.options = options
+        self.prepare = prepare
+
+
+def _prepare_lip_sync(params, args):
+    """按文本或音频来源补全对口型的 mode 和音频字段"""
+    source = params.setdefault("input", {})
+    if args.video:
+        source["video_url" if _is_url(args.video) else "video_id"] = args.video
+    if args.audio:
+        source.setdefault("mode", "audio2video")
+        source["audio_type"] = "url" if _is_url(args.audio) else "file"
+        source["audio_url" if _is_url(args.audio) else "audio_file"] = args.audio
+    elif "text" in source:
+        source.setdefault("mode", "text2video")
+
+
+def _prepare_mj_imagine(params, args):
+    """把参考图转换为 base64Array 中的 data URI"""
+    if args.image:
+        params["base64Array"] = ["data:image/png;base64," + _image_base64(image) for image in args.image]
+
+
+# 子命令 -> 任务配置
+COMMANDS = {
+    "t2i": Command("text2image", "文生图", (_MODEL, _PROMPT, _NEGATIVE, _ASPECT, _COUNT)),
+    "i2i": Command("image2image", "图生图", (
+        _MODEL, _PROMPT, _ASPECT, _COUNT,
+        ("--image", "image", {"help": "参考图，URL 或本地文件路径"}),
+        ("--image-reference", "image_reference", {"help": "参考类型：subject 或 face"}),
+        ("--image-fidelity", "image_fidelity", {"type": float, "help": "参考图强度 [0, 1]"}),
+    )),
+    "t2v": Command("text2video", "文生视频", (_MODEL, _PROMPT, _NEGATIVE, _ASPECT, _MODE, _DURATION, _CFG)),
+    "i2v": Command("image2video", "图生视频", (
+        _MODEL, _PROMPT, _NEGATIVE, _MODE, _DURATION, _CFG,
+        ("--image", "image", {"help": "首帧图片，URL 或本地文件路径"}),
+        ("--image-tail", "image_tail", {"help": "尾帧图片，URL 或本地文件路径"}),
+    )),
+    "extend": Command("video_extend", "视频续写", (
+        _PROMPT, _NEGATIVE, _CFG,
+        ("--video-id", "video_id", {"help": "要续写的视频 id"}),
+    )),
+    "lip-sync": Command("lip_sync", "对口型", (
+        ("--task-id", "input.task_id", {"help": "视频所属的任务 id，与 --video-id 一起使用"}),
+        ("--text", "input.text", {"help": "文本驱动时的台词"}),
+        ("--voice-id", "input.voice_id", {"help": "文本驱动时的音色 id"}),
+        ("--voice-language", "input.voice_language", {"help": "音色语种：zh 或 en"}),
+        ("--voice-speed", "input.voice_speed", {"type": float, "help": "语速 [0.8, 2.0]"}),
+    ), prepare=_prepare_lip_sync),
+    "try-on": Command("try_on", "虚拟试穿", (
+        _MODEL,
+        ("--human", "human_image", {"help": "人物图片，URL 或本地文件路径"}),
+        ("--cloth", "cloth_image", {"help": "服饰图片，URL 或本地文件路径"}),
+    )),
+    "effects": Command("effects", "视频特效", (
+        ("--scene", "effect_scene", {"help": "特效场景，例如 expansion、hug"}),
+        ("--model", "input.model_name", {"help": "模型名称"}),
+        ("--mode", "input.mode", {"help": "生成模式：std 或 pro"}),
+        ("--duration", "input.duration", {"help": "视频时长（秒）"}),
+        ("--image", "input.image", {"help": "单人特效的图片，URL 或本地文件路径"}),
+        ("--images", "input.images", {"nargs": "+", "help": "双人特效的两张图片"}),
+    )),
+    "mj-imagine": Command("mj_imagine", "Midjourney 绘图", (
+        _PROMPT,
+        ("--mode", "mode", {"help": "速度模式：FAST、RELAX 或 TURBO"}),
+        ("--bot-type", "botType", {"help": "MID_JOURNEY 或 NIJI_JOURNEY"}),
+    ), prepare=_prepare_mj_imagine),
+}
+
+# 只有部分子命令需要的额外选项，由 prepare 处理
+_EXTRA_OPTIONS = {
+    "lip-sync": (
+        ("--video", {"help": "视频来源：URL，或与 --task-id 一起使用的视频 id"}),
+        ("--audio", {"help": "音频驱动时的音频，URL 或本地文件路径"}),
+    ),
+    "mj-imagine": (
+        ("--image", {"action": "append", "help": "参考图本地文件路径或 URL，可重复"}),
+    ),
+}
+
+
+def _is_url(value):
+    return value.startswith(('http://', 'https://', 'ftp://'))
+
+
+def _image_base64(image):
+    """读取本地图片或下载 URL 图片并编码为 base64"""
+    import base64
+
+    if _is_url(image):
+        import urllib.request
+
+        with urllib.request.urlopen(image, timeout=30) as response:
+            return base64.b64encode(response.read()).decode("utf-8")
+    with open(image, "rb") as image_file:
+        return base64.b64encode(image_file.read()).decode("utf-8")
+
+
+def _parse_value(text):
+    """--set 的值按 JSON 解析，解析失败时作为字符串"""
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def _assign(params, field, value):
+    """按 "a.b.c" 形式的字段路径写入嵌套的请求参数"""
+    *parents, leaf = field.split(".")
+    for parent in parents:
+        params = params.setdefault(parent, {})
+    params[leaf] = value
+
+
+def build_params(command, args):
+    """由命令行参数构建请求参数：--params 为基础，之后依次应用专门选项和 --set
+
+    返回:
+        dict, 请求参数
+    """
+    params = {}
+    if args.params:
+        if args.params.lstrip().startswith("{"):
+            params = json.loads(args.params)
+        else:
+            with open(args.params, "r", encoding="utf-8") as params_file:
+                params = json.load(params_file)
+    for _, field, _ in command.options:
+        value = getattr(args, _dest(field))
+        if value is not None:
+            _assign(params, field, value)
+    for item in args.set or ():
+        key, sep, value = item.partition("=")
+        if not sep:
+            raise ValueError(f"--set 需要 KEY=VALUE 格式: {item}")
+        _assign(params, key, _parse_value(value))
+    if command.prepare:
+        command.prepare(params, args)
+    return params
+
+
+def _dest(field):
+    return "field_" + field.replace(".", "__")
+
+
+def _headers(token):
+    return {
+        'Authorization': f'Bearer {token}',
+        'Content-Type': 'application/json'
+    }
+
+
+def _emit(record):
+    print(json.dumps(record, ensure_ascii=False, indent=2))
+
+
+def _wait(args, kind, task_id, stats_key=None):
+    """轮询到任务结束，按需下载结果
+
+    返回:
+        int, 退出码
+    """
+    from dmxapi import jobs
+    from dmxapi.poller import TaskFailedError, get_poller
+
+    future = jobs.register_job(get_poller(args.api_url), _headers(args.token), kind, task_id, args.timeout,
+                               stats_key=stats_key)
+    try:
+        data = future.result()
+    except TaskFailedError as e:
+        _emit({"task_id": task_id, "status": "failed", "error": str(e)})
+        return 1
+    if data is None:
+        _emit({"task_id": task_id, "status": "timeout"})
+        return 1
+    result = jobs.job_result(kind, data)
+    record = {"task_id": task_id, "status": "succeed", "result": result}
+    if args.download_dir:
+        from dmxapi.download import download_results
+
+        record["files"] = download_results(jobs.result_urls(kind, result), os.path.join(args.download_dir, task_id))
+    _emit(record)
+    return 0
+
+
+def run_command(name, args):
+    """提交任务，默认等待结果
+
+    返回:
+        int, 退出码
+    """
+    from dmxapi import jobs
+    from dmxapi.pool import get_pool
+
+    command = COMMANDS[name]
+    params = build_params(command, args)
+    task_id = jobs.submit_job(get_pool(args.api_url), _headers(args.token), command.kind, params)
+    if args.no_wait:
+        _emit({"task_id": task_id, "status": "submitted"})
+        return 0
+    return _wait(args, command.kind, task_id, stats_key=jobs.stats_key(command.kind, params))
+
+
+def run_fetch(kind, task_id, args):
+    """查询一次任务状态，--wait 时轮询到任务结束
+
+    返回:
+        int, 退出码
+    """
+    if args.wait:
+        return _wait(args, kind, task_id)
+    from dmxapi import endpoints, jobs
+    from dmxapi.pool import get_pool
+
+    job_kind = jobs.get_kind(kind)
+    if job_kind.midjourney:
+        path, parse = endpoints.MJ_FETCH.format(task_id=task_id), endpoints.parse_midjourney
+    else:
+        path, parse = endpoints.query_path(job_kind.endpoint, task_id), endpoints.parse_kling
+    res = get_pool(args.api_url).request("GET", path, None, _headers(args.token))
+    status, data, message = parse(json.loads(res.read().decode("utf-8")))
+    record = {"task_id": task_id, "status": status, "message": message}
+    if status == endpoints.STATUS_SUCCEED:
+        record["result"] = jobs.job_result(kind, data)
+    _emit(record)
+    return 1 if status == endpoints.STATUS_FAILED else 0
+
+
+def _add_common(parser):
+    parser.add_argument("--api-url", default=os.environ.get("DMXAPI_URL", DEFAULT_API_URL), help="API 节点地址")
+    parser.add_argument("--token", default=os.environ.get("DMXAPI_TOKEN"), help="API 密钥，默认读取 DMXAPI_TOKEN")
+    parser.add_argument("--timeout", type=int, default=DEFAULT_TIMEOUT, help="等待结果的超时时间（秒）")
+    parser.add_argument("--download-dir", help="结果下载目录，设置后任务成功时下载到 下载目录/任务id/")
+
+
+def build_parser(selected=None):
+    """构建参数解析器
+
+    参数:
+        selected: str, 可选，本次调用的子命令；提供时只为该子命令添加选项，
+            其余子命令只保留名称和说明，省去一次调用中用不到的 add_argument
+    """
+    parser = argparse.ArgumentParser(prog="dmx", description="提交 DMXAPI 生成任务并输出结果")
+    subparsers = parser.add_subparsers(dest="command", required=True, metavar="COMMAND")
+    for name, command in COMMANDS.items():
+        sub = subparsers.add_parser(name, help=command.summary, description=command.summary)
+        if selected and name != selected:
+            continue
+        for flag, field, kwargs in command.options:
+            sub.add_argument(flag, dest=_dest(field), metavar=field.rsplit(".", 1)[-1].upper(), **kwargs)
+        for flag, kwargs in _EXTRA_OPTIONS.get(name, ()):
+            sub.add_argument(flag, **kwargs)
+        sub.add_argument("--params", help="基础请求参数：JSON 字符串或 JSON 文件路径")
+        sub.add_argument("--set", action="append", metavar="KEY=VALUE",
+                         help="设置任意请求体字段，嵌套字段用 . 连接，值按 JSON 解析，可重复")
+        sub.add_argument("--no-wait", action="store_true", help="只提交，输出 task_id 后立即退出")
+        _add_common(sub)
+
+    fetch = subparsers.add_parser("fetch", help="查询 Kling 任务", description="查询 Kling 任务")
+    fetch.add_argument("kind", choices=[name for name in COMMANDS if not name.startswith("mj-")],
+                       help="提交任务时使用的子命令")
+    fetch.add_argument("task_id", help="任务 id")
+    fetch.add_argument("--wait", action="store_true", help="轮询到任务结束")
+    _add_common(fetch)
+
+    mj_fetch = subparsers.add_parser("mj-fetch", help="查询 Midjourney 任务", description="查询 Midjourney 任务")
+    mj_fetch.add_argument("task_id", help="任务 id")
+    mj_fetch.add_argument("--wait", action="store_true", help="轮询到任务结束")
+    _add_common(mj_fetch)
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    parser = build_parser(argv[0] if argv and argv[0] in COMMANDS else None)
+    args = parser.parse_args(argv)
+    if not args.token:
+        parser.error("请通过 --token 或环境变量 DMXAPI_TOKEN 提供 API 密钥")
+    try:
+        if args.command == "fetch":
+            return run_fetch(COMMANDS[args.kind].kind, args.task_id, args)
+        if args.command == "mj-fetch":
+            return run_fetch(COMMANDS["mj-imagine"].kind, args.task_id, args)
+        return run_command(args.command, args)
+    except Exception as e:
+        print(f"dmx: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,316 @@
+"""生成结果下载器
+
+把任务结果中的图像、视频 url 流式保存到本地:
+    - 多个文件由固定大小的线程池并行下载
+    - 支持 Range 的大文件拆成多个分段并发下载
+    - 下载中断后保留 .part 文件和进度，重新下载时从断点继续
+    - 完成后校验文件大小，校验通过才重命名为最终文件
+    - 最终文件旁的 .url 文件记录来源 url，同名文件来源一致时才跳过下载
+    - 同一进程内下载到同一路径的调用依次执行，后到的调用直接得到已完成的文件
+"""
+import hashlib
+import json
+import os
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import unquote, urlsplit
+
+# 同时下载的文件数
+DEFAULT_WORKERS = 4
+# 大文件的并发分段数
+DEFAULT_SEGMENTS = 4
+# 超过该大小的文件才分段下载
+DEFAULT_SEGMENT_THRESHOLD = 16 * 1024 * 1024
+# 每次读取写入的块大小
+CHUNK_SIZE = 256 * 1024
+# 每个分段每写入这么多字节保存一次进度
+PROGRESS_EVERY = 4 * 1024 * 1024
+
+
+class DownloadError(Exception):
+    """下载失败或文件校验不通过"""
+
+
+def filename_for(url):
+    """根据 url 路径生成本地文件名，路径中没有文件名时使用 url 的哈希"""
+    name = os.path.basename(unquote(urlsplit(url).path))
+    return name or hashlib.sha1(url.encode("utf-8")).hexdigest()[:16]
+
+
+def _content_range_total(value):
+    """解析 Content-Range: bytes 0-0/12345 中的总大小，总大小未知（bytes 0-0/*）时为 None"""
+    total = (value or "").rpartition("/")[2]
+    return int(total) if total.isdigit() else None
+
+
+# 目标路径 -> [锁, 持有或等待的调用数]，没有调用时移除
+_path_locks = {}
+_path_locks_guard = threading.Lock()
+
+
+@contextmanager
+def _path_lock(path):
+    """同一目标路径的下载共用 .part 和进度文件，必须依次执行"""
+    key = os.path.abspath(path)
+    with _path_locks_guard:
+        entry = _path_locks.get(key)
+        if entry is None:
+            entry = _path_locks[key] = [threading.Lock(), 0]
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _path_locks_guard:
+            entry[1] -= 1
+            if not entry[1]:
+                del _path_locks[key]
+
+
+class Downloader:
+    def __init__(self, workers=DEFAULT_WORKERS, segments=DEFAULT_SEGMENTS,
+                 segment_threshold=DEFAULT_SEGMENT_THRESHOLD, timeout=60):
+        """初始化下载器
+
+        参数:
+            workers: int, 同时下载的文件数
+            segments: int, 单个大文件的并发分段数
+            segment_threshold: int, 分段下载的最小文件大小（字节）
+            timeout: int, 单次网络操作超时时间（秒）
+        """
+        self.segments = segments
+        self.segment_threshold = segment_threshold
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dmxapi-download")
+        # 分段使用独立线程池，避免文件任务占满线程后等待自己的分段
+        self._segment_executor = ThreadPoolExecutor(max_workers=workers * segments,
+                                                    thread_name_prefix="dmxapi-segment")
+        self._lock = threading.Lock()
+        self.files = 0
+        self.skipped = 0
+        self.bytes = 0
+        self.resumed_bytes = 0
+
+    def submit(self, url, dest_dir=".", filename=None):
+        """提交一个下载任务
+
+        返回:
+            Future, 结果为本地文件路径
+        """
+        return self._executor.submit(self.download, url, dest_dir, filename)
+
+    def download_many(self, urls, dest_dir="."):
+        """并行下载多个 url，按输入顺序返回本地文件路径"""
+        return [future.result() for future in [self.submit(url, dest_dir) for url in urls]]
+
+    def download(self, url, dest_dir=".", filename=None):
+        """在当前线程下载一个文件，已存在且来源 url 相同的文件直接返回
+
+        参数:
+            url: str, 文件 url
+            dest_dir: str, 保存目录
+            filename: str, 可选，文件名，默认取 url 中的文件名
+        返回:
+            str, 本地文件路径
+        """
+        os.makedirs(dest_dir, exist_ok=True)
+        path = os.path.join(dest_dir, filename or filename_for(url))
+        # 合并的生成调用会把同一个结果下载到同一目录，等前一个下载完成后按来源 url 直接跳过
+        with _path_lock(path):
+            return self._download(url, path)
+
+    def _download(self, url, path):
+        url_path = f"{path}.url"
+        if os.path.exists(path) and self._source_url(url_path) == url:
+            with self._lock:
+                self.skipped += 1
+            return path
+        part_path = f"{path}.part"
+        state_path = f"{part_path}.json"
+        state = self._load_state(state_path, url) if os.path.exists(part_path) else None
+
+        # 用 1 字节的 Range 请求探测文件大小和是否支持分段，
+        # 签名 url 往往不允许 HEAD 请求
+        try:
+            res = self._open(url, {"Range": "bytes=0-0"})
+        except urllib.error.HTTPError as e:
+            if e.code != 416:
+                raise
+            res = self._open(url)
+        with res:
+            total = _content_range_total(res.headers.get("Content-Range")) if res.status == 206 else None
+            validator = res.headers.get("ETag") or res.headers.get("Last-Modified")
+            if res.status != 206:
+                # 服务器不支持 Range，只能从头下载，直接复用这次响应
+                length = res.headers.get("Content-Length")
+                self._stream_whole(res, part_path)
+                self._finish(part_path, path, state_path, int(length) if length else None, url)
+                return path
+        if total is None:
+            # 返回了 206 但总大小未知，无法切分分段，探测响应只有 1 字节，重新发起完整的 GET
+            with self._open(url) as res:
+                length = res.headers.get("Content-Length")
+                self._stream_whole(res, part_path)
+            self._finish(part_path, path, state_path, int(length) if length else None, url)
+            return path
+
+        if state and (state["size"] != total or state["validator"] != validator):
+            # 远端文件已变化，丢弃旧的部分文件
+            state = None
+        if state is None:
+            state = self._new_state(url, total, validator)
+            with open(part_path, "wb") as part_file:
+                part_file.truncate(total)
+            self._save_state(state_path, state)
+        else:
+            with self._lock:
+                self.resumed_bytes += sum(segment[2] for segment in state["segments"])
+
+        progress_lock = threading.Lock()
+        pending = [index for index, segment in enumerate(state["segments"])
+                   if segment[0] + segment[2] <= segment[1]]
+        if len(pending) > 1:
+            futures = [self._segment_executor.submit(self._fetch_segment, url, part_path, state_path, state,
+                                                     index, progress_lock) for index in pending]
+            for future in futures:
+                future.result()
+        else:
+            for index in pending:
+                self._fetch_segment(url, part_path, state_path, state, index, progress_lock)
+        self._finish(part_path, path, state_path, total, url)
+        return path
+
+    def _open(self, url, headers=None):
+        request = urllib.request.Request(url, headers=headers or {})
+        return urllib.request.urlopen(request, timeout=self.timeout)
+
+    def _new_state(self, url, total, validator):
+        """按文件大小切分分段，每段记录 [起始, 结束(含), 已完成字节数]"""
+        count = self.segments if total >= self.segment_threshold else 1
+        step = -(-total // count)
+        segments = [[start, min(start + step, total) - 1, 0] for start in range(0, total, step)]
+        return {"url": url, "size": total, "validator": validator, "segments": segments}
+
+    def _load_state(self, state_path, url):
+        try:
+            with open(state_path, "r", encoding="utf-8") as state_file:
+                state = json.load(state_file)
+        except (OSError, ValueError):
+            return None
+        return state if state.get("url") == url else None
+
+    @staticmethod
+    def _source_url(url_path):
+        """读取已下载文件记录的来源 url，没有记录时为 None"""
+        try:
+            with open(url_path, "r", encoding="utf-8") as url_file:
+                return url_file.read()
+        except OSError:
+            return None
+
+    def _save_state(self, state_path, state):
+        tmp_path = f"{state_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as state_file:
+            json.dump(state, state_file)
+        os.replace(tmp_path, state_path)
+
+    def _fetch_segment(self, url, part_path, state_path, state, index, progress_lock):
+        """下载一个分段，写入部分文件的对应位置并定期保存进度"""
+        segment = state["segments"][index]
+        start, end = segment[0] + segment[2], segment[1]
+        headers = {"Range": f"bytes={start}-{end}"}
+        if state["validator"]:
+            # 远端文件变化时服务器会返回完整内容而不是 206
+            headers["If-Range"] = state["validator"]
+        with self._open(url, headers) as res, open(part_path, "r+b") as part_file:
+            if res.status != 206:
+                raise DownloadError(f"远端文件已变化或不支持分段下载: {url}")
+            part_file.seek(start)
+            unsaved = 0
+            while True:
+                chunk = res.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                part_file.write(chunk)
+                unsaved += len(chunk)
+                if unsaved >= PROGRESS_EVERY:
+                    part_file.flush()
+                    self._progress(state_path, state, segment, unsaved, progress_lock)
+                    unsaved = 0
+            part_file.flush()
+            self._progress(state_path, state, segment, unsaved, progress_lock)
+        if segment[0] + segment[2] != end + 1:
+            raise DownloadError(f"分段下载不完整: {url} bytes={start}-{end}")
+
+    def _progress(self, state_path, state, segment, written, progress_lock):
+        with progress_lock:
+            segment[2] += written
+            self._save_state(state_path, state)
+        with self._lock:
+            self.bytes += written
+
+    def _stream_whole(self, res, part_path):
+        with open(part_path, "wb") as part_file:
+            while True:
+                chunk = res.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                part_file.write(chunk)
+                with self._lock:
+                    self.bytes += len(chunk)
+
+    def _finish(self, part_path, path, state_path, expected_size, url):
+        """校验文件大小后重命名为最终文件，并记录来源 url"""
+        size = os.path.getsize(part_path)
+        if expected_size is not None and size != expected_size:
+            raise DownloadError(f"文件大小校验失败: {path} 期望 {expected_size} 实际 {size}")
+        # 先删除旧的来源记录再替换文件，中途退出时不会把新文件误认为旧 url 的下载结果
+        url_path = f"{path}.url"
+        if os.path.exists(url_path):
+            os.remove(url_path)
+        os.replace(part_path, path)
+        with open(url_path, "w", encoding="utf-8") as url_file:
+            url_file.write(url)
+        if os.path.exists(state_path):
+            os.remove(state_path)
+        with self._lock:
+            self.files += 1
+
+    def stats(self):
+        """返回下载计数"""
+        with self._lock:
+            return {
+                "files": self.files,
+                "skipped": self.skipped,
+                "bytes": self.bytes,
+                "resumed_bytes": self.resumed_bytes,
+            }
+
+
+# 所有客户端共享的下载器
+_downloader = None
+_downloader_lock = threading.Lock()
+
+
+def get_downloader():
+    """获取共享下载器"""
+    global _downloader
+    with _downloader_lock:
+        if _downloader is None:
+            _downloader = Downloader()
+        return _downloader
+
+
+def download_results(urls, dest_dir):
+    """用共享下载器并行下载任务结果
+
+    参数:
+        urls: list, 结果 url 列表
+        dest_dir: str, 保存目录
+    返回:
+        list, 本地文件路径
+    """
+    return get_downloader().download_many(urls, dest_dir)
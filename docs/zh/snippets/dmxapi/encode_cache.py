@@ -0,0 +1,215 @@
+import base64
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+# 内存缓存默认总容量
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+# 超过该大小（原始字节数）的文件不进缓存，继续走流式编码
+DEFAULT_MAX_ENTRY_BYTES = 4 * 1024 * 1024
+# 文件 key -> 内容哈希索引最多保存的条目数
+DEFAULT_MAX_DIGESTS = 4096
+
+
+def _file_key(path):
+    """以 (真实路径, 大小, 修改时间) 作为快速 key，文件被修改后自动失效"""
+    stat = os.stat(path)
+    return os.path.realpath(path), stat.st_size, stat.st_mtime_ns
+
+
+class EncodingCache:
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, max_entry_bytes=DEFAULT_MAX_ENTRY_BYTES, disk_dir=None,
+                 max_digests=DEFAULT_MAX_DIGESTS):
+        """初始化本地文件 base64 编码缓存
+
+        先按 (路径, 大小, 修改时间) 查找，未命中时再按文件内容的 sha256 查找，
+        因此同一文件的不同副本也只编码一次。内存层按字节数做 LRU 淘汰，
+        (路径, 大小, 修改时间) 到内容哈希的索引按条目数做 LRU 淘汰，
+        可选的磁盘层按内容哈希保存编码结果，进程重启后仍可复用。
+
+        参数:
+            max_bytes: int, 内存层最多保存的编码后字节数，0 表示关闭缓存
+            max_entry_bytes: int, 可缓存文件的最大原始字节数
+            disk_dir: str, 可选，磁盘层目录
+            max_digests: int, 内容哈希索引最多保存的文件数
+        """
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.disk_dir = disk_dir
+        self.max_digests = max_digests
+        # 内容哈希 -> 编码结果，按最近使用排序
+        self._entries = OrderedDict()
+        # 文件 key -> 内容哈希，按最近使用排序
+        self._digests = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.hash_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def cacheable(self, size):
+        """判断指定大小的文件是否走缓存"""
+        return self.max_bytes > 0 and size <= self.max_entry_bytes
+
+    def _disk_path(self, digest):
+        return os.path.join(self.disk_dir, f"{digest}.b64")
+
+    def _remember(self, digest, encoded):
+        """写入内存层并按容量淘汰最久未使用的条目，调用方需持有锁"""
+        if digest in self._entries:
+            self._entries.move_to_end(digest)
+            return
+        self._entries[digest] = encoded
+        self._bytes += len(encoded)
+        while self._bytes > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+
+    def _remember_digest(self, key, digest):
+        """记录文件 key 对应的内容哈希并按条目数淘汰，调用方需持有锁"""
+        self._digests[key] = digest
+        self._digests.move_to_end(key)
+        while len(self._digests) > self.max_digests:
+            self._digests.popitem(last=False)
+
+    def _get_digest(self, key):
+        """查找文件 key 对应的内容哈希，调用方需持有锁"""
+        digest = self._digests.get(key)
+        if digest is not None:
+            self._digests.move_to_end(key)
+        return digest
+
+    def _lookup_digest(self, digest):
+        """按内容哈希依次查找内存层和磁盘层"""
+        with self._lock:
+            encoded = self._entries.get(digest)
+            if encoded is not None:
+                self._entries.move_to_end(digest)
+                self.hash_hits += 1
+                return encoded
+        if self.disk_dir:
+            try:
+                with open(self._disk_path(digest), "rb") as cached_file:
+                    encoded = cached_file.read()
+            except OSError:
+                return None
+            with self._lock:
+                self.disk_hits += 1
+                self._remember(digest, encoded)
+            return encoded
+        return None
+
+    def get_encoded(self, path):
+        """返回文件的 base64 编码（bytes），必要时读取文件并写入缓存
+
+        参数:
+            path: str, 本地文件路径
+        返回:
+            bytes, base64 编码结果
+        """
+        key = _file_key(path)
+        with self._lock:
+            digest = self._get_digest(key)
+            encoded = self._entries.get(digest) if digest else None
+            if encoded is not None:
+                self._entries.move_to_end(digest)
+                self.hits += 1
+                return encoded
+
+        # 快速 key 未命中，按内容哈希查找，仍未命中时用同一份数据完成编码
+        with open(path, "rb") as media_file:
+            raw = media_file.read()
+        # 只有缓存未命中时才需要哈希，hashlib 延迟到这里导入，不拖慢不带文件的提交
+        import hashlib
+
+        digest = hashlib.sha256(raw).hexdigest()
+        encoded = self._lookup_digest(digest)
+        if encoded is None:
+            encoded = base64.b64encode(raw)
+            with self._lock:
+                self.misses += 1
+                self._remember(digest, encoded)
+            if self.disk_dir:
+                self._write_disk(digest, encoded)
+        with self._lock:
+            self._remember_digest(key, digest)
+        return encoded
+
+    def _write_disk(self, digest, encoded):
+        """写入磁盘层，每次写入使用独立的临时文件，同时编码同一文件的线程互不覆盖"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as cached_file:
+                cached_file.write(encoded)
+            os.replace(tmp_path, self._disk_path(digest))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def get_base64(self, path):
+        """返回文件的 base64 字符串"""
+        return self.get_encoded(path).decode("ascii")
+
+    def digest(self, path):
+        """返回文件内容的 sha256，与编码共用 (路径, 大小, 修改时间) 索引，文件未修改时不重复读取
+
+        参数:
+            path: str, 本地文件路径
+        返回:
+            str, 十六进制哈希
+        """
+        key = _file_key(path)
+        with self._lock:
+            digest = self._get_digest(key)
+        if digest is not None:
+            return digest
+        import hashlib
+
+        # 逐块读取，大文件不整体载入内存
+        sha256 = hashlib.sha256()
+        with open(path, "rb") as media_file:
+            for chunk in iter(lambda: media_file.read(1024 * 1024), b""):
+                sha256.update(chunk)
+        digest = sha256.hexdigest()
+        with self._lock:
+            self._remember_digest(key, digest)
+        return digest
+
+    def stats(self):
+        """返回缓存计数"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "hash_hits": self.hash_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "digests": len(self._digests),
+            }
+
+
+# 所有客户端共享的默认缓存
+default_cache = EncodingCache()
+
+
+def configure_encoding_cache(max_bytes=DEFAULT_MAX_BYTES, max_entry_bytes=DEFAULT_MAX_ENTRY_BYTES, disk_dir=None,
+                             max_digests=DEFAULT_MAX_DIGESTS):
+    """替换共享的默认缓存，例如开启磁盘层或传入 max_bytes=0 关闭缓存
+
+    返回:
+        EncodingCache, 新的默认缓存
+    """
+    global default_cache
+    default_cache = EncodingCache(max_bytes=max_bytes, max_entry_bytes=max_entry_bytes, disk_dir=disk_dir,
+                                  max_digests=max_digests)
+    return default_cache
+
+
+def get_encoding_cache():
+    """返回当前共享的默认缓存"""
+    return default_cache
@@ -0,0 +1,107 @@
+# Kling 各能力的提交接口，查询接口为 "提交接口/{task_id}"
+TEXT_TO_IMAGE = "/kling/v1/images/generations"
+IMAGE_TO_IMAGE = "/kling/v1/images/generations"
+TEXT_TO_VIDEO = "/kling/v1/videos/text2video"
+IMAGE_TO_VIDEO = "/kling/v1/videos/image2video"
+VIDEO_EXTEND = "/kling/v1/videos/video-extend"
+LIP_SYNC = "/kling/v1/videos/lip-sync"
+VIDEO_EFFECTS = "/kling/v1/videos/effects"
+VIRTUAL_TRY_ON = "/kling/v1/images/kolors-virtual-try-on"
+
+# Midjourney 接口
+MJ_IMAGINE = "/mj/submit/imagine"
+MJ_FETCH = "/mj/task/{task_id}/fetch"
+# Midjourney 提交成功的业务码
+MJ_SUCCESS_CODE = 1
+
+# Kling 列表查询接口（GET 提交接口?pageNum=&pageSize=）的每页条数上限，结果按创建时间倒序
+LIST_MAX_PAGE_SIZE = 500
+
+# 任务状态
+STATUS_SUBMITTED = "submitted"
+STATUS_PROCESSING = "processing"
+STATUS_SUCCEED = "succeed"
+STATUS_FAILED = "failed"
+FINAL_STATUSES = (STATUS_SUCCEED, STATUS_FAILED)
+
+# 视为 URL 直接透传的输入前缀，其余输入按本地文件路径处理
+URL_PREFIXES = ('http://', 'https://', 'ftp://')
+
+
+def query_path(endpoint, task_id):
+    """构建任务查询路径
+
+    参数:
+        endpoint: str, 提交接口
+        task_id: str, 任务 id
+    返回:
+        str, 查询路径
+    """
+    return f"{endpoint}/{task_id}"
+
+
+def list_path(endpoint, page, page_size):
+    """构建 Kling 任务列表查询路径
+
+    参数:
+        endpoint: str, 提交接口
+        page: int, 页码，从 1 开始
+        page_size: int, 每页条数
+    返回:
+        str, 查询路径
+    """
+    return f"{endpoint}?pageNum={page}&pageSize={page_size}"
+
+
+def is_url(value):
+    """判断输入是否为 URL"""
+    return value.startswith(URL_PREFIXES)
+
+
+def parse_kling(json_data):
+    """解析 Kling 查询结果
+
+    返回:
+        (任务状态, data 字段, 状态说明)
+    """
+    if json_data['code'] != 0:
+        raise Exception(f"查询失败: {json_data['message']}")
+    data = json_data['data']
+    return data['task_status'], data, data.get('task_status_msg', "")
+
+
+def parse_kling_list(json_data):
+    """解析 Kling 列表查询结果
+
+    返回:
+        list, 每项与单个任务查询结果的 data 字段格式相同
+    """
+    if json_data['code'] != 0:
+        raise Exception(f"查询失败: {json_data['message']}")
+    return json_data['data'] or []
+
+
+def parse_midjourney(json_data):
+    """解析 Midjourney 查询结果，将 SUCCESS/FAILURE 映射为与 Kling 一致的任务状态
+
+    返回:
+        (任务状态, 完整查询结果, 失败原因)
+    """
+    status = {
+        "NOT_START": STATUS_SUBMITTED,
+        "SUBMITTED": STATUS_SUBMITTED,
+        "SUCCESS": STATUS_SUCCEED,
+        "FAILURE": STATUS_FAILED,
+    }.get(json_data.get('status'), STATUS_PROCESSING)
+    return status, json_data, json_data.get('failReason') or ""
+
+
+def image_urls(data):
+    """从查询结果的 data 中取出全部图像 url"""
+    return [image['url'] for image in data['task_result']['images']]
+
+
+def video_result(data):
+    """从查询结果的 data 中取出第一个视频的 url 和 id"""
+    video = data['task_result']['videos'][0]
+    return video['url'], video['id']
@@ -0,0 +1,49 @@
+"""并发执行多组生成参数
+
+客户端类的 generate_many 通过这里把同一个生成方法分发到线程池。生成方法本身线程安全：
+请求经过节点共享的连接池（每次请求取出一条连接，用完归还），等待结果由共享轮询器完成，
+等待中的线程不占用连接，因此 max_workers 即同时进行的任务数。
+
+用法:
+    for index, result, error in kling_text_to_image.generate_many(params_list, max_workers=8):
+        print(params_list[index]["prompt"], error or result)
+"""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# generate_many 默认同时进行的任务数
+DEFAULT_MAX_WORKERS = 8
+
+
+def generate_many(func, params_list, max_workers=DEFAULT_MAX_WORKERS):
+    """并发调用 func(**params)，按完成顺序产出结果
+
+    同时最多提交 max_workers 个调用，一个结束后才提交下一组参数；
+    调用方提前停止迭代时，尚未开始的调用不再执行。
+
+    参数:
+        func: 生成方法，例如 KlingTextToImage.generate_image
+        params_list: list[dict], 每项为 func 的关键字参数
+        max_workers: int, 同时进行的调用数
+    返回:
+        生成器，按完成顺序产出 (序号, 结果, 异常)，序号为参数在 params_list 中的位置，成功时异常为 None
+    """
+    params_list = list(params_list)
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="dmxapi-generate")
+    pending = {}
+    next_index = 0
+    try:
+        while next_index < len(params_list) or pending:
+            # 补足到 max_workers 个进行中的调用，避免一次把全部参数排进线程池
+            while next_index < len(params_list) and len(pending) < max_workers:
+                future = executor.submit(func, **params_list[next_index])
+                pending[future] = next_index
+                next_index += 1
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = pending.pop(future)
+                error = future.exception()
+                yield index, None if error else future.result(), error
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
@@ -0,0 +1,148 @@
+import atexit
+import json
+import os
+import threading
+import time
+
+# 历史耗时默认保存位置，可通过环境变量 DMXAPI_POLL_STATS 修改
+DEFAULT_STATS_PATH = os.path.join(os.path.expanduser("~"), ".dmxapi", "poll-stats.json")
+# 每个 key 保留的最近样本数
+MAX_SAMPLES = 50
+# 样本数少于该值时使用调用方给出的固定间隔
+MIN_SAMPLES = 5
+# 两次写盘的最小间隔（秒）
+SAVE_INTERVAL = 5
+
+
+def stats_key(key):
+    """将 (endpoint, model_name, mode, duration) 等元组转换为字符串 key"""
+    if isinstance(key, str):
+        return key
+    return "|".join("" if part is None else str(part) for part in key)
+
+
+def _quantile(sorted_samples, q):
+    index = min(len(sorted_samples) - 1, max(0, int(round(q * (len(sorted_samples) - 1)))))
+    return sorted_samples[index]
+
+
+class CompletionStats:
+    def __init__(self, path=None, max_samples=MAX_SAMPLES):
+        """初始化任务完成耗时统计，数据保存在本地 JSON 文件中，重启后仍然有效
+
+        参数:
+            path: str, 统计文件路径，默认 ~/.dmxapi/poll-stats.json
+            max_samples: int, 每个 key 保留的最近样本数
+        """
+        self.path = path or os.environ.get("DMXAPI_POLL_STATS", DEFAULT_STATS_PATH)
+        self.max_samples = max_samples
+        self._samples = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._saved_at = 0.0
+        self.load()
+        atexit.register(self.flush)
+
+    def load(self):
+        """从统计文件读取样本，文件不存在或损坏时从空统计开始"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as stats_file:
+                samples = json.load(stats_file)
+        except (OSError, ValueError):
+            return
+        with self._lock:
+            self._samples = {key: [float(value) for value in values] for key, values in samples.items()}
+
+    def record(self, key, seconds):
+        """记录一次任务从提交到完成的耗时
+
+        参数:
+            key: 统计 key，通常为 (endpoint, model_name, mode, duration)
+            seconds: float, 耗时（秒）
+        """
+        key = stats_key(key)
+        with self._lock:
+            samples = self._samples.setdefault(key, [])
+            samples.append(round(seconds, 2))
+            del samples[:-self.max_samples]
+            self._dirty = True
+            due = time.monotonic() - self._saved_at >= SAVE_INTERVAL
+        if due:
+            self.flush()
+
+    def samples(self, key):
+        """返回 key 对应样本的升序副本"""
+        with self._lock:
+            return sorted(self._samples.get(stats_key(key), []))
+
+    def quantile(self, key, q):
+        """返回 key 对应样本的 q 分位数（0~1），样本不足 MIN_SAMPLES 时返回 None"""
+        samples = self.samples(key)
+        if len(samples) < MIN_SAMPLES:
+            return None
+        return _quantile(samples, q)
+
+    def flush(self):
+        """将样本写入统计文件，先写临时文件再替换，避免写一半的文件"""
+        with self._lock:
+            if not self._dirty:
+                return
+            data = json.dumps(self._samples, ensure_ascii=False)
+            self._dirty = False
+            self._saved_at = time.monotonic()
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as stats_file:
+                stats_file.write(data)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            # 统计只用于优化轮询间隔，写盘失败不影响任务本身
+            pass
+
+
+class AdaptiveSchedule:
+    def __init__(self, stats=None, floor=1, ceiling=30):
+        """初始化基于历史耗时的轮询间隔策略
+
+        预计完成前稀疏轮询，进入历史耗时的 p10~p90 区间后按下限密集轮询，
+        超过 p90 后逐步放宽，间隔始终限制在 [floor, ceiling] 之间。
+
+        参数:
+            stats: CompletionStats, 耗时统计，默认使用本地统计文件
+            floor: float, 最小轮询间隔（秒）
+            ceiling: float, 最大轮询间隔（秒）
+        """
+        self.stats = stats or CompletionStats()
+        self.floor = floor
+        self.ceiling = ceiling
+
+    def _clamp(self, interval):
+        return min(self.ceiling, max(self.floor, interval))
+
+    def next_interval(self, key, elapsed, fallback):
+        """计算下一次查询前的等待时间
+
+        参数:
+            key: 统计 key
+            elapsed: float, 任务已等待的时间（秒）
+            fallback: float, 样本不足时使用的固定间隔
+        返回:
+            float, 等待时间（秒）
+        """
+        samples = self.stats.samples(key)
+        if len(samples) < MIN_SAMPLES:
+            return self._clamp(fallback)
+        early = _quantile(samples, 0.1)
+        late = _quantile(samples, 0.9)
+        if elapsed < early:
+            # 离最早完成时间还远，每次把剩余距离减半
+            return self._clamp((early - elapsed) / 2)
+        if elapsed <= late:
+            # 处于常见完成区间，按下限密集轮询
+            return self.floor
+        # 已超过大部分历史耗时，逐步放宽
+        return self._clamp((elapsed - late) / 2)
+
+    def record(self, key, seconds):
+        self.stats.record(key, seconds)
@@ -0,0 +1,158 @@
+import json
+import os
+
+from dmxapi import endpoints
+from dmxapi.body import FileBase64, StreamingJSONBody
+
+
+class JobKind:
+    def __init__(self, endpoint, interval, media_fields=(), midjourney=False):
+        """一种可提交的任务类型
+
+        参数:
+            endpoint: str, 提交接口
+            interval: float, 默认轮询间隔（秒）
+            media_fields: tuple, 可以填写本地文件路径的字段，嵌套字段用 "." 连接
+            midjourney: bool, 是否为 Midjourney 接口（提交/查询格式与 Kling 不同）
+        """
+        self.endpoint = endpoint
+        self.interval = interval
+        self.media_fields = media_fields
+        self.midjourney = midjourney
+
+
+# 任务类型 -> 接口配置，参数即为对应 API 文档中的请求体
+JOB_KINDS = {
+    "text2image": JobKind(endpoints.TEXT_TO_IMAGE, 1),
+    "image2image": JobKind(endpoints.IMAGE_TO_IMAGE, 1, ("image",)),
+    "text2video": JobKind(endpoints.TEXT_TO_VIDEO, 3),
+    "image2video": JobKind(endpoints.IMAGE_TO_VIDEO, 3, ("image", "image_tail", "static_mask", "dynamic_masks.mask")),
+    "video_extend": JobKind(endpoints.VIDEO_EXTEND, 1),
+    "lip_sync": JobKind(endpoints.LIP_SYNC, 2, ("input.audio_file",)),
+    "try_on": JobKind(endpoints.VIRTUAL_TRY_ON, 1, ("human_image", "cloth_image")),
+    "effects": JobKind(endpoints.VIDEO_EFFECTS, 3, ("input.image", "input.images")),
+    "mj_imagine": JobKind(endpoints.MJ_IMAGINE, 3, midjourney=True),
+}
+
+
+def get_kind(kind):
+    try:
+        return JOB_KINDS[kind]
+    except KeyError:
+        raise ValueError(f"未知的任务类型: {kind}，可选值: {', '.join(JOB_KINDS)}")
+
+
+def _resolve_media(value, parts, prepare):
+    """把指定字段中的本地文件路径替换为 FileBase64，URL 和已编码的内容保持不变"""
+    if isinstance(value, list):
+        return [_resolve_media(item, parts, prepare) for item in value]
+    if not parts:
+        if isinstance(value, str) and not endpoints.is_url(value) and os.path.isfile(value):
+            return FileBase64(prepare(value))
+        return value
+    if isinstance(value, dict) and parts[0] in value:
+        value = dict(value)
+        value[parts[0]] = _resolve_media(value[parts[0]], parts[1:], prepare)
+    return value
+
+
+def build_payload(kind, params):
+    """根据任务参数构建请求体
+
+    参数:
+        kind: str, 任务类型
+        params: dict, 请求参数，媒体字段可以是本地文件路径
+    返回:
+        dict, 请求体
+    """
+    job_kind = get_kind(kind)
+
+    def prepare(path, lossless):
+        # 只在确实有本地文件时才导入预处理模块，纯文本任务的命令行调用不为它付出启动时间
+        from dmxapi.preprocess import get_preprocessor
+
+        return get_preprocessor().prepare(path, job_kind.endpoint, params.get("aspect_ratio"), lossless)
+
+    payload = params
+    for field in job_kind.media_fields:
+        # 开启图片预处理时先处理本地图片（音频等非图片文件原样上传），遮罩保持无损
+        lossless = "mask" in field
+        payload = _resolve_media(payload, field.split("."), lambda path, lossless=lossless: prepare(path, lossless))
+    return payload
+
+
+def stats_key(kind, params):
+    """任务的耗时统计 key：(endpoint, model_name, mode, duration)"""
+    source = params["input"] if isinstance(params.get("input"), dict) else params
+    return (
+        get_kind(kind).endpoint,
+        source.get("model_name", params.get("botType", "")),
+        source.get("mode", params.get("mode", "")),
+        source.get("duration", ""),
+    )
+
+
+def limit_key(kind, params):
+    """任务的提交限制 key：(endpoint, model_name, mode)，即 SubmitScheduler.acquire 的参数"""
+    return stats_key(kind, params)[:3]
+
+
+def submit_job(pool, headers, kind, params, callback_url=""):
+    """提交一个任务
+
+    参数:
+        pool: ConnectionPool
+        headers: dict, 请求头
+        kind: str, 任务类型
+        params: dict, 请求参数
+        callback_url: str, 可选，回调地址，参数中已填写回调地址时以参数为准
+    返回:
+        task_id: 生成任务的 id
+    """
+    job_kind = get_kind(kind)
+    payload = build_payload(kind, params)
+    if callback_url:
+        # Kling 使用 callback_url，Midjourney 使用 notifyHook
+        payload = dict(payload)
+        payload.setdefault("notifyHook" if job_kind.midjourney else "callback_url", callback_url)
+    body = StreamingJSONBody(payload)
+    res = pool.request("POST", job_kind.endpoint, body, headers)
+    json_data = json.loads(res.read().decode("utf-8"))
+    if job_kind.midjourney:
+        if json_data.get('code') == endpoints.MJ_SUCCESS_CODE:
+            return json_data['result']
+        raise Exception(f"API调用失败：{json_data.get('description')}")
+    if 'code' in json_data and json_data['code'] == 0:
+        return json_data['data']['task_id']
+    raise Exception(f"API调用失败：{json_data['message']}")
+
+
+def register_job(poller, headers, kind, task_id, timeout, callback=None, stats_key=None, push=None):
+    """把已提交的任务注册到轮询器，push 含义与 Poller.register 一致
+
+    返回:
+        Future, 与 Poller.register 一致
+    """
+    job_kind = get_kind(kind)
+    if job_kind.midjourney:
+        return poller.register(job_kind.endpoint, task_id, headers, interval=job_kind.interval, timeout=timeout,
+                               callback=callback, stats_key=stats_key, push=push,
+                               query_path=endpoints.MJ_FETCH.format(task_id=task_id),
+                               parse=endpoints.parse_midjourney)
+    return poller.register(job_kind.endpoint, task_id, headers, interval=job_kind.interval, timeout=timeout,
+                           callback=callback, stats_key=stats_key, push=push)
+
+
+def job_result(kind, data):
+    """从任务结束时的数据中取出需要保存的结果"""
+    if get_kind(kind).midjourney:
+        return {key: data.get(key) for key in ("imageUrl", "status", "buttons") if key in data}
+    return data.get('task_result')
+
+
+def result_urls(kind, result):
+    """取出 job_result 中全部图像、视频 url"""
+    if get_kind(kind).midjourney:
+        return [result['imageUrl']] if result.get('imageUrl') else []
+    result = result or {}
+    return [item['url'] for item in result.get('images', []) + result.get('videos', [])]
@@ -0,0 +1,406 @@
+"""SQLite 任务日志
+
+视频任务要轮询数分钟，task_id 只保存在局部变量里时，进程重启后任务就丢了，
+但服务端仍会完成任务并计费。TaskJournal 在提交前把任务写入本地 SQLite 文件，
+收到 task_id 后立即补记，任务结束时写入结果；重启后调用客户端的 resume() 把上次未结束的任务重新接入轮询。
+
+任务状态:
+    submitting  已写入日志、尚未收到 task_id；进程在此时退出的任务无法确定是否提交成功
+    submitted   已提交，等待结果
+    succeed / failed / timeout / error / cancelled  已结束
+
+默认关闭，通过环境变量 DMXAPI_JOURNAL 指定日志文件（例如 ~/.dmxapi/journal.sqlite3），或在代码中开启:
+    configure_journal("~/.dmxapi/journal.sqlite3")
+设置为 :memory: 时只在本进程内记录，不落盘。
+
+用法:
+    python -m dmxapi.journal                      # 按接口和状态汇总
+    python -m dmxapi.journal --status submitted --older-than 600
+    python -m dmxapi.journal --endpoint /kling/v1/videos/text2video --limit 20
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from dmxapi import endpoints
+from dmxapi.poller import TaskFailedError
+
+# 命令行查看日志时的默认文件，也是建议的日志位置
+DEFAULT_JOURNAL_PATH = os.path.join(os.path.expanduser("~"), ".dmxapi", "journal.sqlite3")
+# 恢复已超过截止时间的任务时，至少再轮询的时间（秒），服务端可能早已完成
+RESUME_MIN_TIMEOUT = 60
+
+STATUS_SUBMITTING = "submitting"
+STATUS_SUBMITTED = "submitted"
+# 查询结果解析函数与日志中保存的名称
+PARSERS = {
+    "kling": endpoints.parse_kling,
+    "midjourney": endpoints.parse_midjourney,
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    api_url TEXT NOT NULL,
+    endpoint TEXT NOT NULL,
+    task_id TEXT,
+    params_hash TEXT NOT NULL,
+    token_hash TEXT NOT NULL,
+    status TEXT NOT NULL,
+    submitted_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    deadline REAL,
+    poll TEXT,
+    result TEXT,
+    error TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS tasks_task_id ON tasks (task_id, api_url);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, submitted_at);
+CREATE INDEX IF NOT EXISTS tasks_endpoint ON tasks (endpoint, status, submitted_at);
+"""
+
+_COLUMNS = ("id", "api_url", "endpoint", "task_id", "params_hash", "status", "submitted_at", "updated_at",
+            "deadline", "result", "error")
+
+
+def params_hash(params):
+    """请求参数的哈希，本地文件按路径、大小和修改时间计入，不读取文件内容"""
+    def default(value):
+        path = getattr(value, "path", None)
+        if path is None:
+            raise TypeError(f"无法序列化 {type(value).__name__}")
+        stat = os.stat(path)
+        return {"path": os.path.abspath(path), "size": stat.st_size, "mtime": stat.st_mtime}
+    text = json.dumps(params, sort_keys=True, ensure_ascii=False, default=default)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _token_hash(headers):
+    """API 密钥的指纹，只用于恢复时匹配同一密钥提交的任务，日志中不保存密钥本身"""
+    token = (headers or {}).get('Authorization', "")
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()[:16]
+
+
+class TaskJournal:
+    def __init__(self, api_url, path=None):
+        """初始化任务日志
+
+        参数:
+            api_url: API 节点地址，恢复任务时只接管同一节点的任务
+            path: str, SQLite 文件路径，None 表示关闭日志（register 直接交给轮询器，其余方法不做任何事）
+        """
+        self.api_url = api_url
+        self.path = os.path.expanduser(path) if path else None
+        self._lock = threading.Lock()
+        self._conn = None
+        # 已在本进程中跟踪的 task_id，恢复时跳过
+        self._tracked = set()
+        # 已执行过恢复的密钥指纹
+        self._resumed = set()
+        # 恢复接管的任务：task_id -> Future
+        self.resumed = {}
+        if self.path is None:
+            return
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        # 轮询器在自己的线程中回调写入结果，连接由锁保护
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            # WAL 模式下写入只追加日志，进程崩溃不会丢失已提交的记录
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+
+    @property
+    def enabled(self):
+        return self._conn is not None
+
+    def _execute(self, sql, args=()):
+        with self._lock:
+            return self._conn.execute(sql, args)
+
+    def _fetch(self, sql, args=()):
+        # 读取结果也在锁内完成，避免与其他线程的写入交错使用同一连接
+        if not self.enabled:
+            return []
+        with self._lock:
+            return self._conn.execute(sql, args).fetchall()
+
+    def begin(self, endpoint, params, headers):
+        """提交前写入一条任务记录
+
+        参数:
+            endpoint: str, 提交接口
+            params: dict, 请求体，可以包含 FileBase64
+            headers: dict, 请求头，用于记录密钥指纹
+        返回:
+            int, 记录 id，收到 task_id 后传给 submitted；日志关闭时为 None
+        """
+        if not self.enabled:
+            return None
+        now = time.time()
+        cursor = self._execute(
+            "INSERT INTO tasks (api_url, endpoint, params_hash, token_hash, status, submitted_at, updated_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (self.api_url, endpoint, params_hash(params), _token_hash(headers), STATUS_SUBMITTING, now, now))
+        return cursor.lastrowid
+
+    def submitted(self, entry, task_id):
+        """记录提交得到的 task_id"""
+        if entry is None:
+            return
+        with self._lock:
+            # 同一节点的 task_id 不会重复，已有的同名记录只可能来自被重置的测试服务，以新记录为准
+            self._conn.execute("DELETE FROM tasks WHERE task_id = ? AND api_url = ? AND id != ?",
+                               (task_id, self.api_url, entry))
+            self._conn.execute("UPDATE tasks SET task_id = ?, status = ?, updated_at = ? WHERE id = ?",
+                               (task_id, STATUS_SUBMITTED, time.time(), entry))
+
+    def abandon(self, entry, error):
+        """记录提交失败"""
+        if entry is None:
+            return
+        self._execute("UPDATE tasks SET status = 'error', error = ?, updated_at = ? WHERE id = ?",
+                      (str(error), time.time(), entry))
+
+    def register(self, poller, endpoint, task_id, headers, interval=1, timeout=600, stats_key=None,
+                 query_path=None, parse=endpoints.parse_kling, push=None, callback=None):
+        """把任务注册到轮询器，并在任务结束时把结果写回日志
+
+        参数与 Poller.register 一致；轮询配置一并写入日志，供重启后恢复。
+        task_id 不在日志中时（例如由其他程序提交）会补记一条。
+
+        返回:
+            Future, 与 Poller.register 一致
+        """
+        if not self.enabled:
+            future = poller.register(endpoint, task_id, headers, interval=interval, timeout=timeout,
+                                     stats_key=stats_key, query_path=query_path, parse=parse, push=push)
+            if callback:
+                future.add_done_callback(callback)
+            return future
+        poll = json.dumps({
+            "interval": interval,
+            "stats_key": list(stats_key) if stats_key else None,
+            "query_path": query_path,
+            "parser": next(name for name, func in PARSERS.items() if func is parse),
+        })
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE tasks SET deadline = ?, poll = ?, updated_at = ? WHERE task_id = ? AND api_url = ?",
+                (now + timeout, poll, now, task_id, self.api_url))
+            if not cursor.rowcount:
+                self._conn.execute(
+                    "INSERT INTO tasks (api_url, endpoint, task_id, params_hash, token_hash, status, submitted_at,"
+                    " updated_at, deadline, poll) VALUES (?, ?, ?, '', ?, ?, ?, ?, ?, ?)",
+                    (self.api_url, endpoint, task_id, _token_hash(headers), STATUS_SUBMITTED, now, now,
+                     now + timeout, poll))
+            self._tracked.add(task_id)
+        future = poller.register(endpoint, task_id, headers, interval=interval, timeout=timeout,
+                                 stats_key=stats_key, query_path=query_path, parse=parse, push=push)
+        future.add_done_callback(lambda done: self._finish(task_id, done))
+        if callback:
+            future.add_done_callback(callback)
+        return future
+
+    def _finish(self, task_id, future):
+        result = error = None
+        if future.cancelled():
+            status = "cancelled"
+        elif isinstance(future.exception(), TaskFailedError):
+            status, error = endpoints.STATUS_FAILED, str(future.exception())
+        elif future.exception() is not None:
+            status, error = "error", str(future.exception())
+        elif future.result() is None:
+            status = "timeout"
+        else:
+            status, result = endpoints.STATUS_SUCCEED, json.dumps(future.result(), ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "UPDATE tasks SET status = ?, result = ?, error = ?, updated_at = ? WHERE task_id = ? AND api_url = ?",
+                (status, result, error, time.time(), task_id, self.api_url))
+            self._tracked.discard(task_id)
+
+    def resume(self, poller, headers, endpoint=None, callback=None):
+        """把上次进程退出时仍未结束的任务重新接入轮询，同一密钥和接口只执行一次
+
+        只接管同一节点、同一密钥提交的任务；已超过截止时间的任务再轮询 RESUME_MIN_TIMEOUT 秒。
+
+        参数:
+            poller: Poller
+            headers: dict, 查询请求头
+            endpoint: str, 可选，只接管该提交接口的任务，默认接管全部接口
+            callback: 可选，每个任务结束时以 Future 为参数调用
+        返回:
+            dict, task_id -> Future，结果同时写回日志，并汇总到 resumed 属性
+        """
+        if not self.enabled:
+            return {}
+        token_hash = _token_hash(headers)
+        sql = "SELECT endpoint, task_id, deadline, poll FROM tasks WHERE status = ? AND api_url = ? AND token_hash = ?"
+        args = [STATUS_SUBMITTED, self.api_url, token_hash]
+        if endpoint is not None:
+            sql += " AND endpoint = ?"
+            args.append(endpoint)
+        with self._lock:
+            # 已接管全部接口后，再按单个接口恢复不会有新的任务
+            if (token_hash, None) in self._resumed or (token_hash, endpoint) in self._resumed:
+                return {}
+            self._resumed.add((token_hash, endpoint))
+            rows = self._conn.execute(sql + " ORDER BY submitted_at", args).fetchall()
+            rows = [row for row in rows if row["task_id"] not in self._tracked]
+        futures = {}
+        now = time.time()
+        for row in rows:
+            poll = json.loads(row["poll"] or "{}")
+            timeout = max((row["deadline"] or now) - now, RESUME_MIN_TIMEOUT)
+            futures[row["task_id"]] = self.register(
+                poller, row["endpoint"], row["task_id"], headers, interval=poll.get("interval", 1), timeout=timeout,
+                stats_key=tuple(poll["stats_key"]) if poll.get("stats_key") else None,
+                query_path=poll.get("query_path"), parse=PARSERS[poll.get("parser", "kling")], callback=callback)
+        self.resumed.update(futures)
+        return futures
+
+    def get(self, task_id):
+        """按 task_id 查询一条记录，不存在时返回 None"""
+        rows = self._fetch(f"SELECT {', '.join(_COLUMNS)} FROM tasks WHERE task_id = ? ORDER BY id DESC LIMIT 1",
+                           (task_id,))
+        return _record(rows[0]) if rows else None
+
+    def query(self, status=None, endpoint=None, older_than=None, newer_than=None, limit=100):
+        """按状态、接口和提交时间查询记录，按提交时间升序
+
+        参数:
+            status: str 或 tuple, 任务状态
+            endpoint: str, 提交接口
+            older_than: float, 只返回提交超过该秒数的任务
+            newer_than: float, 只返回提交不超过该秒数的任务
+            limit: int, 最多返回的记录数
+        返回:
+            list, 记录字典，result 已解析为对象
+        """
+        clauses, args = [], []
+        if status:
+            statuses = (status,) if isinstance(status, str) else tuple(status)
+            clauses.append(f"status IN ({', '.join('?' * len(statuses))})")
+            args.extend(statuses)
+        if endpoint:
+            clauses.append("endpoint = ?")
+            args.append(endpoint)
+        now = time.time()
+        if older_than is not None:
+            clauses.append("submitted_at <= ?")
+            args.append(now - older_than)
+        if newer_than is not None:
+            clauses.append("submitted_at >= ?")
+            args.append(now - newer_than)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._fetch(f"SELECT {', '.join(_COLUMNS)} FROM tasks{where} ORDER BY submitted_at LIMIT ?",
+                           args + [limit])
+        return [_record(row) for row in rows]
+
+    def summary(self):
+        """按接口和状态汇总任务数和最早提交时间
+
+        返回:
+            list, {"endpoint", "status", "count", "oldest_age"}
+        """
+        rows = self._fetch(
+            "SELECT endpoint, status, COUNT(*) AS count, MIN(submitted_at) AS oldest FROM tasks"
+            " GROUP BY endpoint, status ORDER BY endpoint, status")
+        now = time.time()
+        return [{"endpoint": row["endpoint"], "status": row["status"], "count": row["count"],
+                 "oldest_age": round(now - row["oldest"], 1)} for row in rows]
+
+    def prune(self, older_than):
+        """删除提交超过 older_than 秒的已结束记录
+
+        返回:
+            int, 删除的记录数
+        """
+        if not self.enabled:
+            return 0
+        cursor = self._execute("DELETE FROM tasks WHERE status NOT IN (?, ?) AND submitted_at <= ?",
+                               (STATUS_SUBMITTING, STATUS_SUBMITTED, time.time() - older_than))
+        return cursor.rowcount
+
+    def close(self):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._conn.close()
+
+
+def _record(row):
+    record = dict(row)
+    if record["result"]:
+        record["result"] = json.loads(record["result"])
+    return record
+
+
+# 按节点共享的任务日志
+_journals = {}
+_journals_lock = threading.Lock()
+# configure_journal 设置的日志文件，未设置时使用环境变量 DMXAPI_JOURNAL
+_configured_path = None
+_configured = False
+
+
+def configure_journal(path):
+    """开启（或用 path=None 关闭）共享的任务日志，之后创建的客户端使用新的设置
+
+    参数:
+        path: str, SQLite 文件路径，例如 DEFAULT_JOURNAL_PATH
+    """
+    global _configured_path, _configured
+    with _journals_lock:
+        _configured_path, _configured = path, True
+        # 已有的日志不关闭，仍在轮询的任务结束时继续写回原来的文件
+        _journals.clear()
+
+
+def get_journal(api_url):
+    """获取节点共享的任务日志，未通过 DMXAPI_JOURNAL 或 configure_journal 开启时为关闭状态
+
+    参数:
+        api_url: API 节点地址
+    返回:
+        TaskJournal
+    """
+    with _journals_lock:
+        journal = _journals.get(api_url)
+        if journal is None:
+            path = _configured_path if _configured else os.environ.get("DMXAPI_JOURNAL") or None
+            journal = _journals[api_url] = TaskJournal(api_url, path)
+        return journal
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="查看 DMXAPI 任务日志")
+    parser.add_argument("--path", default=os.environ.get("DMXAPI_JOURNAL", DEFAULT_JOURNAL_PATH), help="日志文件")
+    parser.add_argument("--status", action="append", help="按任务状态筛选，可重复")
+    parser.add_argument("--endpoint", help="按提交接口筛选")
+    parser.add_argument("--older-than", type=float, help="只列出提交超过该秒数的任务")
+    parser.add_argument("--newer-than", type=float, help="只列出提交不超过该秒数的任务")
+    parser.add_argument("--limit", type=int, default=100, help="最多列出的任务数")
+    parser.add_argument("--prune", type=float, metavar="SECONDS", help="删除提交超过该秒数的已结束任务")
+    args = parser.parse_args(argv)
+
+    journal = TaskJournal("", path=args.path)
+    if args.prune is not None:
+        print(json.dumps({"pruned": journal.prune(args.prune)}))
+    elif args.status or args.endpoint or args.older_than is not None or args.newer_than is not None:
+        for record in journal.query(args.status, args.endpoint, args.older_than, args.newer_than, args.limit):
+            print(json.dumps(record, ensure_ascii=False))
+    else:
+        print(json.dumps(journal.summary(), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
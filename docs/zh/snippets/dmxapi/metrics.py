@@ -0,0 +1,270 @@
+"""请求耗时与任务指标
+
+连接池在每次请求时记录建连、TLS 握手、发送、首字节（TTFB）和读取响应体的耗时以及收发字节数，
+轮询器在任务结束时记录查询次数、排队时间和生成时间。指标可以导出为 Prometheus 文本格式，
+也可以通过 snapshot() 在进程内读取。
+
+默认关闭，关闭时每次请求只多几次计时调用；调用 enable_metrics() 或设置环境变量 DMXAPI_METRICS=1 开启。
+
+用法:
+    from dmxapi import enable_metrics, prometheus_text, serve_metrics
+    enable_metrics()
+    serve_metrics(9464)  # Prometheus 抓取 http://127.0.0.1:9464/metrics
+"""
+import os
+import threading
+
+# 耗时直方图的桶（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+# 次数直方图的桶
+COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+# 指标名 -> (类型, 说明, 直方图桶)
+METRICS = {
+    "dmxapi_http_requests_total": ("counter", "HTTP 请求数", None),
+    "dmxapi_http_request_bytes_total": ("counter", "请求体字节数", None),
+    "dmxapi_http_response_bytes_total": ("counter", "响应体字节数", None),
+    "dmxapi_http_connections_total": ("counter", "请求使用的连接数，按新建/复用区分", None),
+    "dmxapi_http_connect_seconds": ("histogram", "新建连接耗时（含 TLS 握手）", DEFAULT_BUCKETS),
+    "dmxapi_http_tls_seconds": ("histogram", "TLS 握手耗时", DEFAULT_BUCKETS),
+    "dmxapi_http_send_seconds": ("histogram", "发送请求头和请求体的耗时", DEFAULT_BUCKETS),
+    "dmxapi_http_ttfb_seconds": ("histogram", "发送完成到收到响应头的耗时", DEFAULT_BUCKETS),
+    "dmxapi_http_body_read_seconds": ("histogram", "读取响应体的耗时", DEFAULT_BUCKETS),
+    "dmxapi_http_retries_total": ("counter", "请求重试次数，按失败类别区分", None),
+    "dmxapi_circuit_state": ("gauge", "接口熔断器状态：0 关闭，1 半开，2 打开", None),
+    "dmxapi_tasks_total": ("counter", "结束的任务数", None),
+    "dmxapi_task_polls": ("histogram", "每个任务的状态查询次数", COUNT_BUCKETS),
+    "dmxapi_task_queue_seconds": ("histogram", "任务排队时间（首次查询到 processing 之前）", DEFAULT_BUCKETS),
+    "dmxapi_task_generation_seconds": ("histogram", "任务生成时间（processing 到结束）", DEFAULT_BUCKETS),
+    "dmxapi_task_seconds": ("histogram", "任务从注册到结束的总时间", DEFAULT_BUCKETS),
+    "dmxapi_submit_wait_seconds": ("histogram", "提交前在本地等待许可的时间", DEFAULT_BUCKETS),
+    "dmxapi_submit_dropped_total": ("counter", "等待超时或无法在截止时间前完成而放弃提交的任务数", None),
+    "dmxapi_submit_queue_depth": ("gauge", "本地排队等待提交许可的任务数", None),
+}
+
+# 是否记录指标，由 enable_metrics / disable_metrics 切换
+ENABLED = os.environ.get("DMXAPI_METRICS", "") not in ("", "0")
+
+
+class Registry:
+    def __init__(self):
+        """进程内的指标存储，按 (指标名, 标签) 聚合"""
+        self._lock = threading.Lock()
+        # 计数器和仪表盘：(指标名, 标签元组) -> 值
+        self._counters = {}
+        # 直方图：(指标名, 标签元组) -> [各桶计数..., 总和, 总数]
+        self._histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = value
+
+    def observe(self, name, value, **labels):
+        buckets = METRICS[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            state = self._histograms.get(key)
+            if state is None:
+                state = self._histograms[key] = [0] * (len(buckets) + 2)
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def snapshot(self):
+        """返回当前指标
+
+        返回:
+            dict, 指标名 -> 样本列表；计数器和仪表盘样本为 {"labels", "value"}，
+            直方图样本为 {"labels", "count", "sum", "buckets": {上界: 累计计数}}
+        """
+        result = {}
+        with self._lock:
+            for (name, labels), value in self._counters.items():
+                result.setdefault(name, []).append({"labels": dict(labels), "value": value})
+            for (name, labels), state in self._histograms.items():
+                buckets = METRICS[name][2]
+                result.setdefault(name, []).append({
+                    "labels": dict(labels),
+                    "count": state[-1],
+                    "sum": state[-2],
+                    "buckets": dict(zip(buckets, state[:len(buckets)])),
+                })
+        return result
+
+    def prometheus_text(self):
+        """按 Prometheus 文本格式导出全部指标"""
+        lines = []
+        snapshot = self.snapshot()
+        for name, (kind, help_text, buckets) in METRICS.items():
+            samples = snapshot.get(name)
+            if not samples:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for sample in samples:
+                labels = sample["labels"]
+                if kind != "histogram":
+                    lines.append(f"{name}{_format_labels(labels)} {sample['value']}")
+                    continue
+                for bound, count in sample["buckets"].items():
+                    lines.append(f"{name}_bucket{_format_labels(labels, le=bound)} {count}")
+                lines.append(f"{name}_bucket{_format_labels(labels, le='+Inf')} {sample['count']}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {sample['sum']}")
+                lines.append(f"{name}_count{_format_labels(labels)} {sample['count']}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels, **extra):
+    items = list(labels.items()) + list(extra.items())
+    if not items:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in items)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(items, escaped)) + "}"
+
+
+# 进程内共享的指标存储
+registry = Registry()
+
+
+def enable_metrics():
+    """开始记录指标"""
+    global ENABLED
+    ENABLED = True
+
+
+def disable_metrics():
+    """停止记录指标，已记录的数据保留"""
+    global ENABLED
+    ENABLED = False
+
+
+def snapshot():
+    """返回当前指标，格式见 Registry.snapshot"""
+    return registry.snapshot()
+
+
+def prometheus_text():
+    """返回 Prometheus 文本格式的指标"""
+    return registry.prometheus_text()
+
+
+def record_request(method, route, status, timings, reused):
+    """记录一次 HTTP 请求
+
+    参数:
+        method: str, 请求方法
+        route: str, 去掉任务 id 的路径模板，避免标签基数随任务数增长
+        status: int, 响应状态码
+        timings: dict, 连接池记录的各阶段耗时和字节数
+        reused: bool, 是否复用了已有连接
+    """
+    registry.inc("dmxapi_http_requests_total", method=method, route=route, status=status)
+    registry.inc("dmxapi_http_connections_total", kind="reused" if reused else "new")
+    registry.inc("dmxapi_http_request_bytes_total", timings["request_bytes"], route=route)
+    registry.inc("dmxapi_http_response_bytes_total", timings["response_bytes"], route=route)
+    if timings.get("connect") is not None:
+        registry.observe("dmxapi_http_connect_seconds", timings["connect"])
+    if timings.get("tls") is not None:
+        registry.observe("dmxapi_http_tls_seconds", timings["tls"])
+    registry.observe("dmxapi_http_send_seconds", timings["send"], route=route)
+    registry.observe("dmxapi_http_ttfb_seconds", timings["ttfb"], route=route)
+    registry.observe("dmxapi_http_body_read_seconds", timings["read"], route=route)
+
+
+def record_retry(route, category):
+    """记录一次请求重试"""
+    registry.inc("dmxapi_http_retries_total", route=route, category=category)
+
+
+def set_circuit_state(route, state):
+    """更新接口熔断器状态"""
+    registry.set("dmxapi_circuit_state", state, route=route)
+
+
+def record_task(endpoint, outcome, polls, total, queue=None, generation=None):
+    """记录一个结束的任务
+
+    参数:
+        endpoint: str, 提交接口
+        outcome: str, succeed / failed / timeout / error / cancelled
+        polls: int, 状态查询次数
+        total: float, 从注册到结束的时间（秒）
+        queue: float, 可选，排队时间
+        generation: float, 可选，生成时间
+    """
+    registry.inc("dmxapi_tasks_total", endpoint=endpoint, outcome=outcome)
+    registry.observe("dmxapi_task_polls", polls, endpoint=endpoint)
+    registry.observe("dmxapi_task_seconds", total, endpoint=endpoint, outcome=outcome)
+    if queue is not None:
+        registry.observe("dmxapi_task_queue_seconds", queue, endpoint=endpoint)
+    if generation is not None:
+        registry.observe("dmxapi_task_generation_seconds", generation, endpoint=endpoint)
+
+
+def record_submit_wait(endpoint, priority, waited, dropped=None):
+    """记录一次提交许可的等待
+
+    参数:
+        endpoint: str, 提交接口
+        priority: str, 优先级
+        waited: float, 等待时间（秒）
+        dropped: str, 可选，放弃提交的原因：timeout / expired
+    """
+    registry.observe("dmxapi_submit_wait_seconds", waited, endpoint=endpoint, priority=priority)
+    if dropped:
+        registry.inc("dmxapi_submit_dropped_total", endpoint=endpoint, priority=priority, reason=dropped)
+
+
+def set_submit_queue_depth(priority, depth):
+    """更新某个优先级的排队任务数"""
+    registry.set("dmxapi_submit_queue_depth", depth, priority=priority)
+
+
+def _handler_class():
+    # http.server 只在启动抓取接口时导入，不拖慢命令行等短进程的启动
+    from http.server import BaseHTTPRequestHandler
+
+    class _MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            data = prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return _MetricsHandler
+
+
+def serve_metrics(port=9464, host="127.0.0.1"):
+    """在后台线程中启动 /metrics 接口供 Prometheus 抓取，同时开启指标记录
+
+    返回:
+        ThreadingHTTPServer, 调用 shutdown() 停止
+    """
+    from http.server import ThreadingHTTPServer
+
+    enable_metrics()
+    server = ThreadingHTTPServer((host, port), _handler_class())
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="dmxapi-metrics", daemon=True).start()
+    return server
@@ -0,0 +1,545 @@
+"""离线 DMXAPI 模拟服务
+
+实现示例代码用到的 Kling 与 Midjourney 接口，返回与线上一致的 code / data.task_status / task_result 结构，
+排队时间、生成时间、失败率、429 限流、并行任务上限和断开连接都可以配置，用于在不消耗额度的情况下压测和对比各项优化。
+
+用法:
+    python -m dmxapi.mock_server --port 8000 --profile flaky
+    # 客户端使用 API_URL = "http://127.0.0.1:8000"
+
+    # 或在代码中启动
+    server = MockServer(MockProfile(queue_time=0.2, video_time=(2, 4))).start()
+    client = KlingTextToVideo("sk-test", server.url)
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import random
+import threading
+import time
+import urllib.parse
+import urllib.request
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from dmxapi import endpoints
+
+# 结果为图像的接口，其余 Kling 接口结果为视频
+IMAGE_ENDPOINTS = (endpoints.TEXT_TO_IMAGE, endpoints.VIRTUAL_TRY_ON)
+KLING_ENDPOINTS = (
+    endpoints.TEXT_TO_IMAGE,
+    endpoints.TEXT_TO_VIDEO,
+    endpoints.IMAGE_TO_VIDEO,
+    endpoints.VIDEO_EXTEND,
+    endpoints.LIP_SYNC,
+    endpoints.VIDEO_EFFECTS,
+    endpoints.VIRTUAL_TRY_ON,
+)
+# 模拟结果文件的路径前缀
+FILES_PREFIX = "/mock/files/"
+# 管理接口：GET 返回请求计数，POST reset 清零计数
+STATS_PATH = "/mock/stats"
+RESET_PATH = "/mock/reset"
+
+
+class MockProfile:
+    def __init__(self, queue_time=0.5, image_time=(1, 2), video_time=(3, 5), latency=0, error_rate=0,
+                 submit_error_rate=0, throttle_rate=0, max_qps=None, max_running=None, drop_rate=0,
+                 server_error_rate=0, file_size=64 * 1024, url_ttl=None, callbacks=True, seed=None):
+        """模拟服务的延迟与故障配置
+
+        时间参数可以是固定秒数，也可以是 (最小值, 最大值) 表示均匀随机。
+
+        参数:
+            queue_time: 任务排队时间（状态为 submitted）
+            image_time: 图像任务生成时间（状态为 processing）
+            video_time: 视频任务生成时间
+            latency: 每个请求的响应延迟
+            error_rate: float, 任务最终失败的比例
+            submit_error_rate: float, 提交时直接返回业务错误的比例
+            throttle_rate: float, 随机返回 429 的比例
+            max_qps: float, 可选，全局 QPS 上限，超出部分返回 429
+            max_running: int, 可选，每个模型同时进行中的任务数上限，超出的提交返回 429（code 1303）
+            drop_rate: float, 不返回响应直接断开连接的比例
+            server_error_rate: float, 随机返回 503（code 5001）的比例
+            file_size: int, 结果文件大小（字节）
+            url_ttl: float, 可选，结果 url 的有效期（秒），设置后 url 带 x-oss-expires 签名参数，过期后返回 403
+            callbacks: bool, 是否向 callback_url / notifyHook 推送结果
+            seed: int, 可选，随机种子，便于复现
+        """
+        self.queue_time = queue_time
+        self.image_time = image_time
+        self.video_time = video_time
+        self.latency = latency
+        self.error_rate = error_rate
+        self.submit_error_rate = submit_error_rate
+        self.throttle_rate = throttle_rate
+        self.max_qps = max_qps
+        self.max_running = max_running
+        self.drop_rate = drop_rate
+        self.server_error_rate = server_error_rate
+        self.file_size = file_size
+        self.url_ttl = url_ttl
+        self.callbacks = callbacks
+        self.seed = seed
+
+
+# 预置配置
+PROFILES = {
+    # 几乎没有等待，用于测试客户端自身开销
+    "fast": MockProfile(queue_time=0, image_time=0.2, video_time=0.5),
+    # 接近线上的排队与生成时间
+    "realistic": MockProfile(queue_time=(1, 5), image_time=(8, 20), video_time=(60, 180), latency=(0.05, 0.2)),
+    # 高失败率、限流和断连，用于测试重试与容错
+    "flaky": MockProfile(queue_time=0.5, image_time=(1, 2), video_time=(2, 4), latency=(0, 0.1),
+                         error_rate=0.05, submit_error_rate=0.05, throttle_rate=0.1, drop_rate=0.05),
+}
+
+
+def _model_of(payload):
+    """任务所属的模型和模式，用于模拟按模型计算的并行任务上限"""
+    source = payload['input'] if isinstance(payload.get('input'), dict) else payload
+    return source.get('model_name', payload.get('botType')), source.get('mode')
+
+
+class _MockTask:
+    __slots__ = ("task_id", "endpoint", "payload", "created", "queued_until", "done_at", "fails", "count")
+
+    def __init__(self, task_id, endpoint, payload, created, queued_until, done_at, fails, count):
+        self.task_id = task_id
+        self.endpoint = endpoint
+        self.payload = payload
+        self.created = created
+        self.queued_until = queued_until
+        self.done_at = done_at
+        self.fails = fails
+        self.count = count
+
+
+class _MockHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # 压测时会有大量并发连接，默认的 listen 队列长度 5 太小
+    request_queue_size = 1024
+
+
+class _MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # 响应头和响应体分两次写出，关闭 Nagle 避免与客户端的延迟确认叠加出 40ms 等待
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        self.server.mock.handle(self, "POST", body)
+
+    def do_GET(self):
+        self.server.mock.handle(self, "GET", b"")
+
+    def send_json(self, status, obj):
+        data = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockServer:
+    def __init__(self, profile=None, host="127.0.0.1", port=0):
+        """初始化模拟服务
+
+        参数:
+            profile: MockProfile 或 PROFILES 中的名称，默认 MockProfile()
+            host: str, 监听地址
+            port: int, 监听端口，0 表示随机端口
+        """
+        if isinstance(profile, str):
+            profile = PROFILES[profile]
+        self.profile = profile or MockProfile()
+        self.host = host
+        self.port = port
+        self._random = random.Random(self.profile.seed)
+        self._tasks = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._server = None
+        # 限流窗口：当前秒与该秒内的请求数
+        self._window = (0, 0)
+        self.reset()
+
+    def reset(self):
+        """清零请求计数"""
+        with self._lock:
+            self.counts = {"requests": 0, "submits": 0, "queries": 0, "files": 0, "throttled": 0, "dropped": 0,
+                           "server_errors": 0, "submit_errors": 0, "callbacks": 0, "rejected": 0}
+            # 第一次与最后一次提交的时间，用于计算提交速率
+            self.first_submit = None
+            self.last_submit = None
+
+    @property
+    def url(self):
+        """客户端使用的 API 节点地址"""
+        return f"http://{self.host}:{self.port}"
+
+    def start(self):
+        """在后台线程中启动服务
+
+        返回:
+            MockServer, 便于链式调用
+        """
+        self._server = _MockHTTPServer((self.host, self.port), _MockHandler)
+        self._server.mock = self
+        self.port = self._server.server_port
+        threading.Thread(target=self._server.serve_forever, name="dmxapi-mock", daemon=True).start()
+        return self
+
+    def close(self):
+        """停止服务"""
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def stats(self):
+        """返回请求计数"""
+        with self._lock:
+            return dict(self.counts, tasks=len(self._tasks), first_submit=self.first_submit,
+                        last_submit=self.last_submit)
+
+    def _duration(self, value):
+        if isinstance(value, (tuple, list)):
+            with self._lock:
+                return self._random.uniform(*value)
+        return value
+
+    def _chance(self, rate):
+        if not rate:
+            return False
+        with self._lock:
+            return self._random.random() < rate
+
+    def _count(self, key):
+        with self._lock:
+            self.counts[key] += 1
+
+    def _over_qps(self):
+        """按秒计数的全局 QPS 上限"""
+        if not self.profile.max_qps:
+            return False
+        second = int(time.monotonic())
+        with self._lock:
+            current, used = self._window
+            if current != second:
+                current, used = second, 0
+            self._window = (current, used + 1)
+            return used >= self.profile.max_qps
+
+    def handle(self, handler, method, body):
+        """处理一个请求：依次模拟延迟、断连、限流，再分发到具体接口"""
+        path, _, query = handler.path.partition("?")
+        if path == STATS_PATH:
+            handler.send_json(200, self.stats())
+            return
+        if path == RESET_PATH:
+            self.reset()
+            handler.send_json(200, self.stats())
+            return
+        self._count("requests")
+        time.sleep(self._duration(self.profile.latency))
+        if self._chance(self.profile.drop_rate):
+            # 不写任何响应直接关闭连接，客户端会看到 RemoteDisconnected
+            self._count("dropped")
+            handler.close_connection = True
+            return
+        if path.startswith(FILES_PREFIX):
+            self._serve_file(handler, path, query)
+            return
+        if not handler.headers.get('Authorization', "").startswith("Bearer "):
+            handler.send_json(401, {"code": 1000, "message": "身份验证失败"})
+            return
+        if self._over_qps() or self._chance(self.profile.throttle_rate):
+            self._count("throttled")
+            handler.send_json(429, {"code": 1302, "message": "请求过于频繁，请稍后再试"})
+            return
+        if self._chance(self.profile.server_error_rate):
+            self._count("server_errors")
+            handler.send_json(503, {"code": 5001, "message": "服务暂不可用"})
+            return
+        try:
+            payload = json.loads(body.decode("utf-8")) if body else {}
+        except ValueError:
+            handler.send_json(400, {"code": 1200, "message": "请求体不是合法的 JSON"})
+            return
+
+        if method == "POST" and path == endpoints.MJ_IMAGINE:
+            self._submit_midjourney(handler, payload)
+        elif method == "GET" and path.startswith("/mj/task/") and path.endswith("/fetch"):
+            self._fetch_midjourney(handler, path[len("/mj/task/"):-len("/fetch")])
+        elif method == "POST" and path in KLING_ENDPOINTS:
+            self._submit_kling(handler, path, payload)
+        elif method == "GET" and path in KLING_ENDPOINTS:
+            self._list_kling(handler, path, urllib.parse.parse_qs(query))
+        elif method == "GET" and path.rsplit("/", 1)[0] in KLING_ENDPOINTS:
+            self._query_kling(handler, path.rsplit("/", 1)[1])
+        else:
+            handler.send_json(404, {"code": 404, "message": f"未找到接口: {method} {path}"})
+
+    def _create_task(self, endpoint, payload, prefix=""):
+        """创建任务并按配置确定排队、生成时间和最终结果"""
+        now = time.time()
+        generation = self.profile.image_time if endpoint in IMAGE_ENDPOINTS else self.profile.video_time
+        queued_until = now + self._duration(self.profile.queue_time)
+        done_at = queued_until + self._duration(generation)
+        task_id = f"{prefix}{next(self._ids)}{uuid.uuid4().hex[:8]}"
+        count = int(payload.get('n', 1) or 1) if endpoint == endpoints.TEXT_TO_IMAGE else 1
+        task = _MockTask(task_id, endpoint, payload, now, queued_until, done_at,
+                         self._chance(self.profile.error_rate), count)
+        with self._lock:
+            self._tasks[task_id] = task
+            self.counts["submits"] += 1
+            self.first_submit = self.first_submit or now
+            self.last_submit = now
+        callback_url = payload.get('notifyHook') if endpoint == endpoints.MJ_IMAGINE else payload.get('callback_url')
+        if callback_url is None and isinstance(payload.get('input'), dict):
+            callback_url = payload['input'].get('callback_url')
+        # 示例代码中的占位值（例如 "string"）不是合法地址，不推送
+        if self.profile.callbacks and isinstance(callback_url, str) and callback_url.startswith(("http://", "https://")):
+            timer = threading.Timer(done_at - now, self._push, (task, callback_url))
+            timer.daemon = True
+            timer.start()
+        return task
+
+    def _status(self, task):
+        now = time.time()
+        if now < task.queued_until:
+            return endpoints.STATUS_SUBMITTED
+        if now < task.done_at:
+            return endpoints.STATUS_PROCESSING
+        return endpoints.STATUS_FAILED if task.fails else endpoints.STATUS_SUCCEED
+
+    def _file_url(self, task, index, ext):
+        url = f"{self.url}{FILES_PREFIX}{task.task_id}-{index}.{ext}"
+        if self.profile.url_ttl is not None:
+            # 模拟对象存储的签名 url：到期时间从任务完成时算起
+            url += f"?x-oss-expires={int(task.done_at + self.profile.url_ttl)}"
+        return url
+
+    def _kling_data(self, task):
+        status = self._status(task)
+        data = {
+            "task_id": task.task_id,
+            "task_status": status,
+            "task_status_msg": "模拟任务失败" if status == endpoints.STATUS_FAILED else "",
+            "created_at": int(task.created * 1000),
+            "updated_at": int(min(time.time(), task.done_at) * 1000),
+        }
+        if status == endpoints.STATUS_SUCCEED:
+            if task.endpoint in IMAGE_ENDPOINTS:
+                data["task_result"] = {"images": [
+                    {"index": index, "url": self._file_url(task, index, "png")} for index in range(task.count)
+                ]}
+            else:
+                data["task_result"] = {"videos": [
+                    {"id": f"video-{task.task_id}", "url": self._file_url(task, 0, "mp4"), "duration": "5"}
+                ]}
+        return data
+
+    def _midjourney_data(self, task):
+        status = {
+            endpoints.STATUS_SUBMITTED: "SUBMITTED",
+            endpoints.STATUS_PROCESSING: "IN_PROGRESS",
+            endpoints.STATUS_SUCCEED: "SUCCESS",
+            endpoints.STATUS_FAILED: "FAILURE",
+        }[self._status(task)]
+        total = max(task.done_at - task.queued_until, 1e-6)
+        progress = min(100, max(0, int((time.time() - task.queued_until) / total * 100)))
+        return {
+            "id": task.task_id,
+            "action": "IMAGINE",
+            "prompt": task.payload.get('prompt', ""),
+            "status": status,
+            "progress": f"{progress}%",
+            "submitTime": int(task.created * 1000),
+            "finishTime": int(task.done_at * 1000) if status in ("SUCCESS", "FAILURE") else None,
+            "imageUrl": self._file_url(task, 0, "png") if status == "SUCCESS" else "",
+            "failReason": "模拟任务失败" if status == "FAILURE" else "",
+        }
+
+    def _over_running(self, endpoint, payload):
+        """同一模型未结束的任务数是否已达上限，超出时计入 rejected"""
+        if not self.profile.max_running:
+            return False
+        model = _model_of(payload)
+        now = time.time()
+        with self._lock:
+            running = sum(1 for task in self._tasks.values()
+                          if task.done_at > now and task.endpoint == endpoint and _model_of(task.payload) == model)
+            if running < self.profile.max_running:
+                return False
+            self.counts["rejected"] += 1
+            return True
+
+    def _submit_kling(self, handler, endpoint, payload):
+        if self._over_running(endpoint, payload):
+            handler.send_json(429, {"code": 1303, "message": "并行任务数超出限制", "request_id": uuid.uuid4().hex})
+            return
+        if self._chance(self.profile.submit_error_rate):
+            self._count("submit_errors")
+            handler.send_json(200, {"code": 1201, "message": "模拟参数错误", "request_id": uuid.uuid4().hex})
+            return
+        task = self._create_task(endpoint, payload)
+        handler.send_json(200, {
+            "code": 0,
+            "message": "SUCCEED",
+            "request_id": uuid.uuid4().hex,
+            "data": {"task_id": task.task_id, "task_status": endpoints.STATUS_SUBMITTED,
+                     "created_at": int(task.created * 1000), "updated_at": int(task.created * 1000)},
+        })
+
+    def _query_kling(self, handler, task_id):
+        self._count("queries")
+        with self._lock:
+            task = self._tasks.get(task_id)
+        if task is None:
+            handler.send_json(200, {"code": 1203, "message": f"任务不存在: {task_id}"})
+            return
+        handler.send_json(200, {"code": 0, "message": "SUCCEED", "request_id": uuid.uuid4().hex,
+                                "data": self._kling_data(task)})
+
+    def _list_kling(self, handler, endpoint, query):
+        """任务列表查询：按创建时间倒序分页返回该接口的任务"""
+        self._count("queries")
+        try:
+            page = int(query.get('pageNum', ["1"])[0])
+            page_size = int(query.get('pageSize', ["30"])[0])
+        except ValueError:
+            page = page_size = 0
+        if not 1 <= page <= 1000 or not 1 <= page_size <= endpoints.LIST_MAX_PAGE_SIZE:
+            handler.send_json(400, {"code": 1201, "message": "pageNum 或 pageSize 超出范围"})
+            return
+        with self._lock:
+            tasks = [task for task in self._tasks.values() if task.endpoint == endpoint]
+        tasks.sort(key=lambda task: task.created, reverse=True)
+        start = (page - 1) * page_size
+        handler.send_json(200, {"code": 0, "message": "SUCCEED", "request_id": uuid.uuid4().hex,
+                                "data": [self._kling_data(task) for task in tasks[start:start + page_size]]})
+
+    def _submit_midjourney(self, handler, payload):
+        if self._over_running(endpoints.MJ_IMAGINE, payload):
+            handler.send_json(200, {"code": 23, "description": "队列已满，请稍后尝试", "result": None})
+            return
+        if self._chance(self.profile.submit_error_rate):
+            self._count("submit_errors")
+            handler.send_json(200, {"code": 4, "description": "模拟提交失败", "result": None})
+            return
+        task = self._create_task(endpoints.MJ_IMAGINE, payload)
+        handler.send_json(200, {"code": endpoints.MJ_SUCCESS_CODE, "description": "提交成功",
+                                "result": task.task_id, "properties": {}})
+
+    def _fetch_midjourney(self, handler, task_id):
+        self._count("queries")
+        with self._lock:
+            task = self._tasks.get(task_id)
+        if task is None:
+            handler.send_json(404, {"code": 3, "description": f"任务不存在: {task_id}"})
+            return
+        handler.send_json(200, self._midjourney_data(task))
+
+    def _push(self, task, callback_url):
+        """任务结束时向回调地址推送与查询接口相同的结果"""
+        if task.endpoint == endpoints.MJ_IMAGINE:
+            body = self._midjourney_data(task)
+        else:
+            body = self._kling_data(task)
+        request = urllib.request.Request(callback_url, json.dumps(body).encode("utf-8"),
+                                         {'Content-Type': 'application/json'})
+        try:
+            urllib.request.urlopen(request, timeout=10).close()
+        except Exception:
+            return
+        self._count("callbacks")
+
+    def _serve_file(self, handler, path, query=""):
+        """返回确定性内容的结果文件，支持单个 Range 区间"""
+        self._count("files")
+        expires = urllib.parse.parse_qs(query).get("x-oss-expires", [""])[0]
+        if expires.isdigit() and time.time() > int(expires):
+            handler.send_json(403, {"code": 403, "message": "签名已过期"})
+            return
+        size = self.profile.file_size
+        seed = hashlib.sha256(path.encode("utf-8")).digest()
+        start, end, status = 0, size - 1, 200
+        requested = handler.headers.get('Range', "")
+        if requested.startswith("bytes=") and "," not in requested:
+            first, _, last = requested[len("bytes="):].partition("-")
+            if first.isdigit():
+                start = int(first)
+                end = min(int(last), size - 1) if last.isdigit() else size - 1
+                if start >= size:
+                    handler.send_json(416, {"code": 416, "message": "Range 超出文件大小"})
+                    return
+                status = 206
+        handler.send_response(status)
+        handler.send_header('Content-Type', 'application/octet-stream')
+        handler.send_header('Content-Length', str(end - start + 1))
+        handler.send_header('Accept-Ranges', 'bytes')
+        handler.send_header('ETag', f'"{seed.hex()[:16]}"')
+        if status == 206:
+            handler.send_header('Content-Range', f"bytes {start}-{end}/{size}")
+        handler.end_headers()
+        # 内容为路径哈希的重复，分块写出，避免大文件占用内存
+        block = seed * 2048
+        position = start
+        while position <= end:
+            offset = position % len(seed)
+            chunk = block[offset:offset + min(len(block) - offset, end - position + 1)]
+            handler.wfile.write(chunk)
+            position += len(chunk)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="启动离线 DMXAPI 模拟服务")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=8000, help="监听端口")
+    parser.add_argument("--profile", choices=sorted(PROFILES), help="预置配置，其余参数在其基础上覆盖")
+    parser.add_argument("--queue-time", type=float, help="任务排队时间（秒）")
+    parser.add_argument("--image-time", type=float, help="图像任务生成时间（秒）")
+    parser.add_argument("--video-time", type=float, help="视频任务生成时间（秒）")
+    parser.add_argument("--latency", type=float, help="每个请求的响应延迟（秒）")
+    parser.add_argument("--error-rate", type=float, help="任务失败比例")
+    parser.add_argument("--submit-error-rate", type=float, help="提交失败比例")
+    parser.add_argument("--throttle-rate", type=float, help="随机 429 比例")
+    parser.add_argument("--max-qps", type=float, help="全局 QPS 上限，超出返回 429")
+    parser.add_argument("--max-running", type=int, help="每个模型同时进行中的任务数上限，超出返回 1303")
+    parser.add_argument("--drop-rate", type=float, help="直接断开连接的比例")
+    parser.add_argument("--server-error-rate", type=float, help="随机 503 比例")
+    parser.add_argument("--file-size", type=int, help="结果文件大小（字节）")
+    parser.add_argument("--url-ttl", type=float, help="结果 url 的签名有效期（秒）")
+    parser.add_argument("--seed", type=int, help="随机种子")
+    args = parser.parse_args(argv)
+
+    base = PROFILES[args.profile] if args.profile else MockProfile()
+    profile = MockProfile(**vars(base))
+    for name in ("queue_time", "image_time", "video_time", "latency", "error_rate", "submit_error_rate",
+                 "throttle_rate", "max_qps", "max_running", "drop_rate",
+                 "server_error_rate", "file_size", "url_ttl", "seed"):
+        value = getattr(args, name)
+        if value is not None:
+            setattr(profile, name, value)
+
+    server = MockServer(profile, host=args.host, port=args.port).start()
+    print(f"模拟服务已启动: {server.url}  (Ctrl-C 退出)", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print(json.dumps(server.stats(), ensure_ascii=False))
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
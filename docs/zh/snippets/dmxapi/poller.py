@@ -0,0 +1,663 @@
+import heapq
+import itertools
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
+
+from dmxapi import endpoints, metrics, retry
+from dmxapi.intervals import AdaptiveSchedule
+from dmxapi.pool import get_pool
+
+# 全局状态查询 QPS 上限
+DEFAULT_MAX_QPS = 20
+# 执行查询请求的线程数，与任务数量无关
+DEFAULT_WORKERS = 4
+# 结果由回调推送的任务，兜底轮询的最小间隔（秒），用于回调丢失的情况
+DEFAULT_PUSH_FALLBACK_INTERVAL = 30
+# 列表查询的每页条数上限，0 表示不使用列表查询
+DEFAULT_LIST_PAGE_SIZE = endpoints.LIST_MAX_PAGE_SIZE
+# 一次列表查询最多翻的页数，超出部分的任务逐个查询
+DEFAULT_LIST_MAX_PAGES = 10
+# 同一接口、同一密钥下未结束的任务达到该数量时才改用列表查询，任务很少时逐个查询更省流量
+DEFAULT_LIST_MIN_TASKS = 3
+# 列表查询连续失败该次数，或返回无法解析的结果时，该接口改为逐个查询一段时间（秒）
+LIST_MAX_FAILURES = 3
+LIST_DISABLE_SECONDS = 300
+# iter_status 在任务到达截止时间仍未结束时产出的状态，服务端不会返回该状态
+STATUS_TIMEOUT = "timeout"
+
+
+class TaskFailedError(Exception):
+    """任务在服务端执行失败"""
+
+    def __init__(self, task_id, message=""):
+        super().__init__(f"任务失败：{task_id} {message}".rstrip())
+        self.task_id = task_id
+        self.message = message
+
+
+class StatusEvent:
+    __slots__ = ("task_id", "status", "previous", "message", "data", "elapsed")
+
+    def __init__(self, task_id, status, previous, message, data, elapsed):
+        """一次任务状态变化
+
+        参数:
+            task_id: str, 任务 id
+            status: str, 新状态：submitted、processing、succeed、failed，或客户端判定的 timeout
+            previous: str, 变化前的状态，第一次查询到状态时为 None
+            message: str, 状态说明（Kling 的 task_status_msg、Midjourney 的 failReason）
+            data: 查询结果的 data，timeout 时为 None
+            elapsed: float, 从注册开始经过的秒数
+        """
+        self.task_id = task_id
+        self.status = status
+        self.previous = previous
+        self.message = message
+        self.data = data
+        self.elapsed = elapsed
+
+    @property
+    def final(self):
+        """是否为最终状态，之后该任务不会再有状态变化"""
+        return self.status in endpoints.FINAL_STATUSES or self.status == STATUS_TIMEOUT
+
+    def __repr__(self):
+        return f"StatusEvent({self.task_id!r}, {self.previous!r} -> {self.status!r}, {self.elapsed:.1f}s)"
+
+
+class _PollTask:
+    __slots__ = ("endpoint", "task_id", "query_path", "parse", "headers", "interval", "started", "deadline",
+                 "future", "polls", "stats_key", "push", "route", "processing_at", "group", "due", "direct",
+                 "status", "listeners", "watchers")
+
+    def __init__(self, endpoint, task_id, query_path, parse, headers, interval, started, deadline, future,
+                 stats_key, push=False, group=None):
+        self.endpoint = endpoint
+        self.task_id = task_id
+        self.query_path = query_path
+        self.parse = parse
+        self.headers = headers
+        self.interval = interval
+        self.started = started
+        self.deadline = deadline
+        self.future = future
+        self.polls = 0
+        self.stats_key = stats_key
+        self.push = push
+        # 指标中使用的查询路径模板
+        self.route = query_path.replace(task_id, "{task_id}")
+        # 首次查询到非 submitted 状态的时间，用于区分排队时间和生成时间
+        self.processing_at = None
+        # 可以合并到列表查询的任务所属的组 (提交接口, Authorization)，其余任务为 None
+        self.group = group
+        # 当前有效的下次查询时间，堆中时间与之不同的元素已过期；单独查询进行中时为 None
+        self.due = None
+        # 列表中没有找到，下次改为按 task_id 单独查询
+        self.direct = False
+        # 最近一次查询到的状态，状态变化时依次通知 listeners
+        self.status = None
+        self.listeners = []
+        # 共用这次轮询的注册数，全部注册方都不再关心时才取消
+        self.watchers = 1
+
+
+class Poller:
+    def __init__(self, api_url, max_qps=DEFAULT_MAX_QPS, workers=DEFAULT_WORKERS, schedule=None,
+                 list_page_size=DEFAULT_LIST_PAGE_SIZE, list_max_pages=DEFAULT_LIST_MAX_PAGES,
+                 list_min_tasks=DEFAULT_LIST_MIN_TASKS):
+        """初始化集中式任务轮询器
+
+        所有已注册任务放在按下次查询时间排序的小顶堆中，由单个调度线程取出到期任务，
+        交给固定数量的查询线程执行，因此线程数和查询频率不随任务数量增长。
+
+        Kling 任务按 (提交接口, 密钥) 分组：组内任一任务到期时，用列表接口（GET 提交接口?pageNum=&pageSize=）
+        按创建时间倒序翻页，一次刷新组内全部未结束的任务并各自重新排期；列表中找不到的到期任务再按 task_id 单独查询，
+        列表接口不可用时该接口暂时全部单独查询。
+        数千个同类任务同时进行时，每个轮询间隔只需要几次列表查询。
+
+        参数:
+            api_url: API 节点地址
+            max_qps: 全局状态查询 QPS 上限，一次列表查询（可能翻多页）计为一次
+            workers: 查询线程数
+            schedule: AdaptiveSchedule, 基于历史耗时的轮询间隔策略，默认读写本地统计文件
+            list_page_size: int, 列表查询每页条数上限，0 表示不使用列表查询
+            list_max_pages: int, 一次列表查询最多翻的页数
+            list_min_tasks: int, 组内未结束任务达到该数量时才使用列表查询
+        """
+        self.api_url = api_url
+        self.pool = get_pool(api_url)
+        self.max_qps = max_qps
+        self.schedule = schedule or AdaptiveSchedule()
+        # 小顶堆，元素为 (下次查询时间, 序号, 任务)
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dmxapi-poll")
+        self._thread = None
+        self._closed = False
+        self.status_requests = 0
+        # 因连接失败、5xx、限流或熔断而推迟到下次再查的次数
+        self.poll_errors = 0
+        # 回调接收器，见 dmxapi.webhook；设置后新注册的任务以回调为主、轮询为辅
+        self.webhook = None
+        self.push_fallback_interval = DEFAULT_PUSH_FALLBACK_INTERVAL
+        # 等待回调的任务，task_id -> 任务
+        self._push_tasks = {}
+        self.pushed_results = 0
+        self.list_page_size = list_page_size
+        self.list_max_pages = list_max_pages
+        self.list_min_tasks = list_min_tasks
+        # 分组 -> {task_id: 任务}，只包含未结束的任务
+        self._groups = {}
+        # 正在执行列表查询的分组，以及查询期间到期、等查询结束再处理的任务
+        self._sweeping = set()
+        self._deferred = {}
+        # 提交接口 -> 列表查询连续失败次数；列表查询暂停到的时间，暂停期间该接口的任务逐个查询
+        self._list_failures = {}
+        self._list_disabled = {}
+        # 列表查询的请求数（每页一次）与由列表刷新的任务次数
+        self.list_requests = 0
+        self.list_refreshed = 0
+        # (提交接口, task_id) -> 未结束的任务，重复注册同一任务时共用一次轮询
+        self._active = {}
+
+    def use_webhook(self, receiver, fallback_interval=DEFAULT_PUSH_FALLBACK_INTERVAL):
+        """接入回调接收器
+
+        参数:
+            receiver: WebhookReceiver, 已启动的回调接收器
+            fallback_interval: float, 回调任务的兜底轮询间隔（秒）
+        """
+        self.push_fallback_interval = fallback_interval
+        self.webhook = receiver
+        receiver.add_listener(self.notify)
+
+    def callback_url(self):
+        """返回提交任务时应填写的回调地址，未接入回调接收器时返回空字符串"""
+        return self.webhook.url if self.webhook else ""
+
+    def estimate(self, stats_key):
+        """按历史耗时乐观估计任务至少需要的时间（p10），样本不足时返回 None"""
+        return self.schedule.stats.quantile(stats_key, 0.1)
+
+    def register(self, endpoint, task_id, headers, interval=1, timeout=600, callback=None, stats_key=None,
+                 query_path=None, parse=endpoints.parse_kling, push=None, on_status=None):
+        """注册一个待轮询任务
+
+        同一任务未结束时再次注册（例如日志恢复的任务又被 iter_status 关注）不会重复查询，
+        直接共用已有的轮询和 Future，超时时间以第一次注册为准。
+
+        参数:
+            endpoint: str, 提交接口，查询路径为 "提交接口/{task_id}"
+            task_id: str, 任务 id
+            headers: dict, 查询请求头
+            interval: float, 轮询间隔（秒）
+            timeout: int, 超时时间（秒）
+            callback: 可选，任务结束时以 Future 为参数调用
+            stats_key: 可选，耗时统计 key，例如 (endpoint, model_name, mode, duration)；
+                提供后按历史耗时自适应调整轮询间隔，interval 仅在样本不足时使用
+            query_path: str, 可选，查询路径，默认为 "提交接口/{task_id}"
+            parse: 查询结果解析函数，返回 (任务状态, data, 状态说明)，
+                默认按 Kling 格式解析，Midjourney 任务使用 endpoints.parse_midjourney
+            push: bool, 任务结果是否由回调推送，默认在接入回调接收器后开启；
+                开启后只按 push_fallback_interval 低频轮询，防止回调丢失
+            on_status: 可选，任务状态变化时以 StatusEvent 为参数调用（在查询线程或回调接收线程中），
+                已知当前状态时注册后立即调用一次
+        返回:
+            Future, 成功时结果为查询结果的 data 字段，超时结果为 None，
+            任务失败时抛出 TaskFailedError
+        """
+        with self._cond:
+            task = self._active.get((endpoint, task_id))
+            if task is not None:
+                task.watchers += 1
+                if on_status:
+                    task.listeners.append(on_status)
+                current = task.status
+        if task is not None:
+            if callback:
+                task.future.add_done_callback(callback)
+            if on_status and current is not None:
+                on_status(StatusEvent(task_id, current, None, "", None, time.monotonic() - task.started))
+            return task.future
+        future = Future()
+        if callback:
+            future.add_done_callback(callback)
+        now = time.monotonic()
+        # 使用默认查询路径的 Kling 任务可以合并到同接口的列表查询
+        group = None
+        if self.list_page_size and query_path is None and parse is endpoints.parse_kling:
+            group = (endpoint, headers.get('Authorization'))
+        query_path = query_path or endpoints.query_path(endpoint, task_id)
+        if push is None:
+            push = self.webhook is not None
+        task = _PollTask(endpoint, task_id, query_path, parse, headers, interval, now, now + timeout, future,
+                         stats_key, push, group)
+        if on_status:
+            task.listeners.append(on_status)
+        with self._cond:
+            self._active[(endpoint, task_id)] = task
+        future.add_done_callback(lambda _: self._deactivate(task))
+        if metrics.ENABLED:
+            future.add_done_callback(lambda done: self._record_metrics(task, done))
+        if group is not None:
+            with self._cond:
+                self._groups.setdefault(group, {})[task_id] = task
+            future.add_done_callback(lambda _: self._ungroup(task))
+        if push:
+            with self._cond:
+                self._push_tasks[task_id] = task
+            future.add_done_callback(lambda _: self._forget(task_id))
+            # 回调可能先于注册到达，由接收器暂存
+            early = self.webhook.claim(task_id) if self.webhook else None
+            if early and self._observe(task, *early) and self._finish(task, *early):
+                self.pushed_results += 1
+                return future
+        self._schedule(task, now + self._next_interval(task, 0))
+        return future
+
+    def notify(self, task_id, status, data, message=""):
+        """回调到达时结束对应任务
+
+        参数:
+            task_id: str, 任务 id
+            status: str, 任务状态
+            data: 与轮询结果相同格式的 data
+            message: str, 状态说明
+        返回:
+            bool, 是否有等待中的任务认领了该回调
+        """
+        with self._cond:
+            task = self._push_tasks.get(task_id)
+        if task is None:
+            return False
+        if self._observe(task, status, data, message) and self._finish(task, status, data, message):
+            self.pushed_results += 1
+        return True
+
+    def unwatch(self, endpoint, task_id, on_status=None):
+        """撤销一次 register：不再通知 on_status，没有其他注册方时取消轮询
+
+        参数:
+            endpoint: str, 提交接口
+            task_id: str, 任务 id
+            on_status: 注册时传入的状态回调
+        """
+        with self._cond:
+            task = self._active.get((endpoint, task_id))
+            if task is None:
+                return
+            if on_status in task.listeners:
+                task.listeners.remove(on_status)
+            task.watchers -= 1
+            idle = task.watchers <= 0
+        if idle:
+            task.future.cancel()
+
+    def iter_status(self, endpoint, task_ids, headers, interval=1, timeout=600, **kwargs):
+        """轮询一个或多个任务，按发生顺序产出状态变化
+
+        多个任务共用同一个轮询器（同类 Kling 任务合并为列表查询），不为每个任务单独开线程。
+        每个任务以最终状态结束：succeed、failed（服务端判定失败后立即结束，不再等到超时）或 timeout。
+        调用方提前停止迭代时，没有其他注册方的任务随即停止轮询。
+
+        参数:
+            endpoint: str, 提交接口
+            task_ids: str 或 list, 任务 id
+            headers: dict, 查询请求头
+            interval: float, 轮询间隔（秒）
+            timeout: int, 每个任务的超时时间（秒）
+            其余参数与 register 一致，例如 stats_key、query_path、parse
+        返回:
+            生成器，产出 StatusEvent；任务已在轮询中时，先产出一次当前状态
+        """
+        if isinstance(task_ids, str):
+            task_ids = [task_ids]
+        events = queue.Queue()
+        futures = {}
+        try:
+            for task_id in dict.fromkeys(task_ids):
+                futures[task_id] = self.register(endpoint, task_id, headers, interval=interval, timeout=timeout,
+                                                 on_status=events.put,
+                                                 callback=lambda done, task_id=task_id: events.put((task_id, done)),
+                                                 **kwargs)
+            remaining = len(futures)
+            started = time.monotonic()
+            while remaining:
+                event = events.get()
+                if isinstance(event, StatusEvent):
+                    yield event
+                    continue
+                task_id, done = event
+                remaining -= 1
+                if done.cancelled():
+                    continue
+                error = done.exception()
+                # 失败已经以 failed 状态产出；解析错误等其他异常直接抛给调用方
+                if error is not None and not isinstance(error, TaskFailedError):
+                    raise error
+                if error is None and done.result() is None:
+                    yield StatusEvent(task_id, STATUS_TIMEOUT, None, "", None, time.monotonic() - started)
+        finally:
+            for task_id, future in futures.items():
+                if not future.done():
+                    self.unwatch(endpoint, task_id, events.put)
+
+    def _forget(self, task_id):
+        with self._cond:
+            self._push_tasks.pop(task_id, None)
+
+    def _deactivate(self, task):
+        with self._cond:
+            if self._active.get((task.endpoint, task.task_id)) is task:
+                del self._active[(task.endpoint, task.task_id)]
+
+    def _ungroup(self, task):
+        with self._cond:
+            tasks = self._groups.get(task.group)
+            if tasks is not None and tasks.get(task.task_id) is task:
+                del tasks[task.task_id]
+                if not tasks:
+                    del self._groups[task.group]
+
+    def pending(self):
+        """返回尚未结束的任务数量"""
+        with self._cond:
+            return sum(1 for due, _, task in self._heap if not task.future.done() and due == task.due)
+
+    def _next_interval(self, task, elapsed):
+        if task.stats_key is None:
+            interval = task.interval
+        else:
+            interval = self.schedule.next_interval(task.stats_key, elapsed, task.interval)
+        if task.push:
+            return max(interval, self.push_fallback_interval)
+        return interval
+
+    def _schedule(self, task, due):
+        with self._cond:
+            if self._closed:
+                task.future.cancel()
+                return
+            task.due = due
+            heapq.heappush(self._heap, (due, next(self._seq), task))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="dmxapi-poller", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self):
+        """调度线程：按到期时间取出任务，并按全局 QPS 上限分发查询"""
+        next_slot = 0.0
+        while True:
+            with self._cond:
+                while not self._closed:
+                    now = time.monotonic()
+                    if self._heap and self._heap[0][0] <= now:
+                        break
+                    self._cond.wait(self._heap[0][0] - now if self._heap else None)
+                if self._closed:
+                    return
+                due, _, task = heapq.heappop(self._heap)
+                # 已由回调结束的任务，以及已被列表查询重新排期的旧元素直接丢弃，不占用查询配额
+                if task.future.done() or due != task.due:
+                    continue
+                group = self._list_group(task)
+                if group in self._sweeping:
+                    # 同组的列表查询进行中，等查询结束再看该任务是否已被刷新
+                    self._deferred.setdefault(group, []).append((due, task))
+                    continue
+                if group is not None:
+                    self._sweeping.add(group)
+                else:
+                    # 单独查询进行中的任务没有有效的到期时间，列表查询不会再为它安排单独查询
+                    task.due = None
+            # 限制全局查询速率
+            now = time.monotonic()
+            if next_slot > now:
+                time.sleep(next_slot - now)
+            next_slot = max(now, next_slot) + 1 / self.max_qps
+            try:
+                if group is not None:
+                    self._executor.submit(self._sweep, group)
+                else:
+                    self._executor.submit(self._poll, task)
+            except RuntimeError:
+                # 取出任务后 close() 已关闭查询线程池，该任务不在堆中，需要在这里取消
+                task.future.cancel()
+                return
+
+    def _list_group(self, task):
+        """任务应合并到的列表查询分组，应单独查询时返回 None"""
+        if task.group is None or task.direct or self._list_disabled.get(task.endpoint, 0) > time.monotonic():
+            return None
+        if len(self._groups.get(task.group, ())) < self.list_min_tasks:
+            return None
+        return task.group
+
+    def _sweep(self, group):
+        """查询线程：执行一次列表查询，结束后处理查询期间到期的同组任务"""
+        try:
+            self._refresh_group(group)
+        except Exception:
+            # 列表查询出现非网络类错误：本轮到期的任务改为单独查询，不让任务卡在堆外
+            self._disable_list(group[0])
+            self._fallback(group)
+        finally:
+            with self._cond:
+                self._sweeping.discard(group)
+                deferred = self._deferred.pop(group, [])
+            for due, task in deferred:
+                # 列表查询已重新排期或改为单独查询的任务不再处理，其余按原到期时间放回
+                if not task.future.done() and task.due == due:
+                    self._schedule(task, due)
+
+    def _refresh_group(self, group):
+        """按创建时间倒序翻页，刷新组内全部未结束的任务
+
+        翻到组内任务全部出现、列表结束或页数上限为止；列表中没有出现的到期任务改为单独查询。
+        """
+        endpoint, _ = group
+        with self._cond:
+            outstanding = {task_id: task for task_id, task in self._groups.get(group, {}).items()
+                           if not task.future.done()}
+        if not outstanding:
+            return
+        headers = next(iter(outstanding.values())).headers
+        # 未结束的任务通常是最近提交的，页大小按任务数留出余量，任务很少时不拉取整页
+        page_size = min(self.list_page_size, max(2 * len(outstanding), 20))
+        max_pages = min(self.list_max_pages, len(outstanding) // page_size + 2)
+        for page in range(1, max_pages + 1):
+            self.status_requests += 1
+            self.list_requests += 1
+            try:
+                res = self.pool.request("GET", endpoints.list_path(endpoint, page, page_size), None, headers,
+                                        route=endpoints.list_path(endpoint, "{page}", "{page_size}"), retry=False)
+            except Exception as e:
+                if retry.classify_error(e)[0] is None and not isinstance(e, retry.CircuitOpenError):
+                    raise
+                res = None
+            if res is None or retry.classify_response(res)[0] is not None:
+                # 与单独查询相同，暂时查不到时到期任务按轮询间隔推迟；连续失败说明列表接口本身可能不可用
+                self.poll_errors += 1
+                failures = self._list_failures.get(endpoint, 0) + 1
+                self._list_failures[endpoint] = failures
+                if failures >= LIST_MAX_FAILURES:
+                    self._disable_list(endpoint)
+                    break
+                self._fallback(group, outstanding, reschedule=True)
+                return
+            try:
+                items = endpoints.parse_kling_list(json.loads(res.read().decode("utf-8")))
+            except Exception:
+                # 该接口不支持列表查询，暂时只单独查询
+                self._disable_list(endpoint)
+                break
+            self._list_failures.pop(endpoint, None)
+            for data in items:
+                task = outstanding.pop(data.get('task_id'), None)
+                if task is None or task.future.done():
+                    continue
+                task.polls += 1
+                self.list_refreshed += 1
+                self._apply(task, data['task_status'], data, data.get('task_status_msg', ""))
+            if not outstanding or len(items) < page_size:
+                break
+        self._fallback(group, outstanding)
+
+    def _disable_list(self, endpoint):
+        self._list_failures.pop(endpoint, None)
+        self._list_disabled[endpoint] = time.monotonic() + LIST_DISABLE_SECONDS
+
+    def _fallback(self, group, tasks=None, reschedule=False):
+        """处理列表查询没有刷新到的到期任务：按轮询间隔推迟，或立即改为单独查询"""
+        if tasks is None:
+            with self._cond:
+                tasks = dict(self._groups.get(group, {}))
+        now = time.monotonic()
+        for task in tasks.values():
+            if task.future.done() or task.due is None or task.due > now:
+                continue
+            if reschedule:
+                self._reschedule(task, now - task.started)
+            else:
+                task.direct = True
+                self._schedule(task, now)
+
+    def _poll(self, task):
+        """查询线程：执行一次状态查询，结束任务或重新排期"""
+        if task.future.done():
+            return
+        task.direct = False
+        task.polls += 1
+        self.status_requests += 1
+        # 查询失败时由轮询间隔充当退避，不在查询线程中等待重试，避免占住线程拖慢其他任务
+        try:
+            res = self.pool.request("GET", task.query_path, None, task.headers, route=task.route, retry=False)
+        except Exception as e:
+            if retry.classify_error(e)[0] is None and not isinstance(e, retry.CircuitOpenError):
+                self._set(task.future, exception=e)
+                return
+            res = None
+        if res is None or retry.classify_response(res)[0] is not None:
+            # 暂时查不到不代表任务失败，任务仍在服务端运行，到下次查询时间再试
+            self.poll_errors += 1
+            self._reschedule(task, time.monotonic() - task.started)
+            return
+        try:
+            status, data, message = task.parse(json.loads(res.read().decode("utf-8")))
+        except Exception as e:
+            self._set(task.future, exception=e)
+            return
+        self._apply(task, status, data, message)
+
+    def _apply(self, task, status, data, message):
+        """处理一次查询到的任务状态：结束任务或重新排期"""
+        elapsed = time.monotonic() - task.started
+        if task.processing_at is None and status != endpoints.STATUS_SUBMITTED:
+            task.processing_at = task.started + elapsed
+        self._observe(task, status, data, message)
+        if self._finish(task, status, data, message):
+            return
+        self._reschedule(task, elapsed)
+
+    def _observe(self, task, status, data, message):
+        """记录查询到的状态，状态变化时通知监听方；任务已结束时返回 False"""
+        if task.future.done():
+            return False
+        with self._cond:
+            previous, task.status = task.status, status
+            listeners = list(task.listeners) if status != previous else ()
+        for listener in listeners:
+            try:
+                listener(StatusEvent(task.task_id, status, previous, message, data, time.monotonic() - task.started))
+            except Exception:
+                # 监听方出错不能打断查询线程，否则任务不会再被排期
+                pass
+        return True
+
+    def _reschedule(self, task, elapsed):
+        """未结束的任务按下次查询时间重新排期，已到截止时间时以 None 结束"""
+        if task.started + elapsed >= task.deadline:
+            self._set(task.future, None)
+        else:
+            # 下次查询不晚于截止时间，保证超时判断及时
+            due = task.started + elapsed + self._next_interval(task, elapsed)
+            self._schedule(task, min(due, task.deadline))
+
+    def _finish(self, task, status, data, message):
+        """任务到达最终状态时设置结果，返回任务是否已结束"""
+        if status == endpoints.STATUS_SUCCEED:
+            if task.stats_key is not None:
+                self.schedule.record(task.stats_key, time.monotonic() - task.started)
+            return self._set(task.future, data)
+        if status == endpoints.STATUS_FAILED:
+            return self._set(task.future, exception=TaskFailedError(task.task_id, message))
+        return False
+
+    @staticmethod
+    def _record_metrics(task, future):
+        """任务结束时记录查询次数、排队时间和生成时间"""
+        if future.cancelled():
+            outcome = "cancelled"
+        elif isinstance(future.exception(), TaskFailedError):
+            outcome = "failed"
+        elif future.exception() is not None:
+            outcome = "error"
+        else:
+            outcome = "timeout" if future.result() is None else "succeed"
+        finished = time.monotonic()
+        queue = generation = None
+        if task.processing_at is not None:
+            queue = task.processing_at - task.started
+            generation = finished - task.processing_at if outcome in ("succeed", "failed") else None
+        metrics.record_task(task.endpoint, outcome, task.polls, finished - task.started, queue, generation)
+
+    @staticmethod
+    def _set(future, result=None, exception=None):
+        """设置 Future 结果，轮询与回调同时到达时以先到者为准"""
+        try:
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(result)
+        except InvalidStateError:
+            return False
+        return True
+
+    def close(self):
+        """停止调度，未结束的任务会被取消"""
+        with self._cond:
+            self._closed = True
+            heap, self._heap = self._heap, []
+            deferred = [item for items in self._deferred.values() for item in items]
+            self._deferred.clear()
+            self._cond.notify()
+        for _, _, task in heap:
+            task.future.cancel()
+        for _, task in deferred:
+            task.future.cancel()
+        self._executor.shutdown(wait=False)
+
+
+# 按节点地址共享的轮询器
+_pollers = {}
+_pollers_lock = threading.Lock()
+
+
+def get_poller(api_url):
+    """获取节点对应的共享轮询器
+
+    参数:
+        api_url: API 节点地址
+    返回:
+        Poller
+    """
+    with _pollers_lock:
+        poller = _pollers.get(api_url)
+        if poller is None:
+            poller = _pollers[api_url] = Poller(api_url)
+        return poller
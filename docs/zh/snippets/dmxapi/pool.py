@@ -0,0 +1,352 @@
+import http.client
+import select
+import socket
+import ssl
+import threading
+import time
+
+from dmxapi import metrics
+from dmxapi.retry import CONNECTION, RequestNotSentError, get_retry_policy
+
+# 每个节点默认保留的长连接数量
+DEFAULT_MAXSIZE = 8
+# 空闲连接超过该时间（秒）不再复用，避免拿到已被服务端关闭的连接
+DEFAULT_IDLE_TIMEOUT = 30
+# 单次 sendmsg 最多携带的缓冲区数，低于常见系统的 IOV_MAX（Linux 为 1024）
+MAX_IOV = 64
+# 分段请求体中累计超过该字节数即写出，避免流式编码的分块在内存中堆积
+MAX_BATCH_BYTES = 256 * 1024
+# 复用连接时可能遇到的"连接已被对端关闭"类异常
+STALE_ERRORS = (
+    http.client.RemoteDisconnected,
+    ConnectionResetError,
+    ConnectionAbortedError,
+    BrokenPipeError,
+)
+
+
+def _is_dropped(sock):
+    """空闲连接上出现可读事件（通常是服务端关闭连接后的 EOF）时视为已断开，不再复用"""
+    try:
+        if hasattr(select, "poll"):
+            poller = select.poll()
+            poller.register(sock, select.POLLIN)
+            return bool(poller.poll(0))
+        return bool(select.select([sock], [], [], 0)[0])
+    except (OSError, ValueError):
+        return True
+
+
+def split_api_url(api_url):
+    """解析 API 节点地址
+
+    参数:
+        api_url: str, API 节点地址，例如 www.dmxapi.cn、http://127.0.0.1:8000
+    返回:
+        scheme: str, https 或 http，未写协议时默认 https
+        host: str, 主机名（可带端口）
+    """
+    if api_url.startswith("http://"):
+        return "http", api_url[len("http://"):].rstrip("/")
+    if api_url.startswith("https://"):
+        return "https", api_url[len("https://"):].rstrip("/")
+    return "https", api_url.rstrip("/")
+
+
+def _sendmsg_all(sock, buffers):
+    """用 sendmsg 写出全部缓冲区，部分写入时从中断位置继续"""
+    while buffers:
+        sent = sock.sendmsg(buffers)
+        while sent:
+            if sent >= len(buffers[0]):
+                sent -= len(buffers[0])
+                buffers.pop(0)
+            else:
+                buffers[0] = buffers[0][sent:]
+                sent = 0
+
+
+def send_segments(sock, segments):
+    """把分段请求体写入 socket，不拼接成完整的请求体
+
+    明文连接用 sendmsg 一次写出多个分段（scatter/gather），小的 JSON 片段和大的 base64 缓冲区
+    在同一次系统调用中发送；TLS 连接不支持 sendmsg，逐段写入，同样不做拼接。
+
+    参数:
+        sock: socket 对象
+        segments: 可迭代对象，元素为 bytes 等支持缓冲区协议的对象
+    """
+    if isinstance(sock, ssl.SSLSocket) or not hasattr(socket.socket, "sendmsg"):
+        for segment in segments:
+            if segment:
+                sock.sendall(segment)
+        return
+    batch = []
+    batch_bytes = 0
+    for segment in segments:
+        if not segment:
+            continue
+        view = memoryview(segment).cast("B")
+        batch.append(view)
+        batch_bytes += len(view)
+        if len(batch) >= MAX_IOV or batch_bytes >= MAX_BATCH_BYTES:
+            _sendmsg_all(sock, batch)
+            batch = []
+            batch_bytes = 0
+    if batch:
+        _sendmsg_all(sock, batch)
+
+
+class PooledResponse:
+    """已读取完毕的响应，接口与 http.client.HTTPResponse 的常用部分保持一致"""
+
+    def __init__(self, status, reason, headers, body, timings=None):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self._body = body
+        # 各阶段耗时（秒）与收发字节数，见 ConnectionPool._send
+        self.timings = timings
+
+    def read(self):
+        return self._body
+
+    def getheader(self, name, default=None):
+        for key, value in self.headers:
+            if key.lower() == name.lower():
+                return value
+        return default
+
+
+class ConnectionPool:
+    def __init__(self, api_url, maxsize=DEFAULT_MAXSIZE, timeout=60, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+        """初始化单个节点的 keep-alive 连接池
+
+        参数:
+            api_url: API 节点地址
+            maxsize: 同时存在的最大连接数，超出时请求会等待空闲连接
+            timeout: 单个连接的 socket 超时时间（秒）
+            idle_timeout: 空闲连接的最长复用时间（秒）
+        """
+        self.api_url = api_url
+        self.scheme, self.host = split_api_url(api_url)
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        # 空闲连接栈，元素为 (连接, 归还时间)，后进先出以优先复用最热的连接
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(maxsize)
+        # 命中/未命中/重连计数
+        self.hits = 0
+        self.misses = 0
+        self.reconnects = 0
+        # 节点共享的重试策略与熔断器
+        self.retry = get_retry_policy(api_url)
+
+    def _new_connection(self):
+        if self.scheme == "http":
+            return http.client.HTTPConnection(self.host, timeout=self.timeout)
+        return http.client.HTTPSConnection(self.host, timeout=self.timeout)
+
+    @staticmethod
+    def _connect(conn, timings):
+        """显式建立连接并记录耗时；HTTPS 连接通过包装 TCP 建连函数拆分出 TLS 握手时间"""
+        tcp = []
+        create_connection = conn._create_connection
+
+        def timed_create_connection(*args, **kwargs):
+            start = time.perf_counter()
+            sock = create_connection(*args, **kwargs)
+            tcp.append(time.perf_counter() - start)
+            return sock
+
+        conn._create_connection = timed_create_connection
+        start = time.perf_counter()
+        conn.connect()
+        timings["connect"] = time.perf_counter() - start
+        if isinstance(conn, http.client.HTTPSConnection) and tcp:
+            timings["tls"] = timings["connect"] - tcp[0]
+
+    def _checkout(self):
+        """取出一条连接，优先复用空闲连接
+
+        返回:
+            conn: 连接对象
+            reused: bool, 是否为复用的空闲连接
+        """
+        self._slots.acquire()
+        now = time.monotonic()
+        with self._lock:
+            while self._idle:
+                conn, released_at = self._idle.pop()
+                if now - released_at <= self.idle_timeout and not _is_dropped(conn.sock):
+                    self.hits += 1
+                    return conn, True
+                conn.close()
+            self.misses += 1
+        return self._new_connection(), False
+
+    def _checkin(self, conn, reusable):
+        """归还连接，不可复用的连接直接关闭"""
+        if reusable:
+            with self._lock:
+                self._idle.append((conn, time.monotonic()))
+        else:
+            conn.close()
+        self._slots.release()
+
+    def _send(self, conn, method, path, body, headers):
+        headers = headers or {}
+        # 字符串请求体先按 UTF-8 编码：http.client 默认按 latin-1 编码，非 ASCII 的提示词会出错，
+        # 指标中的请求字节数也按编码后的长度计算
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        # 流式请求体预先给出长度，避免 http.client 退化为 chunked 编码
+        content_length = getattr(body, "content_length", None)
+        if content_length is not None:
+            headers = dict(headers, **{"Content-Length": str(content_length)})
+        timings = {"connect": None, "tls": None}
+        if conn.sock is None:
+            try:
+                self._connect(conn, timings)
+            except OSError as e:
+                raise RequestNotSentError(f"无法连接 {self.host}: {e}") from e
+        start = time.perf_counter()
+        try:
+            if content_length is not None:
+                # 分段请求体：先写出请求头，再把各段直接写入 socket
+                conn.putrequest(method, path)
+                for key, value in headers.items():
+                    conn.putheader(key, value)
+                conn.endheaders()
+                send_segments(conn.sock, body)
+            else:
+                conn.request(method, path, body, headers)
+        except OSError as e:
+            # 请求没有完整写出，服务端收不到完整的请求体，不可能受理
+            raise RequestNotSentError(f"请求未完整发出: {e}") from e
+        sent = time.perf_counter()
+        res = conn.getresponse()
+        first_byte = time.perf_counter()
+        # 必须读完响应体，连接才能被下一个请求复用
+        data = res.read()
+        timings["send"] = sent - start
+        timings["ttfb"] = first_byte - sent
+        timings["read"] = time.perf_counter() - first_byte
+        timings["request_bytes"] = content_length if content_length is not None else len(body or b"")
+        timings["response_bytes"] = len(data)
+        return PooledResponse(res.status, res.reason, res.getheaders(), data, timings), not res.will_close
+
+    def request(self, method, path, body=None, headers=None, route=None, retry=True):
+        """通过连接池发送一次请求，按节点的重试策略重试可恢复的失败
+
+        复用的空闲连接若已被服务端断开，请求没有写完时换一条新连接立即重发一次；请求已经完整发出后才断开的
+        （RemoteDisconnected 等）服务端可能已经受理，只重发 GET/HEAD，POST 直接抛出，避免重复提交付费任务。
+        其余失败按 dmxapi.retry 中的类别退避重试，POST 只在确定服务端未受理时重试。
+        接口熔断期间直接抛出 CircuitOpenError。
+
+        参数:
+            method: str, 请求方法
+            path: str, 请求路径
+            body: str 或 bytes, 请求体
+            headers: dict, 请求头
+            route: str, 可选，指标和熔断器使用的路径模板（例如把任务 id 替换为 {task_id}），默认为 path
+            retry: bool, 是否按重试策略重试，False 时仍经过熔断器
+        返回:
+            PooledResponse, 已读取完毕的响应，重试用尽时为最后一次的响应
+        """
+        route = route or path
+        breaker = self.retry.breaker(route)
+        self.retry.budget.deposit()
+        attempt = 0
+        while True:
+            breaker.before()
+            try:
+                res = self._request_once(method, path, body, headers, route)
+            except Exception as e:
+                category, wait = self.retry.plan(method, route, attempt if retry else None, error=e)
+                if wait is None:
+                    raise
+            else:
+                category, wait = self.retry.plan(method, route, attempt if retry else None, res=res)
+                if wait is None:
+                    return res
+            if category == CONNECTION:
+                # 节点不可达或连接被重置时，空闲连接大概率也已失效，全部丢弃后重新建连
+                self.close()
+            time.sleep(wait)
+            attempt += 1
+
+    def _request_once(self, method, path, body, headers, route):
+        conn, reused = self._checkout()
+        reusable = False
+        try:
+            try:
+                res, reusable = self._send(conn, method, path, body, headers)
+            except (RequestNotSentError,) + STALE_ERRORS as e:
+                unsent = isinstance(e, RequestNotSentError)
+                # 新连接上的建连、写出失败交给重试策略退避；请求已发出的只有幂等请求可以立即重发
+                if not (reused and unsent) and (unsent or method not in ("GET", "HEAD")):
+                    raise
+                conn.close()
+                with self._lock:
+                    self.reconnects += 1
+                conn = self._new_connection()
+                reused = False
+                res, reusable = self._send(conn, method, path, body, headers)
+            if metrics.ENABLED:
+                metrics.record_request(method, route, res.status, res.timings, reused)
+            return res
+        finally:
+            self._checkin(conn, reusable)
+
+    def stats(self):
+        """返回连接池计数
+
+        返回:
+            dict, 包含 hits、misses、reconnects、idle、maxsize
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "reconnects": self.reconnects,
+                "idle": len(self._idle),
+                "maxsize": self.maxsize,
+            }
+
+    def close(self):
+        """关闭所有空闲连接"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            conn.close()
+
+
+# 按节点地址共享的连接池
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(api_url, maxsize=DEFAULT_MAXSIZE):
+    """获取节点对应的共享连接池，同一节点的所有客户端实例复用同一个池
+
+    参数:
+        api_url: API 节点地址
+        maxsize: 首次创建时的最大连接数
+    返回:
+        ConnectionPool
+    """
+    with _pools_lock:
+        pool = _pools.get(api_url)
+        if pool is None:
+            pool = _pools[api_url] = ConnectionPool(api_url, maxsize=maxsize)
+        return pool
+
+
+def pool_stats():
+    """返回所有共享连接池的计数，键为节点地址"""
+    with _pools_lock:
+        pools = list(_pools.items())
+    return {api_url: pool.stats() for api_url, pool in pools}
@@ -0,0 +1,265 @@
+"""上传前的图片预处理
+
+本地图片按原样上传时，8~20 MB 的相机照片经过 base64 还要再大三分之一。开启预处理后，提交前先把本地图片
+缩小到接口实际使用的分辨率、按指定质量重新编码并去掉 EXIF 等元数据（先按 EXIF 方向摆正），可选按请求的
+aspect_ratio 居中裁剪，再把处理结果交给 FileBase64 上传。
+
+- 处理在进程池中进行，generate_many、批量执行器等多个线程同时提交时并行处理，不受 GIL 限制
+- 结果按 (文件内容哈希, 处理参数) 保存在 cache_dir，同一张图片只处理一次，重复运行直接复用
+- 带透明通道的图片和遮罩（lossless=True）保持 PNG 无损，其余重新编码为 JPEG
+- 无需缩放的小文件、Pillow 无法识别的文件以及处理后反而更大的文件按原文件上传
+
+需要安装 Pillow（pip install Pillow），默认关闭。设置环境变量 DMXAPI_PREPROCESS=1 或在代码中开启:
+    configure_preprocess(quality=85, crop=True)
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+from dmxapi import endpoints
+from dmxapi.encode_cache import get_encoding_cache
+from dmxapi.singleflight import SingleFlight
+
+# 各接口使用的输入分辨率上限（长边像素），按接口输出的最大分辨率取值，更大的图片先缩小再上传
+MAX_SIDE = {
+    endpoints.IMAGE_TO_IMAGE: 2048,
+    endpoints.IMAGE_TO_VIDEO: 1920,
+    endpoints.VIDEO_EFFECTS: 1920,
+    endpoints.VIRTUAL_TRY_ON: 2048,
+}
+DEFAULT_MAX_SIDE = 2048
+# JPEG 重新编码质量
+DEFAULT_QUALITY = 85
+# 不超过分辨率上限且小于该大小（字节）的文件直接上传，不重新编码
+DEFAULT_MIN_BYTES = 512 * 1024
+# 估算节省的上传时间所用的上行带宽（字节/秒），默认 20 Mbit/s
+DEFAULT_UPLOAD_BPS = 20 * 1000 * 1000 / 8
+# 按扩展名判断可以预处理的图片，音频、视频等其他文件原样上传
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff")
+
+
+def _crop_box(width, height, aspect_ratio):
+    """按 "16:9" 形式的比例计算居中裁剪区域，比例无法解析或已经一致时返回 None"""
+    try:
+        ratio_w, ratio_h = (float(part) for part in aspect_ratio.split(":"))
+        target = ratio_w / ratio_h
+    except (AttributeError, ValueError, ZeroDivisionError):
+        return None
+    if abs(width / height - target) < 0.01:
+        return None
+    if width / height > target:
+        new_width = round(height * target)
+        left = (width - new_width) // 2
+        return left, 0, left + new_width, height
+    new_height = round(width / target)
+    top = (height - new_height) // 2
+    return 0, top, width, top + new_height
+
+
+def _preprocess(src, dest_stem, max_side, quality, aspect_ratio, lossless, min_bytes):
+    """在工作进程中处理一张图片
+
+    返回:
+        str, 处理结果的路径；不需要处理或处理后没有变小时返回 src
+    """
+    from PIL import Image, ImageOps
+
+    try:
+        with Image.open(src) as opened:
+            box = _crop_box(*opened.size, aspect_ratio) if aspect_ratio else None
+            oversized = max(opened.size) > max_side
+            rotated = opened.getexif().get(0x0112, 1) != 1
+            if not (box or oversized or rotated) and os.path.getsize(src) < min_bytes:
+                return src
+            # 先按 EXIF 方向摆正，去掉元数据后方向信息不再保留
+            image = ImageOps.exif_transpose(opened)
+            # 摆正后宽高可能互换，按摆正后的尺寸重新计算裁剪区域
+            box = _crop_box(*image.size, aspect_ratio) if aspect_ratio else None
+            if box:
+                image = image.crop(box)
+            if max(image.size) > max_side:
+                image.thumbnail((max_side, max_side), Image.LANCZOS)
+            transparent = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+            # 只保留色彩配置，EXIF、XMP 等元数据不写入
+            icc_profile = opened.info.get("icc_profile")
+            tmp_stem = f"{dest_stem}.{os.getpid()}.tmp"
+            if lossless or transparent:
+                dest, options = f"{dest_stem}.png", {"format": "PNG", "optimize": True}
+            else:
+                image = image.convert("RGB")
+                dest, options = f"{dest_stem}.jpg", {"format": "JPEG", "quality": quality, "optimize": True}
+            if icc_profile:
+                options["icc_profile"] = icc_profile
+            image.save(tmp_stem, **options)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        # Pillow 无法识别或解码的文件按原样上传，由服务端判断
+        return src
+    if not (box or oversized or rotated) and os.path.getsize(tmp_stem) >= os.path.getsize(src):
+        os.remove(tmp_stem)
+        return src
+    os.replace(tmp_stem, dest)
+    return dest
+
+
+class ImagePreprocessor:
+    def __init__(self, enabled=True, max_side=None, quality=DEFAULT_QUALITY, crop=False, min_bytes=DEFAULT_MIN_BYTES,
+                 processes=None, cache_dir=None, upload_bps=DEFAULT_UPLOAD_BPS):
+        """初始化图片预处理
+
+        参数:
+            enabled: bool, 是否开启，关闭时 prepare 直接返回原路径
+            max_side: int, 可选，长边像素上限，默认按接口取 MAX_SIDE 中的值
+            quality: int, JPEG 编码质量 [1, 95]
+            crop: bool, 调用方提供 aspect_ratio 时是否按该比例居中裁剪
+            min_bytes: int, 不超过分辨率上限且小于该大小的文件直接上传
+            processes: int, 处理进程数，默认为 CPU 核数（最多 8），0 表示在调用线程中处理
+            cache_dir: str, 处理结果目录，默认在系统临时目录下
+            upload_bps: float, 估算节省上传时间所用的上行带宽（字节/秒）
+        """
+        if enabled:
+            try:
+                import PIL  # noqa: F401
+            except ImportError:
+                raise ImportError("图片预处理需要 Pillow，请先执行 pip install Pillow")
+        self.enabled = enabled
+        self.max_side = max_side
+        self.quality = quality
+        self.crop = crop
+        self.min_bytes = min_bytes
+        self.processes = min(os.cpu_count() or 1, 8) if processes is None else processes
+        self.cache_dir = cache_dir or os.path.join(tempfile.gettempdir(), "dmxapi-preprocess")
+        self.upload_bps = upload_bps
+        self._executor = None
+        self._lock = threading.Lock()
+        # 相同图片和参数的并发处理只执行一次
+        self._flights = SingleFlight()
+        # 处理 key -> 结果路径，按原文件上传时为空字符串，同一进程内不再重复判断
+        self._results = {}
+        self.processed = 0
+        self.reused = 0
+        self.passthrough = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def _options(self, endpoint, aspect_ratio, lossless):
+        max_side = self.max_side or MAX_SIDE.get(endpoint, DEFAULT_MAX_SIDE)
+        return max_side, self.quality, aspect_ratio if self.crop else None, bool(lossless), self.min_bytes
+
+    def prepare(self, path, endpoint=None, aspect_ratio=None, lossless=False):
+        """返回用于上传的图片路径
+
+        参数:
+            path: str, 本地图片路径
+            endpoint: str, 可选，提交接口，用于确定分辨率上限
+            aspect_ratio: str, 可选，请求的输出比例，开启 crop 时按该比例居中裁剪
+            lossless: bool, 是否保持无损（遮罩等不能有压缩失真的图片）
+        返回:
+            str, 处理结果路径；关闭、不是图片或不需要处理时返回原路径
+        """
+        if not self.enabled or not path.lower().endswith(IMAGE_EXTENSIONS) or not os.path.isfile(path):
+            return path
+        options = self._options(endpoint, aspect_ratio, lossless)
+        digest = get_encoding_cache().digest(path)
+        key = hashlib.sha256(json.dumps([digest, options]).encode("utf-8")).hexdigest()[:32]
+        with self._lock:
+            result = self._results.get(key)
+        if result == "":
+            result = path
+        elif result is None or not os.path.exists(result):
+            result = self._flights.run(key, self._process, path, key, options)
+        size = os.path.getsize(path)
+        with self._lock:
+            self.bytes_in += size
+            self.bytes_out += size if result == path else os.path.getsize(result)
+        return result
+
+    def _process(self, path, key, options):
+        stem = os.path.join(self.cache_dir, key)
+        for ext in (".jpg", ".png"):
+            if os.path.exists(stem + ext):
+                # 之前的运行已经处理过
+                with self._lock:
+                    self.reused += 1
+                    self._results[key] = stem + ext
+                return stem + ext
+        os.makedirs(self.cache_dir, exist_ok=True)
+        if self.processes:
+            result = self._get_executor().submit(_preprocess, path, stem, *options).result()
+        else:
+            result = _preprocess(path, stem, *options)
+        with self._lock:
+            if result == path:
+                self.passthrough += 1
+                self._results[key] = ""
+            else:
+                self.processed += 1
+                self._results[key] = result
+        return result
+
+    def _get_executor(self):
+        # 进程池连带导入 multiprocessing，只在第一次处理图片时导入，不拖慢命令行等短进程的启动
+        from concurrent.futures import ProcessPoolExecutor
+
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.processes)
+            return self._executor
+
+    def prepare_many(self, paths, endpoint=None, aspect_ratio=None, lossless=False):
+        """并行处理多张图片，按输入顺序返回上传路径"""
+        from concurrent.futures import ThreadPoolExecutor
+
+        paths = list(paths)
+        with ThreadPoolExecutor(max_workers=max(self.processes, 1)) as executor:
+            return list(executor.map(lambda path: self.prepare(path, endpoint, aspect_ratio, lossless), paths))
+
+    def stats(self):
+        """返回处理计数、节省的字节数和估算节省的上传时间"""
+        with self._lock:
+            saved = self.bytes_in - self.bytes_out
+            return {
+                "processed": self.processed,
+                "reused": self.reused,
+                "passthrough": self.passthrough,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "bytes_saved": saved,
+                # base64 编码后实际少上传的字节数按 4/3 计算
+                "upload_seconds_saved": round(saved * 4 / 3 / self.upload_bps, 3),
+            }
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+
+# 所有客户端共享的预处理配置，默认关闭，设置环境变量 DMXAPI_PREPROCESS=1 时使用默认参数开启
+default_preprocessor = None
+_default_lock = threading.Lock()
+
+
+def configure_preprocess(enabled=True, **kwargs):
+    """开启（或用 enabled=False 关闭）共享的图片预处理，其余参数与 ImagePreprocessor 一致
+
+    返回:
+        ImagePreprocessor, 新的共享配置
+    """
+    global default_preprocessor
+    with _default_lock:
+        previous, default_preprocessor = default_preprocessor, ImagePreprocessor(enabled, **kwargs)
+    if previous is not None:
+        previous.close()
+    return default_preprocessor
+
+
+def get_preprocessor():
+    """返回当前共享的图片预处理"""
+    global default_preprocessor
+    with _default_lock:
+        if default_preprocessor is None:
+            default_preprocessor = ImagePreprocessor(os.environ.get("DMXAPI_PREPROCESS", "") not in ("", "0"))
+        return default_preprocessor
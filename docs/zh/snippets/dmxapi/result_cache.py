@@ -0,0 +1,260 @@
+"""生成结果缓存
+
+回归测试和流水线重跑会用相同的参数反复生成同样的图像和视频。开启结果缓存后，任务成功的查询结果
+（task_id、结果 url 和视频 id）按请求体的规范化哈希（见 dmxapi.singleflight.payload_key）保存在本地 SQLite 中，
+相同的请求直接返回缓存的结果，不再提交新任务；可选同时保存下载的结果文件。
+
+有效期:
+    每条结果在 ttl 秒后过期。只保存了 url 的结果还受 url 本身的有效期限制：带签名的 url
+    （Expires、X-Amz-Date + X-Amz-Expires 等参数）在到期前 url_margin 秒失效，之后的相同请求重新生成。
+    已保存结果文件的条目在 url 过期后仍可用于需要本地文件的调用（download_dir）。
+
+默认关闭，通过环境变量 DMXAPI_RESULT_CACHE 指定缓存目录，或在代码中开启:
+    configure_result_cache("~/.dmxapi/results", ttl=7 * 24 * 3600, store_files=True)
+"""
+import calendar
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+from dmxapi.download import download_results
+from dmxapi.singleflight import payload_key
+
+# 结果默认保存时间（秒）
+DEFAULT_TTL = 7 * 24 * 3600
+# 带签名的 url 在到期前多少秒视为失效，留出下载时间
+DEFAULT_URL_MARGIN = 600
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    task_id TEXT,
+    data TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    urls_expire_at REAL,
+    files TEXT
+);
+CREATE INDEX IF NOT EXISTS results_expires ON results (expires_at);
+"""
+
+
+def url_expiry(url):
+    """解析带签名 url 的到期时间（Unix 时间戳），不带签名参数时返回 None"""
+    query = {key.lower(): values[0] for key, values in parse_qs(urlsplit(url).query).items()}
+    # 绝对时间：CloudFront / 阿里云 OSS 等
+    for name in ("expires", "x-oss-expires", "x-expires"):
+        value = query.get(name, "")
+        if value.isdigit():
+            return int(value)
+    # 签名时间 + 有效秒数：S3 / GCS 的 V4 签名
+    for prefix in ("x-amz-", "x-goog-"):
+        signed, expires = query.get(prefix + "date"), query.get(prefix + "expires", "")
+        if signed and expires.isdigit():
+            try:
+                start = calendar.timegm(time.strptime(signed, "%Y%m%dT%H%M%SZ"))
+            except ValueError:
+                continue
+            return start + int(expires)
+    return None
+
+
+def result_urls(data):
+    """取出查询结果中的全部结果 url"""
+    urls = []
+    if isinstance(data, dict):
+        for key, value in data.items():
+            if key == 'url' and isinstance(value, str):
+                urls.append(value)
+            else:
+                urls.extend(result_urls(value))
+    elif isinstance(data, list):
+        for item in data:
+            urls.extend(result_urls(item))
+    return urls
+
+
+class ResultCache:
+    def __init__(self, path=None, ttl=DEFAULT_TTL, store_files=False, url_margin=DEFAULT_URL_MARGIN):
+        """初始化结果缓存
+
+        参数:
+            path: str, 缓存目录，None 表示关闭缓存（所有方法直接放行）
+            ttl: float, 结果保存时间（秒）
+            store_files: bool, 是否同时保存下载的结果文件，url 过期后仍可返回本地文件
+            url_margin: float, 带签名的 url 在到期前多少秒视为失效
+        """
+        self.path = os.path.expanduser(path) if path else None
+        self.ttl = ttl
+        self.store_files = store_files
+        self.url_margin = url_margin
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        if self.path:
+            os.makedirs(self.path, exist_ok=True)
+            self._conn = sqlite3.connect(os.path.join(self.path, "index.sqlite3"), timeout=30,
+                                         check_same_thread=False, isolation_level=None)
+            with self._lock:
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute("PRAGMA synchronous=NORMAL")
+                self._conn.executescript(_SCHEMA)
+
+    @property
+    def enabled(self):
+        return self._conn is not None
+
+    def key(self, endpoint, payload, headers):
+        """请求对应的缓存 key，缓存关闭时返回 None，不为哈希本地文件付出开销"""
+        return payload_key(endpoint, payload, headers) if self.enabled else None
+
+    def _row(self, key):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT data, expires_at, urls_expire_at, files FROM results WHERE key = ?", (key,)).fetchone()
+
+    def get(self, key, local=False):
+        """查找缓存的查询结果
+
+        参数:
+            key: str, 缓存 key，None 时直接返回 None
+            local: bool, 调用方是否只需要本地文件（设置了 download_dir），为 True 时已保存文件的条目不受 url 有效期限制
+        返回:
+            dict, 与轮询结果相同的 data，未命中或已过期时返回 None
+        """
+        if key is None or not self.enabled:
+            return None
+        row = self._row(key)
+        now = time.time()
+        if row is None:
+            self.misses += 1
+            return None
+        data, expires_at, urls_expire_at, files = row
+        if now >= expires_at:
+            self.expired += 1
+            self.discard(key)
+            return None
+        files_ok = local and files and all(os.path.exists(path) for path in json.loads(files))
+        if urls_expire_at is not None and now >= urls_expire_at and not files_ok:
+            # url 已失效又没有可用的本地文件，等同未命中；保留条目中的文件给需要本地文件的调用
+            self.expired += 1
+            if not files:
+                self.discard(key)
+            return None
+        self.hits += 1
+        return json.loads(data)
+
+    def put(self, key, data):
+        """保存任务成功的查询结果，key 或 data 为 None 时不保存"""
+        if key is None or data is None or not self.enabled:
+            return
+        now = time.time()
+        expiries = [url_expiry(url) for url in result_urls(data)]
+        expiries = [expiry - self.url_margin for expiry in expiries if expiry is not None]
+        with self._lock:
+            # 合并的调用会用同一个任务的结果重复写入，任务未变时保留已保存的文件
+            self._conn.execute(
+                "INSERT INTO results (key, task_id, data, created_at, expires_at, urls_expire_at, files)"
+                " VALUES (?, ?, ?, ?, ?, ?, NULL) ON CONFLICT (key) DO UPDATE SET"
+                " data = excluded.data, created_at = excluded.created_at, expires_at = excluded.expires_at,"
+                " urls_expire_at = excluded.urls_expire_at,"
+                " files = CASE WHEN results.task_id = excluded.task_id THEN results.files END,"
+                " task_id = excluded.task_id",
+                (key, data.get('task_id'), json.dumps(data, ensure_ascii=False), now, now + self.ttl,
+                 min(expiries) if expiries else None))
+
+    def download(self, key, urls, download_dir):
+        """把结果保存到 download_dir，已缓存结果文件时直接复制，不再访问 url
+
+        参数:
+            key: str, 缓存 key，None 时等同 download_results
+            urls: list, 结果 url 列表
+            download_dir: str, 保存目录
+        返回:
+            list, 本地文件路径
+        """
+        if key is None or not self.enabled:
+            return download_results(urls, download_dir)
+        row = self._row(key)
+        stored = json.loads(row[3]) if row is not None and row[3] else []
+        if len(stored) == len(urls) and all(os.path.exists(path) for path in stored):
+            os.makedirs(download_dir, exist_ok=True)
+            return [self._copy(path, os.path.join(download_dir, os.path.basename(path))) for path in stored]
+        paths = download_results(urls, download_dir)
+        if self.store_files and row is not None:
+            files_dir = os.path.join(self.path, "files", key)
+            os.makedirs(files_dir, exist_ok=True)
+            stored = [self._copy(path, os.path.join(files_dir, os.path.basename(path))) for path in paths]
+            with self._lock:
+                self._conn.execute("UPDATE results SET files = ? WHERE key = ?", (json.dumps(stored), key))
+        return paths
+
+    @staticmethod
+    def _copy(src, dest):
+        """优先硬链接，跨文件系统时复制"""
+        if os.path.abspath(src) == os.path.abspath(dest):
+            return dest
+        try:
+            if os.path.exists(dest):
+                os.remove(dest)
+            os.link(src, dest)
+        except OSError:
+            shutil.copy2(src, dest)
+        return dest
+
+    def discard(self, key):
+        """删除一条结果及其保存的文件"""
+        with self._lock:
+            self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+        shutil.rmtree(os.path.join(self.path, "files", key), ignore_errors=True)
+
+    def prune(self):
+        """删除全部已过期的结果，返回删除的条数"""
+        if not self.enabled:
+            return 0
+        with self._lock:
+            keys = [row[0] for row in self._conn.execute(
+                "SELECT key FROM results WHERE expires_at <= ?", (time.time(),)).fetchall()]
+        for key in keys:
+            self.discard(key)
+        return len(keys)
+
+    def stats(self):
+        """返回命中计数和条目数"""
+        entries = 0
+        if self.enabled:
+            with self._lock:
+                entries = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "expired": self.expired, "entries": entries}
+
+
+# 所有客户端共享的结果缓存，默认关闭，设置环境变量 DMXAPI_RESULT_CACHE 时使用该目录
+default_cache = None
+_default_lock = threading.Lock()
+
+
+def configure_result_cache(path, ttl=DEFAULT_TTL, store_files=False, url_margin=DEFAULT_URL_MARGIN):
+    """开启（或用 path=None 关闭）共享的结果缓存
+
+    返回:
+        ResultCache, 新的共享缓存
+    """
+    global default_cache
+    with _default_lock:
+        default_cache = ResultCache(path, ttl=ttl, store_files=store_files, url_margin=url_margin)
+        return default_cache
+
+
+def get_result_cache():
+    """返回当前共享的结果缓存"""
+    global default_cache
+    with _default_lock:
+        if default_cache is None:
+            default_cache = ResultCache(os.environ.get("DMXAPI_RESULT_CACHE") or None)
+        return default_cache
@@ -0,0 +1,328 @@
+"""请求重试策略与熔断器
+
+连接池的每次请求都经过节点共享的 RetryPolicy：失败按类别区分，各类别使用独立的指数退避（带随机抖动），
+同一接口连续失败时由熔断器直接拒绝请求，避免在故障期间持续冲击服务端。
+
+失败类别:
+    connection  建连失败、连接被重置、超时；建连失败时会丢弃全部空闲连接，之后的请求重新建连
+    throttled   HTTP 429，或业务码 1302（请求过快）、1303（并行任务超限）、Midjourney 23（队列已满）
+    server      HTTP 5xx
+    api         可重试的业务码 5000（服务内部错误）、5001（服务不可用）、5002（服务超时）
+    其他失败（参数错误、鉴权失败等）属于永久错误，直接返回给调用方
+
+提交任务的 POST 请求只在确定服务端没有受理时重试：请求未发出或未写完、429/503，或限流、服务不可用类业务码；
+发出后连接中断、500/502/504 等结果不确定的情况不重试，避免重复提交付费任务。
+
+重试总量受预算限制：每个首次请求存入 budget_ratio 次重试额度，另有每秒 budget_min_per_second 次的保底，
+大面积故障时重试流量最多为正常流量的 budget_ratio 倍，不会形成重试风暴。
+"""
+import collections
+import http.client
+import json
+import random
+import threading
+import time
+
+from dmxapi import metrics
+
+CONNECTION = "connection"
+THROTTLED = "throttled"
+SERVER = "server"
+API = "api"
+
+# 业务码 -> 失败类别
+RETRYABLE_CODES = {
+    1302: THROTTLED,
+    1303: THROTTLED,
+    23: THROTTLED,
+    5000: API,
+    5001: API,
+    5002: API,
+}
+# 非幂等请求也可以重试的状态码与业务码：服务端明确拒绝，任务一定没有创建
+REJECTED_STATUSES = (429, 503)
+REJECTED_CODES = (1302, 1303, 23, 5001)
+
+# 类别 -> (最多重试次数, 退避基数（秒）, 退避上限（秒）)
+DEFAULT_BACKOFF = {
+    CONNECTION: (3, 0.2, 5),
+    THROTTLED: (5, 1, 20),
+    SERVER: (3, 0.5, 10),
+    API: (2, 1, 10),
+}
+# 只解析不超过该长度的响应体来识别业务码
+MAX_CLASSIFY_BYTES = 64 * 1024
+
+# 熔断器状态，数值用于指标
+CLOSED = 0
+HALF_OPEN = 1
+OPEN = 2
+
+
+class CircuitOpenError(ConnectionError):
+    def __init__(self, route, retry_after):
+        """熔断期间的请求被直接拒绝
+
+        参数:
+            route: str, 被熔断的接口
+            retry_after: float, 距离下次试探还有多少秒
+        """
+        super().__init__(f"接口 {route} 连续失败，已暂停请求，{retry_after:.1f} 秒后重试")
+        self.route = route
+        self.retry_after = retry_after
+
+
+class RequestNotSentError(ConnectionError):
+    """建连失败或请求没有完整写出，服务端一定没有受理，任何方法都可以安全重试"""
+
+
+class CircuitBreaker:
+    def __init__(self, route, window=50, min_calls=20, failure_ratio=0.6, reset_timeout=2, max_reset_timeout=60):
+        """单个接口的熔断器
+
+        最近 window 次请求中失败比例达到 failure_ratio（且至少有 min_calls 次）时打开，
+        打开 reset_timeout 秒后放行一个试探请求：成功则关闭，失败则加倍打开时间，最长 max_reset_timeout。
+
+        参数:
+            route: str, 接口，仅用于错误信息和指标
+            window: int, 统计的最近请求数
+            min_calls: int, 开始判断所需的最少请求数
+            failure_ratio: float, 打开熔断的失败比例
+            reset_timeout: float, 首次打开的时间（秒）
+            max_reset_timeout: float, 打开时间上限（秒）
+        """
+        self.route = route
+        self.min_calls = min_calls
+        self.failure_ratio = failure_ratio
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.state = CLOSED
+        # 打开次数与被直接拒绝的请求数
+        self.opened = 0
+        self.rejected = 0
+        self._results = collections.deque(maxlen=window)
+        self._open_for = reset_timeout
+        self._open_until = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before(self):
+        """请求前调用，熔断打开时抛出 CircuitOpenError"""
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            now = time.monotonic()
+            if self.state == OPEN and now >= self._open_until:
+                self._set_state(HALF_OPEN)
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            self.rejected += 1
+            raise CircuitOpenError(self.route, max(self._open_until - now, 0))
+
+    def record(self, success):
+        """记录一次请求结果"""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probing = False
+                if success:
+                    self._results.clear()
+                    self._open_for = self.reset_timeout
+                    self._set_state(CLOSED)
+                else:
+                    self._open_for = min(self._open_for * 2, self.max_reset_timeout)
+                    self._trip()
+                return
+            if self.state == OPEN:
+                return
+            self._results.append(success)
+            failures = self._results.count(False)
+            if len(self._results) >= self.min_calls and failures >= self.failure_ratio * len(self._results):
+                self._trip()
+
+    def _trip(self):
+        self._open_until = time.monotonic() + self._open_for
+        self.opened += 1
+        self._set_state(OPEN)
+
+    def _set_state(self, state):
+        self.state = state
+        if metrics.ENABLED:
+            metrics.set_circuit_state(self.route, state)
+
+
+class RetryBudget:
+    def __init__(self, ratio=0.2, min_per_second=10, max_tokens=100):
+        """重试预算：首次请求存入 ratio 次额度，另按时间补充保底额度，每次重试消耗 1 次
+
+        参数:
+            ratio: float, 每个首次请求带来的重试额度
+            min_per_second: float, 每秒补充的保底额度，请求很少时也能重试
+            max_tokens: float, 额度上限
+        """
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self._tokens = min_per_second
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self._tokens + self.ratio, self.max_tokens)
+
+    def withdraw(self):
+        """取出一次重试额度，额度用尽时返回 False"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._tokens + (now - self._updated) * self.min_per_second, self.max_tokens)
+            self._updated = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+def response_code(res):
+    """取出响应体中的业务码，无法解析时返回 None"""
+    data = res.read()
+    if not data or len(data) > MAX_CLASSIFY_BYTES or data[:1] != b"{":
+        return None
+    try:
+        code = json.loads(data).get('code')
+    except ValueError:
+        return None
+    return code if isinstance(code, int) else None
+
+
+def classify_response(res):
+    """判断响应的失败类别
+
+    返回:
+        (类别, 是否确定未受理)，成功或永久错误时类别为 None
+    """
+    code = response_code(res)
+    if res.status == 429:
+        return THROTTLED, True
+    if res.status >= 500:
+        category = RETRYABLE_CODES.get(code, SERVER)
+        return category, res.status in REJECTED_STATUSES or code in REJECTED_CODES
+    if code in RETRYABLE_CODES:
+        return RETRYABLE_CODES[code], code in REJECTED_CODES
+    return None, False
+
+
+def classify_error(error):
+    """判断异常的失败类别
+
+    返回:
+        (类别, 是否确定未发出)，不可重试的异常类别为 None
+    """
+    if isinstance(error, CircuitOpenError):
+        return None, False
+    if isinstance(error, RequestNotSentError):
+        return CONNECTION, True
+    # socket 错误与超时、对端提前关闭（asyncio 读不完整为 EOFError）、HTTP 协议错误
+    if isinstance(error, (OSError, EOFError, http.client.HTTPException)):
+        return CONNECTION, False
+    return None, False
+
+
+class RetryPolicy:
+    def __init__(self, backoff=None, budget=None, breaker_options=None):
+        """节点共享的重试策略
+
+        参数:
+            backoff: dict, 类别 -> (最多重试次数, 退避基数, 退避上限)，缺省的类别使用 DEFAULT_BACKOFF
+            budget: RetryBudget, 可选，重试预算
+            breaker_options: dict, 可选，CircuitBreaker 的参数
+        """
+        self.backoff = dict(DEFAULT_BACKOFF, **(backoff or {}))
+        self.budget = budget or RetryBudget()
+        self.breaker_options = breaker_options or {}
+        self._breakers = {}
+        self._lock = threading.Lock()
+        # 各类别的重试次数，以及因预算用尽放弃的次数
+        self.retries = collections.Counter()
+        self.exhausted = 0
+
+    def breaker(self, route):
+        """接口对应的熔断器"""
+        with self._lock:
+            breaker = self._breakers.get(route)
+            if breaker is None:
+                breaker = self._breakers[route] = CircuitBreaker(route, **self.breaker_options)
+            return breaker
+
+    def delay(self, category, attempt, res=None):
+        """第 attempt 次重试前的等待时间，不应重试时返回 None
+
+        退避使用 full jitter：在 [0, min(上限, 基数 * 2^attempt)] 内均匀随机，
+        分散同时失败的请求；429 响应带 Retry-After 时至少等待该时间。
+        """
+        max_retries, base, cap = self.backoff[category]
+        if attempt >= max_retries:
+            return None
+        if not self.budget.withdraw():
+            with self._lock:
+                self.exhausted += 1
+            return None
+        wait = random.uniform(0, min(cap, base * 2 ** attempt))
+        retry_after = res.getheader('Retry-After') if res is not None else None
+        if retry_after and retry_after.isdigit():
+            wait = max(wait, min(int(retry_after), cap))
+        with self._lock:
+            self.retries[category] += 1
+        return wait
+
+    def plan(self, method, route, attempt, res=None, error=None):
+        """根据一次请求的结果决定是否重试，并更新熔断器
+
+        参数:
+            method: str, 请求方法，GET 以外的请求只在确定未受理时重试
+            route: str, 接口
+            attempt: int, 已重试次数，None 表示调用方不重试，只更新熔断器
+            res: PooledResponse, 请求成功返回时的响应
+            error: Exception, 请求抛出的异常
+        返回:
+            (类别, 等待秒数)，不重试时等待秒数为 None
+        """
+        if error is not None:
+            category, safe = classify_error(error)
+        else:
+            category, safe = classify_response(res)
+        # 限流说明服务端健康，不计入熔断
+        self.breaker(route).record(category in (None, THROTTLED))
+        if category is None or attempt is None or (method not in ("GET", "HEAD") and not safe):
+            return category, None
+        wait = self.delay(category, attempt, res)
+        if wait is not None and metrics.ENABLED:
+            metrics.record_retry(route, category)
+        return category, wait
+
+    def stats(self):
+        """返回重试计数和各接口熔断器状态"""
+        with self._lock:
+            breakers = {route: {"state": breaker.state, "opened": breaker.opened, "rejected": breaker.rejected}
+                        for route, breaker in self._breakers.items()}
+            return {"retries": dict(self.retries), "exhausted": self.exhausted, "breakers": breakers}
+
+
+# 按节点共享的重试策略，同步与异步连接池共用
+_policies = {}
+_policies_lock = threading.Lock()
+
+
+def get_retry_policy(api_url):
+    """获取节点共享的重试策略
+
+    参数:
+        api_url: API 节点地址
+    返回:
+        RetryPolicy
+    """
+    with _policies_lock:
+        policy = _policies.get(api_url)
+        if policy is None:
+            policy = _policies[api_url] = RetryPolicy()
+        return policy
@@ -0,0 +1,389 @@
+"""任务提交调度器
+
+服务端按接口、模型和模式限制提交速率与同时进行的任务数，超出时提交请求会被拒绝（code 1302/1303）。
+SubmitScheduler 在本地执行同样的限制：每条规则是一个令牌桶（requests/s）加一个进行中任务数上限，
+提交前先取得许可，超出限制的任务在本地排队，任务结束后归还许可。
+
+规则按 (endpoint, model_name, mode) 匹配，未填写的字段匹配任意值；一个任务需要同时满足所有匹配的规则。
+未配置任何规则时不做限制。
+
+排队的任务按优先级（interactive > normal > batch）、截止时间、提交顺序依次取得许可，
+排在前面的任务会为自己预留所需规则的名额，交互任务因此不会排在批量视频任务后面等待共享的并发名额。
+带截止时间的任务在按历史耗时已无法按时完成时直接放弃（DeadlineExceededError），不再占用额度。
+
+用法:
+    scheduler = get_scheduler(API_URL)
+    scheduler.set_limit(max_in_flight=20)  # 账号总并发
+    scheduler.set_limit(model_name="kling-v1-6", mode="pro", rate=1, max_in_flight=3)
+    with scheduler.acquire("/kling/v1/videos/image2video", "kling-v1-6", "pro", priority="batch"):
+        ...  # 提交任务并等待结束
+"""
+import asyncio
+import bisect
+import itertools
+import threading
+import time
+
+from dmxapi import metrics
+
+# 优先级从高到低
+PRIORITIES = ("interactive", "normal", "batch")
+DEFAULT_PRIORITY = "normal"
+
+
+class QueueTimeoutError(Exception):
+    """在超时时间内没有取得提交许可"""
+
+
+class DeadlineExceededError(QueueTimeoutError):
+    """按截止时间和预计耗时，任务已无法按时完成"""
+
+
+class _Rule:
+    __slots__ = ("endpoint", "model_name", "mode", "rate", "burst", "max_in_flight", "tokens", "updated",
+                 "in_flight")
+
+    def __init__(self, endpoint, model_name, mode):
+        self.endpoint = endpoint
+        self.model_name = model_name
+        self.mode = mode
+        self.rate = None
+        self.burst = 1
+        self.max_in_flight = None
+        self.tokens = 0
+        self.updated = time.monotonic()
+        self.in_flight = 0
+
+    @property
+    def selector(self):
+        return self.endpoint, self.model_name, self.mode
+
+    def matches(self, key):
+        return all(expected is None or expected == actual for expected, actual in zip(self.selector, key))
+
+    def refill(self, now):
+        if self.rate is not None:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, reserved_slots, reserved_tokens):
+        """为排在前面的任务预留并发名额和令牌后，距离可以取得许可还需等待的秒数，
+        需要等待进行中的任务结束时返回 None"""
+        if self.max_in_flight is not None and self.in_flight + reserved_slots >= self.max_in_flight:
+            return None
+        if self.rate is None:
+            return 0
+        return max(0, (reserved_tokens + 1 - self.tokens) / self.rate)
+
+    def describe(self):
+        return {
+            "endpoint": self.endpoint,
+            "model_name": self.model_name,
+            "mode": self.mode,
+            "rate": self.rate,
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+        }
+
+
+def _normalize(value):
+    # 服务端对模型名和模式不区分大小写（例如 Midjourney 的 "RELAX" 与 "Relax"）
+    return value.lower() if isinstance(value, str) else value
+
+
+class Permit:
+    def __init__(self, scheduler, rules):
+        """一次提交许可，任务结束后调用 release() 归还，也可以用作上下文管理器"""
+        self._scheduler = scheduler
+        self._rules = rules
+        self._released = False
+
+    def release(self):
+        """归还许可，重复调用无副作用"""
+        self._scheduler._release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class _Waiter:
+    __slots__ = ("key", "priority", "rank", "deadline", "expected", "enqueued", "wake", "permit", "error")
+
+    def __init__(self, key, priority, rank, deadline, expected, enqueued, wake):
+        self.key = key
+        self.priority = priority
+        # (优先级序号, 截止时间, 序号)，越小越先取得许可
+        self.rank = rank
+        self.deadline = deadline
+        self.expected = expected
+        self.enqueued = enqueued
+        self.wake = wake
+        self.permit = None
+        self.error = None
+
+    def __lt__(self, other):
+        return self.rank < other.rank
+
+
+class SubmitScheduler:
+    def __init__(self, limits=None):
+        """初始化提交调度器
+
+        参数:
+            limits: list, 可选，规则列表，每项为 set_limit 的关键字参数
+        """
+        self._lock = threading.Lock()
+        self._rules = []
+        # (endpoint, model_name, mode) -> 匹配的规则
+        self._matched = {}
+        # 等待许可的任务，按 rank 排序
+        self._waiters = []
+        self._seq = itertools.count()
+        # 令牌不足时在令牌补充后重新分发许可的定时器
+        self._timer = None
+        self._timer_due = None
+        # 优先级 -> 计数
+        self._counts = {priority: {"granted": 0, "timeout": 0, "expired": 0, "wait_seconds": 0.0}
+                        for priority in PRIORITIES}
+        for limit in limits or ():
+            self.set_limit(**limit)
+
+    def set_limit(self, endpoint=None, model_name=None, mode=None, rate=None, burst=None, max_in_flight=None):
+        """添加或修改一条规则，选择条件相同的规则会被修改
+
+        参数:
+            endpoint: str, 可选，提交接口
+            model_name: str, 可选，模型名称（Midjourney 为 botType）
+            mode: str, 可选，生成模式，例如 std / pro、RELAX / FAST
+            rate: float, 可选，每秒最多提交的任务数
+            burst: int, 可选，令牌桶容量，即允许的瞬时突发提交数，默认为 max(1, rate)
+            max_in_flight: int, 可选，同时进行中的任务数上限
+        """
+        selector = (endpoint, _normalize(model_name), _normalize(mode))
+        with self._lock:
+            rule = next((rule for rule in self._rules if rule.selector == selector), None)
+            created = rule is None
+            if created:
+                # 新规则的进行中任务数从 0 开始，已发出的许可不计入
+                rule = _Rule(*selector)
+                self._rules.append(rule)
+                self._matched.clear()
+            rule.refill(time.monotonic())
+            rule.rate = rate
+            rule.burst = burst if burst is not None else max(1, int(rate or 1))
+            # 新规则的令牌桶是满的，修改已有规则时保留剩余令牌
+            rule.tokens = rule.burst if created else min(rule.tokens, rule.burst)
+            rule.max_in_flight = max_in_flight
+            self._dispatch()
+
+    def load_limits(self, limits):
+        """批量添加规则
+
+        参数:
+            limits: list, 每项为 set_limit 的关键字参数
+        """
+        for limit in limits:
+            self.set_limit(**limit)
+
+    def _rules_for(self, key):
+        rules = self._matched.get(key)
+        if rules is None:
+            rules = self._matched[key] = [rule for rule in self._rules if rule.matches(key)]
+        return rules
+
+    def _dispatch(self):
+        """持有锁时调用：按 rank 依次为等待的任务分发许可
+
+        排在前面但还不能取得许可的任务为自己预留所需规则的名额，后面的任务只能使用剩余名额；
+        按截止时间已无法完成的任务直接放弃。
+        """
+        now = time.monotonic()
+        for rule in self._rules:
+            rule.refill(now)
+        reserved_slots = {}
+        reserved_tokens = {}
+        due = []
+        remaining = []
+        for waiter in self._waiters:
+            # 截止时间减去预计耗时，即最晚的提交时间
+            latest = None if waiter.deadline is None else waiter.deadline - (waiter.expected or 0)
+            if latest is not None and now > latest:
+                waiter.error = DeadlineExceededError(f"预计无法在截止时间前完成，放弃提交: {waiter.key}")
+                self._record(waiter, now, "expired")
+                waiter.wake()
+                continue
+            rules = self._rules_for(waiter.key)
+            delays = [rule.delay(reserved_slots.get(id(rule), 0), reserved_tokens.get(id(rule), 0))
+                      for rule in rules]
+            if delays and (None in delays or max(delays) > 0):
+                for rule in rules:
+                    reserved_slots[id(rule)] = reserved_slots.get(id(rule), 0) + 1
+                if None not in delays:
+                    # 只差令牌的任务很快就会提交，为它预留令牌；等待并发名额的任务不预留，
+                    # 否则低优先级任务在令牌桶容量很小时永远拿不到令牌
+                    for rule in rules:
+                        reserved_tokens[id(rule)] = reserved_tokens.get(id(rule), 0) + 1
+                    due.append(now + max(delays))
+                if latest is not None:
+                    due.append(latest)
+                remaining.append(waiter)
+                continue
+            waiter.permit = self._grant(rules)
+            self._record(waiter, now)
+            waiter.wake()
+        self._waiters = remaining
+        self._report_depth()
+        next_due = min(due, default=None)
+        if next_due is not None and (self._timer_due is None or next_due < self._timer_due):
+            if self._timer:
+                self._timer.cancel()
+            self._timer_due = next_due
+            self._timer = threading.Timer(next_due - now, self._on_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _on_timer(self):
+        with self._lock:
+            self._timer = None
+            self._timer_due = None
+            self._dispatch()
+
+    def _grant(self, rules):
+        for rule in rules:
+            if rule.rate is not None:
+                rule.tokens -= 1
+            rule.in_flight += 1
+        return Permit(self, rules)
+
+    def _record(self, waiter, now, dropped=None):
+        waited = now - waiter.enqueued
+        counts = self._counts[waiter.priority]
+        counts["wait_seconds"] += waited
+        counts[dropped or "granted"] += 1
+        if metrics.ENABLED:
+            metrics.record_submit_wait(waiter.key[0], waiter.priority, waited, dropped)
+
+    def _report_depth(self):
+        if not metrics.ENABLED:
+            return
+        depth = dict.fromkeys(PRIORITIES, 0)
+        for waiter in self._waiters:
+            depth[waiter.priority] += 1
+        for priority, count in depth.items():
+            metrics.set_submit_queue_depth(priority, count)
+
+    def _enqueue(self, endpoint, model_name, mode, priority, deadline, expected, wake):
+        """持有锁时调用：创建等待项并尝试立即分发"""
+        if priority not in PRIORITIES:
+            raise ValueError(f"未知的优先级: {priority}，可选值: {', '.join(PRIORITIES)}")
+        now = time.monotonic()
+        # 截止时间为 time.time() 时间戳，转换为单调时钟
+        deadline = None if deadline is None else now + (deadline - time.time())
+        key = (endpoint, _normalize(model_name), _normalize(mode))
+        rank = (PRIORITIES.index(priority), deadline if deadline is not None else float("inf"), next(self._seq))
+        waiter = _Waiter(key, priority, rank, deadline, expected, now, wake)
+        bisect.insort(self._waiters, waiter)
+        self._dispatch()
+        return waiter
+
+    def _abandon(self, waiter, timeout):
+        """持有锁时调用：等待超时，放弃排队并把预留的名额让给后面的任务"""
+        if waiter.permit or waiter.error:
+            return
+        self._waiters.remove(waiter)
+        waiter.error = QueueTimeoutError(f"等待提交许可超过 {timeout} 秒: {waiter.key}")
+        self._record(waiter, time.monotonic(), "timeout")
+        self._dispatch()
+
+    def acquire(self, endpoint, model_name="", mode="", timeout=None, priority=DEFAULT_PRIORITY, deadline=None,
+                expected=None):
+        """等待并取得一次提交许可
+
+        参数:
+            endpoint: str, 提交接口
+            model_name: str, 模型名称
+            mode: str, 生成模式
+            timeout: float, 可选，最长等待时间（秒）
+            priority: str, 优先级：interactive、normal 或 batch
+            deadline: float, 可选，任务需要完成的时间（time.time() 时间戳），同一优先级内截止时间早的先提交
+            expected: float, 可选，预计任务耗时（秒），截止时间前剩余时间不足时放弃提交
+        返回:
+            Permit, 任务结束后归还
+        """
+        event = threading.Event()
+        with self._lock:
+            waiter = self._enqueue(endpoint, model_name, mode, priority, deadline, expected, event.set)
+        if not event.wait(timeout):
+            with self._lock:
+                self._abandon(waiter, timeout)
+        if waiter.error:
+            raise waiter.error
+        return waiter.permit
+
+    async def acquire_async(self, endpoint, model_name="", mode="", timeout=None, priority=DEFAULT_PRIORITY,
+                            deadline=None, expected=None):
+        """acquire 的协程版本，等待期间不占用线程，参数与返回值一致"""
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+        with self._lock:
+            waiter = self._enqueue(endpoint, model_name, mode, priority, deadline, expected,
+                                   lambda: loop.call_soon_threadsafe(event.set))
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._abandon(waiter, timeout)
+        except asyncio.CancelledError:
+            with self._lock:
+                self._abandon(waiter, timeout)
+            if waiter.permit:
+                waiter.permit.release()
+            raise
+        if waiter.error:
+            raise waiter.error
+        return waiter.permit
+
+    def _release(self, permit):
+        with self._lock:
+            if permit._released:
+                return
+            permit._released = True
+            for rule in permit._rules:
+                rule.in_flight -= 1
+            if permit._rules and self._waiters:
+                self._dispatch()
+
+    def stats(self):
+        """返回各规则的进行中任务数，以及各优先级的排队数、等待时间和放弃数"""
+        with self._lock:
+            priorities = {}
+            for priority, counts in self._counts.items():
+                finished = counts["granted"] + counts["timeout"] + counts["expired"]
+                priorities[priority] = dict(
+                    counts,
+                    queued=sum(1 for waiter in self._waiters if waiter.priority == priority),
+                    wait_seconds=round(counts["wait_seconds"], 3),
+                    mean_wait=round(counts["wait_seconds"] / finished, 3) if finished else None,
+                )
+            return {
+                "rules": [rule.describe() for rule in self._rules],
+                "queued": len(self._waiters),
+                "priorities": priorities,
+            }
+
+
+# 每个 API 节点共享一个调度器
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(api_url):
+    """获取节点对应的共享提交调度器"""
+    with _schedulers_lock:
+        scheduler = _schedulers.get(api_url)
+        if scheduler is None:
+            scheduler = _schedulers[api_url] = SubmitScheduler()
+        return scheduler
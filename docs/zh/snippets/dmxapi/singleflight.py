@@ -0,0 +1,120 @@
+"""合并相同的进行中请求
+
+流水线的不同部分常常同时请求同一次生成（相同的模型、提示词、比例和参考图）。SingleFlight 按请求体的
+规范化哈希登记进行中的调用：第一个调用方（leader）正常提交并等待任务，之后到达的相同调用直接等待同一个
+Future，得到相同的结果或异常，只产生一个付费任务。leader 结束后登记即移除，之后的调用会提交新任务。
+
+合并（coalesce）与结果缓存（use_cache，见 dmxapi.result_cache）是生成方法上两个独立的开关。需要同一参数的另一份
+随机结果时，在调用处同时关闭两者（例如 generate_image(..., use_cache=False, coalesce=False)）。
+
+用法:
+    flights = get_single_flight(API_URL)
+    key = payload_key(endpoint, payload, headers)
+    data = flights.run(key, submit_and_wait, payload)
+"""
+import hashlib
+import json
+import threading
+from concurrent.futures import Future
+
+from dmxapi.encode_cache import get_encoding_cache
+
+
+def payload_key(endpoint, payload, headers=None):
+    """请求的规范化哈希
+
+    字段按名称排序后序列化，字段顺序和空白不影响结果；本地文件（FileBase64）按文件内容的 sha256 计入，
+    同一张图片的不同副本视为相同。不同 API 密钥的请求不会合并。
+
+    参数:
+        endpoint: str, 提交接口
+        payload: dict, 请求体，可以包含 FileBase64
+        headers: dict, 可选，请求头，只使用其中的 Authorization
+    返回:
+        str, 十六进制哈希
+    """
+    def default(value):
+        path = getattr(value, "path", None)
+        if path is None:
+            raise TypeError(f"无法序列化 {type(value).__name__}")
+        return {"sha256": get_encoding_cache().digest(path)}
+    text = json.dumps([endpoint, (headers or {}).get('Authorization', ""), payload], sort_keys=True,
+                      ensure_ascii=False, separators=(",", ":"), default=default)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    def __init__(self):
+        """相同 key 的并发调用只执行一次，其余调用等待并共享结果"""
+        # key -> 进行中调用的 Future
+        self._flights = {}
+        self._lock = threading.Lock()
+        # 实际执行的调用数与直接共享结果的调用数
+        self.leaders = 0
+        self.shared = 0
+
+    def run(self, key, func, *args, **kwargs):
+        """执行 func(*args, **kwargs)，相同 key 的调用正在进行时改为等待它的结果
+
+        参数:
+            key: str, 调用的唯一标识，通常为 payload_key 的结果；None 表示不合并
+            func: 实际执行的函数
+        返回:
+            func 的返回值；func 抛出异常时，所有等待者都收到同一个异常
+        """
+        if key is None:
+            return func(*args, **kwargs)
+        with self._lock:
+            future = self._flights.get(key)
+            leader = future is None
+            if leader:
+                future = self._flights[key] = Future()
+                self.leaders += 1
+            else:
+                self.shared += 1
+        if not leader:
+            return future.result()
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            self._release(key)
+            future.set_exception(e)
+            raise
+        self._release(key)
+        future.set_result(result)
+        return result
+
+    def _release(self, key):
+        # 先移除登记再设置结果，之后到达的调用提交新任务，不会拿到已结束调用的结果
+        with self._lock:
+            self._flights.pop(key, None)
+
+    def in_flight(self):
+        """返回进行中的不同调用数"""
+        with self._lock:
+            return len(self._flights)
+
+    def stats(self):
+        """返回合并计数"""
+        with self._lock:
+            return {"leaders": self.leaders, "shared": self.shared, "in_flight": len(self._flights)}
+
+
+# 按节点共享，同一节点的所有客户端实例互相合并
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def get_single_flight(api_url):
+    """获取节点共享的 SingleFlight
+
+    参数:
+        api_url: API 节点地址
+    返回:
+        SingleFlight
+    """
+    with _flights_lock:
+        flights = _flights.get(api_url)
+        if flights is None:
+            flights = _flights[api_url] = SingleFlight()
+        return flights
@@ -0,0 +1,188 @@
+"""任务回调接收器
+
+Kling 接口的 callback_url 和 Midjourney 接口的 notifyHook 会在任务状态变更时主动推送结果。
+WebhookReceiver 在本地启动一个轻量 HTTP 服务接收这些推送，并交给轮询器结束对应任务，
+轮询器只对回调任务做低频兜底查询，批量任务的状态查询流量因此接近于零。
+
+用法:
+    receiver = enable_webhook(API_URL, port=8099, public_url="https://your-server.com")
+    # 之后提交的任务自动填写 callback_url，结果由回调推送
+"""
+import json
+import secrets
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from dmxapi import endpoints
+from dmxapi.poller import DEFAULT_PUSH_FALLBACK_INTERVAL, get_poller
+
+# 暂存先于任务注册到达的回调数量上限
+DEFAULT_MAX_UNCLAIMED = 1000
+
+
+def parse_callback(json_data):
+    """解析回调内容
+
+    参数:
+        json_data: dict, 回调请求体
+    返回:
+        (task_id, 任务状态, data, 状态说明)，无法识别时返回 None
+    """
+    # 与查询接口相同的 {code, message, data} 外层结构
+    if isinstance(json_data.get('data'), dict):
+        json_data = json_data['data']
+    if 'task_status' in json_data:
+        return json_data['task_id'], json_data['task_status'], json_data, json_data.get('task_status_msg', "")
+    if 'status' in json_data and 'id' in json_data:
+        status, data, message = endpoints.parse_midjourney(json_data)
+        return json_data['id'], status, data, message
+    return None
+
+
+class _CallbackHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # 响应头和响应体分两次写出，关闭 Nagle 避免与客户端的延迟确认叠加出 40ms 等待
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        receiver = self.server.receiver
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        if self.path != receiver.path:
+            self._reply(404, {"code": 404, "message": "not found"})
+            return
+        try:
+            receiver.dispatch(json.loads(body.decode("utf-8")))
+        except Exception as e:
+            self._reply(400, {"code": 400, "message": str(e)})
+            return
+        self._reply(200, {"code": 0, "message": "ok"})
+
+    def _reply(self, status, obj):
+        data = json.dumps(obj).encode("utf-8")
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class WebhookReceiver:
+    def __init__(self, host="127.0.0.1", port=0, public_url=None, path=None, max_unclaimed=DEFAULT_MAX_UNCLAIMED):
+        """初始化回调接收器
+
+        参数:
+            host: str, 监听地址
+            port: int, 监听端口，0 表示随机端口
+            public_url: str, 服务端可访问的外部地址（例如反向代理或内网穿透地址），
+                默认使用监听地址，仅适用于本地调试
+            path: str, 回调路径，默认带随机令牌，其他路径的请求会被拒绝
+            max_unclaimed: int, 暂存先于任务注册到达的回调数量上限
+        """
+        self.host = host
+        self.port = port
+        self.public_url = public_url
+        self.path = path or f"/dmxapi/callback/{secrets.token_urlsafe(16)}"
+        self.max_unclaimed = max_unclaimed
+        self._listeners = []
+        # task_id -> (任务状态, data, 状态说明)
+        self._unclaimed = OrderedDict()
+        self._lock = threading.Lock()
+        self._server = None
+        self.received = 0
+        self.claimed = 0
+
+    @property
+    def url(self):
+        """提交任务时填写的回调地址"""
+        base = self.public_url or f"http://{self.host}:{self.port}"
+        return base.rstrip("/") + self.path
+
+    def start(self):
+        """在后台线程中启动 HTTP 服务
+
+        返回:
+            WebhookReceiver, 便于链式调用
+        """
+        self._server = ThreadingHTTPServer((self.host, self.port), _CallbackHandler)
+        self._server.daemon_threads = True
+        self._server.receiver = self
+        self.port = self._server.server_port
+        threading.Thread(target=self._server.serve_forever, name="dmxapi-webhook", daemon=True).start()
+        return self
+
+    def add_listener(self, listener):
+        """注册回调处理函数
+
+        参数:
+            listener: 以 (task_id, 任务状态, data, 状态说明) 调用，返回是否认领了该回调
+        """
+        with self._lock:
+            self._listeners.append(listener)
+
+    def dispatch(self, json_data):
+        """分发一条回调，没有处理函数认领的最终状态会被暂存
+
+        返回:
+            bool, 是否被认领
+        """
+        parsed = parse_callback(json_data)
+        if parsed is None:
+            raise ValueError("无法识别的回调内容")
+        task_id, status, data, message = parsed
+        with self._lock:
+            self.received += 1
+            listeners = list(self._listeners)
+        for listener in listeners:
+            if listener(task_id, status, data, message):
+                with self._lock:
+                    self.claimed += 1
+                return True
+        # 任务提交后、注册前回调就已到达，暂存等待 claim
+        if status in endpoints.FINAL_STATUSES:
+            with self._lock:
+                self._unclaimed[task_id] = (status, data, message)
+                while len(self._unclaimed) > self.max_unclaimed:
+                    self._unclaimed.popitem(last=False)
+        return False
+
+    def claim(self, task_id):
+        """取出暂存的回调
+
+        返回:
+            (任务状态, data, 状态说明)，没有暂存时返回 None
+        """
+        with self._lock:
+            early = self._unclaimed.pop(task_id, None)
+            if early:
+                self.claimed += 1
+            return early
+
+    def close(self):
+        """停止 HTTP 服务"""
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def enable_webhook(api_url, host="127.0.0.1", port=0, public_url=None,
+                   fallback_interval=DEFAULT_PUSH_FALLBACK_INTERVAL):
+    """启动回调接收器并接入节点对应的共享轮询器
+
+    参数:
+        api_url: API 节点地址
+        host: str, 监听地址
+        port: int, 监听端口
+        public_url: str, 服务端可访问的外部地址
+        fallback_interval: float, 回调丢失时的兜底轮询间隔（秒）
+    返回:
+        WebhookReceiver
+    """
+    receiver = WebhookReceiver(host=host, port=port, public_url=public_url).start()
+    get_poller(api_url).use_webhook(receiver, fallback_interval=fallback_interval)
+    return receiver
@@ -1,25 +1,33 @@
-import http.client
 import json
 import time
+from dmxapi import download_results, get_journal, get_poller, get_pool, get_scheduler
+from dmxapi.fanout import DEFAULT_MAX_WORKERS, generate_many
 
 class KlingVideoExtend:
-    def __init__(self, api_token, api_url):
+    def __init__(self, api_token, api_url, journal=None):
         """初始化 Kling 视频延长生成器
         
         参数:
             api_token: API 密钥
             api_url: API 节点地址
+            journal: TaskJournal, 可选，任务日志，默认使用节点共享的日志（未开启时不记录）
         """
         self.api_url = api_url
         self.api_token = api_token
-        # 初始化 HTTP 连接
-        self.conn = http.client.HTTPSConnection(self.api_url)
+        # 使用同一节点共享的 keep-alive 连接池
+        self.pool = get_pool(self.api_url)
+        # 所有实例共享同一个任务轮询器
+        self.poller = get_poller(self.api_url)
+        # 按节点共享的提交调度器，超出接口或模型的提交限制时在本地排队
+        self.scheduler = get_scheduler(self.api_url)
         self.endpoint = "/kling/v1/videos/video-extend"
         # 设置请求头
         self.headers = {
             'Authorization': f'Bearer {self.api_token}',
             'Content-Type': 'application/json'
         }
+        # 本地任务日志（默认关闭，见 dmxapi.journal）：提交前写入，结果写回日志
+        self.journal = journal if journal is not None else get_journal(self.api_url)
 
     def _kling_extend_video(self, task_id, video_id, prompt, negative_prompt="", cfg_scale=0.5, callback_url=""):
         """使用 kling 提交视频延长任务
@@ -44,47 +52,29 @@ class KlingVideoExtend:
             "callback_url": callback_url
         }
         
-        # 发送 POST 请求，提交视频延长任务
-        self.conn.request("POST", self.endpoint, json.dumps(payload), self.headers)
-        # 获取响应
-        res = self.conn.getresponse()
-        # 读取响应内容并解析为 JSON
-        json_data = json.loads(res.read().decode("utf-8"))
+        # 先写入任务日志再提交，进程在等待结果时退出也能找回任务
+        entry = self.journal.begin(self.endpoint, payload, self.headers)
+        
+        try:
+            # 发送 POST 请求，提交视频延长任务
+            res = self.pool.request("POST", self.endpoint, json.dumps(payload), self.headers)
+            # 读取响应内容并解析为 JSON
+            json_data = json.loads(res.read().decode("utf-8"))
+        except Exception as e:
+            # 熔断、连接失败等没有拿到响应的情况同样记录提交失败，不在日志中留下悬空的记录
+            self.journal.abandon(entry, e)
+            raise
         
         if 'code' in json_data and json_data['code'] == 0:
-            # 成功则返回提交的任务 id
+            # 成功则记录并返回提交的任务 id
+            self.journal.submitted(entry, json_data['data']['task_id'])
             return json_data['data']['task_id']
         else:
             # 失败则返回错误信息
+            self.journal.abandon(entry, json_data['message'])
             raise Exception(f"API调用失败：{json_data['message']}")
     
-    def _query_video_extend_result(self, task_id):
-        """使用查询接口获取视频延长结果
-        
-        参数:
-            task_id: 生成任务的 id
-        返回:
-            video_url: 延长后的视频 url，任务未完成时返回 None
-        """
-        # 构建查询路径
-        query_path = f"{self.endpoint}/{task_id}"
-
-        # 发送 GET 请求，查询视频延长任务状态
-        self.conn.request("GET", query_path, None, self.headers)
-        # 获取响应
-        res = self.conn.getresponse()
-        # 读取响应内容并解析为 JSON
-        json_data = json.loads(res.read().decode("utf-8"))
-        
-        # 如果任务状态为成功，则返回视频 url
-        if json_data['data']['task_status'] == "succeed":
-            video_url = json_data['data']['task_result']['videos'][0]['url']
-            video_id = json_data['data']['task_result']['videos'][0]['id']
-            return video_url, video_id
-        else: 
-            return None
-    
-    def extend_video(self, task_id, video_id, prompt, negative_prompt="", cfg_scale=0.5, callback_url="", timeout=300):
+    def extend_video(self, task_id, video_id, prompt, negative_prompt="", cfg_scale=0.5, callback_url="", timeout=300, download_dir="", priority="normal"):
         """实现功能，根据预设的参数延长视频并返回延长后的视频 url
         
         参数:
@@ -95,28 +85,77 @@ class KlingVideoExtend:
             cfg_scale: float, 提示词参考强度
             callback_url: str, 回调地址，可以用于 webhook 等通知场景
             timeout: int, 超时时间（秒）
+            download_dir: str, 可选，下载目录，设置后任务成功时立即把结果下载到本地，返回本地文件路径代替 url
+            priority: str, 提交优先级：interactive、normal 或 batch，超出提交限制排队时优先级高、截止时间早的先提交
         返回:
-            video_url: 延长后的视频 url
+            video_url: 延长后的视频 url，超时为 None
+        异常:
+            TaskFailedError: 任务在服务端执行失败（task_status 为 failed），查询到失败时立即抛出，不再等到超时
+            DeadlineExceededError: 按历史耗时（p10）预计无法在 timeout 内完成，放弃提交，不产生任务
+            CircuitOpenError: 接口连续失败已被熔断，暂停提交
         """
-        # 调用视频延长 API 提交任务，返回获取 task_id
-        task_id = self._kling_extend_video(task_id, video_id, prompt, negative_prompt, cfg_scale, callback_url)
+        # 接入回调接收器后自动填写回调地址，任务结果由回调推送，轮询仅作兜底
+        callback_url = callback_url or self.poller.callback_url()
+        stats_key = (self.endpoint,)
+        # 按优先级和截止时间排队取得提交许可，按历史耗时已无法在 timeout 内完成时直接放弃；任务结束时归还许可
+        with self.scheduler.acquire(self.endpoint, priority=priority, deadline=time.time() + timeout,
+                                    expected=self.poller.estimate(stats_key)):
+            # 调用视频延长 API 提交任务，返回获取 task_id
+            task_id = self._kling_extend_video(task_id, video_id, prompt, negative_prompt, cfg_scale, callback_url)
         
-        start_time = time.time()
-        
-        # 轮询等待生成完成
-        while True:
-            # 根据 task_id 调用查询 API 查看任务是否完成
-            video_url, video_id = self._query_video_extend_result(task_id)
-            # 如果任务完成，则返回视频 url
-            if video_url is not None:
-                return video_url, video_id
-            # 如果轮询超时，则返回 None
-            if time.time() - start_time > timeout:
-                print(f"请求达到 {timeout} 秒超时")
-                return None
-            # 轮询间隔 1 秒
-            time.sleep(1)
-            print(f"等待视频延长结果生成，{int(time.time() - start_time)} 秒", flush=True)
+            # 注册到共享轮询器并记入任务日志，由统一调度器按历史耗时自适应轮询，任务结束后返回
+            data = self.journal.register(self.poller, self.endpoint, task_id, self.headers, interval=1,
+                                         timeout=timeout, stats_key=stats_key).result()
+        # 如果轮询超时，则返回 None
+        if data is None:
+            print(f"请求达到 {timeout} 秒超时")
+            return None
+        # 任务成功，返回视频 url 和 id
+        video = data['task_result']['videos'][0]
+        if download_dir:
+            # 任务成功后立即下载到本地，返回本地文件路径
+            return download_results([video['url']], download_dir)[0], video['id']
+        return video['url'], video['id']
+
+    def generate_many(self, params_list, max_workers=DEFAULT_MAX_WORKERS):
+        """并发续写多个视频，按完成顺序返回结果
+
+        实例可以在多个线程中同时使用：请求经过共享连接池，每次请求单独取出连接。
+
+        参数:
+            params_list: list[dict], 每项为 extend_video 的关键字参数
+            max_workers: int, 同时进行的任务数
+        返回:
+            生成器，按完成顺序产出 (序号, 结果, 异常)，序号为参数在 params_list 中的位置，
+            结果与 extend_video 的返回值相同（(视频 url, 视频 id)），失败时结果为 None、异常为抛出的异常
+        """
+        return generate_many(self.extend_video, params_list, max_workers)
+
+    def iter_status(self, task_ids, timeout=600):
+        """轮询一个或多个已提交的任务，按发生顺序产出状态变化
+
+        多个任务共用节点的轮询器，不为每个任务开线程；任务在服务端失败时立即以 failed 结束，不再等到超时。
+        调用方提前停止迭代时，这些任务随即停止轮询（仍有 generate 调用在等待的任务除外）。
+
+        参数:
+            task_ids: str 或 list, 任务 id
+            timeout: int, 每个任务的超时时间（秒）
+        返回:
+            生成器，产出 StatusEvent：task_id、status（submitted、processing、succeed、failed 或 timeout）、
+            previous、message（task_status_msg）、data
+        """
+        return self.poller.iter_status(self.endpoint, task_ids, self.headers, interval=1, timeout=timeout)
+
+
+    def resume(self, callback=None):
+        """接管上次进程退出时本接口仍未结束的任务，需要开启任务日志，同一密钥只执行一次
+
+        参数:
+            callback: 可选，每个任务结束时以 Future 为参数调用
+        返回:
+            dict, task_id -> Future，任务结果同时写回日志
+        """
+        return self.journal.resume(self.poller, self.headers, endpoint=self.endpoint, callback=callback)
 
 
 # 使用示例
@@ -1,26 +1,38 @@
-import http.client
+import base64
 import json
 import time
-import base64
+from dmxapi import FileBase64, StreamingJSONBody, get_journal, get_poller, get_pool, get_preprocessor, get_result_cache, get_scheduler, get_single_flight, payload_key
+from dmxapi.fanout import DEFAULT_MAX_WORKERS, generate_many
 
 class KlingVirtualTryOn:
-    def __init__(self, api_token, api_url):
+    def __init__(self, api_token, api_url, journal=None):
         """初始化 Kling 虚拟试穿生成器
         
         参数:
             api_token: API 密钥
             api_url: API 节点地址
+            journal: TaskJournal, 可选，任务日志，默认使用节点共享的日志（未开启时不记录）
         """
         self.api_url = api_url
         self.api_token = api_token
-        # 初始化 HTTP 连接
-        self.conn = http.client.HTTPSConnection(self.api_url)
+        # 使用同一节点共享的 keep-alive 连接池
+        self.pool = get_pool(self.api_url)
+        # 所有实例共享同一个任务轮询器
+        self.poller = get_poller(self.api_url)
+        # 按节点共享的提交调度器，超出接口或模型的提交限制时在本地排队
+        self.scheduler = get_scheduler(self.api_url)
         self.endpoint = "/kling/v1/images/kolors-virtual-try-on"
         # 设置请求头
         self.headers = {
             'Authorization': f'Bearer {self.api_token}',
             'Content-Type': 'application/json'
         }
+        # 本地任务日志（默认关闭，见 dmxapi.journal）：提交前写入，结果写回日志
+        self.journal = journal if journal is not None else get_journal(self.api_url)
+        # 按节点共享的进行中请求登记，相同参数的并发调用共用同一个任务
+        self.flights = get_single_flight(self.api_url)
+        # 本地结果缓存（默认关闭），相同请求直接返回上次的结果
+        self.results = get_result_cache()
     
     @staticmethod
     def get_image_base64(image_path):
@@ -34,6 +46,21 @@ class KlingVirtualTryOn:
         with open(image_path, "rb") as image_file:
             return base64.b64encode(image_file.read()).decode("utf-8")
 
+    @staticmethod
+    def _stream_image_base64(image_path, endpoint=None, aspect_ratio=None, lossless=False):
+        """提交任务时使用的图片 base64 占位符，代替 get_image_base64 的完整字符串
+        
+        参数:
+            image_path: 图片路径
+            endpoint: str, 可选，提交接口，开启图片预处理时按该接口的分辨率上限缩小图片
+            aspect_ratio: str, 可选，请求的输出比例，预处理开启 crop 时按该比例居中裁剪
+            lossless: bool, 是否保持无损，遮罩等图片使用
+        返回:
+            FileBase64, 发送请求时才分块读取并编码，不会整体载入内存
+        """
+        # 开启图片预处理（见 dmxapi.preprocess）时上传缩小、重新编码后的图片，默认原样上传
+        return FileBase64(get_preprocessor().prepare(image_path, endpoint, aspect_ratio, lossless))
+
     def _kling_virtual_try_on(self, model_name, human_image, cloth_image, callback_url=""):
         """使用 kling 生成虚拟试穿图像
         
@@ -53,46 +80,30 @@ class KlingVirtualTryOn:
             "callback_url": callback_url
         }
         
-        # 发送 POST 请求，提交虚拟试穿任务
-        self.conn.request("POST", self.endpoint, json.dumps(payload), self.headers)
-        # 获取响应
-        res = self.conn.getresponse()
-        # 读取响应内容并解析为 JSON
-        json_data = json.loads(res.read().decode("utf-8"))
+        # 先写入任务日志再提交，进程在等待结果时退出也能找回任务
+        entry = self.journal.begin(self.endpoint, payload, self.headers)
+        
+        try:
+            # 发送 POST 请求，提交虚拟试穿任务
+            # 请求体以流式方式发送，本地文件在写入 socket 时才逐块编码
+            res = self.pool.request("POST", self.endpoint, StreamingJSONBody(payload), self.headers)
+            # 读取响应内容并解析为 JSON
+            json_data = json.loads(res.read().decode("utf-8"))
+        except Exception as e:
+            # 熔断、连接失败等没有拿到响应的情况同样记录提交失败，不在日志中留下悬空的记录
+            self.journal.abandon(entry, e)
+            raise
         
         if 'code' in json_data and json_data['code'] == 0:
-            # 成功则返回提交的任务 id
+            # 成功则记录并返回提交的任务 id
+            self.journal.submitted(entry, json_data['data']['task_id'])
             return json_data['data']['task_id']
         else:
             # 失败则返回错误信息
+            self.journal.abandon(entry, json_data['message'])
             raise Exception(f"API调用失败：{json_data['message']}")
     
-    def _query_virtual_try_on_result(self, task_id):
-        """使用查询接口获取虚拟试穿结果
-        
-        参数:
-            task_id: 生成任务的 id
-        返回:
-            result_image: 虚拟试穿结果图像 url，任务未完成时返回 None
-        """
-        # 构建查询路径
-        query_path = f"{self.endpoint}/{task_id}"
-
-        # 发送 GET 请求，查询虚拟试穿任务状态
-        self.conn.request("GET", query_path, None, self.headers)
-        # 获取响应
-        res = self.conn.getresponse()
-        # 读取响应内容并解析为 JSON
-        json_data = json.loads(res.read().decode("utf-8"))
-        
-        # 如果任务状态为成功，则返回结果图像 url
-        if json_data['data']['task_status'] == "succeed":
-            result_image = json_data['data']['task_result']['images'][0]['url']
-            return result_image
-        else: 
-            return None
-    
-    def generate_try_on(self, model_name, human_image, cloth_image, callback_url="", timeout=120):
+    def generate_try_on(self, model_name, human_image, cloth_image, callback_url="", timeout=120, download_dir="", priority="normal", use_cache=True, coalesce=True):
         """实现功能，根据人物图像和服饰图像生成虚拟试穿结果
         
         参数:
@@ -101,8 +112,17 @@ class KlingVirtualTryOn:
             cloth_image: str, 服饰图片路径或URL
             callback_url: str, 回调地址，可以用于 webhook 等通知场景
             timeout: int, 超时时间（秒）
+            download_dir: str, 可选，下载目录，设置后任务成功时立即把结果下载到本地，返回本地文件路径代替 url
+            priority: str, 提交优先级：interactive、normal 或 batch，超出提交限制排队时优先级高、截止时间早的先提交
+            use_cache: bool, 开启结果缓存时是否复用相同参数的上次结果并保存本次结果，设为 False 时不读写结果缓存
+            coalesce: bool, 相同参数的请求正在进行时是否直接等待它的结果，设为 False 时不与进行中的请求合并；
+                两者都设为 False 时总是提交新任务（需要另一份随机结果时）
         返回:
-            result_image: 虚拟试穿结果图像 url
+            result_image: 虚拟试穿结果图像 url，超时为 None
+        异常:
+            TaskFailedError: 任务在服务端执行失败（task_status 为 failed），查询到失败时立即抛出，不再等到超时
+            DeadlineExceededError: 按历史耗时（p10）预计无法在 timeout 内完成，放弃提交，不产生任务
+            CircuitOpenError: 接口连续失败已被熔断，暂停提交
         """
         # 处理人物图片输入
         if human_image.startswith(('http://', 'https://', 'ftp://')):
@@ -111,7 +131,7 @@ class KlingVirtualTryOn:
         else:
             # 否则当作本地文件路径处理，转换为base64
             try:
-                human_data = KlingVirtualTryOn.get_image_base64(human_image)
+                human_data = KlingVirtualTryOn._stream_image_base64(human_image, self.endpoint)
             except Exception as e:
                 raise ValueError(f"无法读取人物图像文件: {str(e)}")
                 
@@ -122,29 +142,90 @@ class KlingVirtualTryOn:
         else:
             # 否则当作本地文件路径处理，转换为base64
             try:
-                cloth_data = KlingVirtualTryOn.get_image_base64(cloth_image)
+                cloth_data = KlingVirtualTryOn._stream_image_base64(cloth_image, self.endpoint)
             except Exception as e:
                 raise ValueError(f"无法读取服饰图像文件: {str(e)}")
         
-        # 调用虚拟试穿 API 提交任务，返回获取 task_id
-        task_id = self._kling_virtual_try_on(model_name, human_data, cloth_data, callback_url)
-        
-        start_time = time.time()
-        
-        # 轮询等待生成完成
-        while True:
-            # 根据 task_id 调用查询 API 查看任务是否完成
-            result_image = self._query_virtual_try_on_result(task_id)
-            # 如果任务完成，则返回结果图像 url
-            if result_image is not None:
-                return result_image
-            # 如果轮询超时，则返回 None
-            if time.time() - start_time > timeout:
-                print(f"请求达到 {timeout} 秒超时")
-                return None
-            # 轮询间隔 1 秒
-            time.sleep(1)
-            print(f"等待虚拟试穿结果生成，{int(time.time() - start_time)} 秒", flush=True)
+        # 相同参数的请求正在进行时等待同一个任务，开启结果缓存时直接返回上次的结果，不重复提交付费任务；
+        # 本地图片按文件内容计入，回调地址按调用方传入的值计入，自动填写的接收器地址不影响命中
+        key = None
+        if coalesce or (use_cache and self.results.enabled):
+            key = payload_key(self.endpoint, {
+                "model_name": model_name, "human_image": human_data, "cloth_image": cloth_data,
+                "callback_url": callback_url,
+            }, self.headers)
+        # 接入回调接收器后自动填写回调地址，任务结果由回调推送，轮询仅作兜底
+        callback_url = callback_url or self.poller.callback_url()
+        # 结果缓存命中时不提交任务；未命中时提交并把成功的结果写入缓存。两个开关分别控制 key 的两种用途
+        cache_key = key if use_cache else None
+        flight_key = key if coalesce else None
+        data = self.results.get(cache_key, local=bool(download_dir))
+        if data is None:
+            data = self.flights.run(flight_key, self._submit_and_wait, model_name, human_data, cloth_data, callback_url,
+                                    timeout, priority)
+            self.results.put(cache_key, data)
+        # 如果轮询超时，则返回 None
+        if data is None:
+            print(f"请求达到 {timeout} 秒超时")
+            return None
+        # 任务成功，返回结果图像 url
+        image_url = data['task_result']['images'][0]['url']
+        if download_dir:
+            # 任务成功后立即下载到本地，返回本地文件路径；缓存中已保存结果文件时直接复制
+            return self.results.download(cache_key, [image_url], download_dir)[0]
+        return image_url
+
+    def _submit_and_wait(self, model_name, human_data, cloth_data, callback_url, timeout, priority):
+        """提交任务并等待结束，返回查询结果的 data，超时返回 None"""
+        stats_key = (self.endpoint, model_name)
+        # 按优先级和截止时间排队取得提交许可，按历史耗时已无法在 timeout 内完成时直接放弃；任务结束时归还许可
+        with self.scheduler.acquire(self.endpoint, model_name, priority=priority, deadline=time.time() + timeout,
+                                    expected=self.poller.estimate(stats_key)):
+            # 调用虚拟试穿 API 提交任务，返回获取 task_id
+            task_id = self._kling_virtual_try_on(model_name, human_data, cloth_data, callback_url)
+            # 注册到共享轮询器并记入任务日志，由统一调度器按历史耗时自适应轮询，任务结束后返回
+            return self.journal.register(self.poller, self.endpoint, task_id, self.headers, interval=1,
+                                         timeout=timeout, stats_key=stats_key).result()
+
+    def generate_many(self, params_list, max_workers=DEFAULT_MAX_WORKERS):
+        """并发生成多张试穿图像，按完成顺序返回结果
+
+        实例可以在多个线程中同时使用：请求经过共享连接池，每次请求单独取出连接。
+
+        参数:
+            params_list: list[dict], 每项为 generate_try_on 的关键字参数
+            max_workers: int, 同时进行的任务数
+        返回:
+            生成器，按完成顺序产出 (序号, 结果, 异常)，序号为参数在 params_list 中的位置，
+            结果与 generate_try_on 的返回值相同（图像 url），失败时结果为 None、异常为抛出的异常
+        """
+        return generate_many(self.generate_try_on, params_list, max_workers)
+
+    def iter_status(self, task_ids, timeout=600):
+        """轮询一个或多个已提交的任务，按发生顺序产出状态变化
+
+        多个任务共用节点的轮询器，不为每个任务开线程；任务在服务端失败时立即以 failed 结束，不再等到超时。
+        调用方提前停止迭代时，这些任务随即停止轮询（仍有 generate 调用在等待的任务除外）。
+
+        参数:
+            task_ids: str 或 list, 任务 id
+            timeout: int, 每个任务的超时时间（秒）
+        返回:
+            生成器，产出 StatusEvent：task_id、status（submitted、processing、succeed、failed 或 timeout）、
+            previous、message（task_status_msg）、data
+        """
+        return self.poller.iter_status(self.endpoint, task_ids, self.headers, interval=1, timeout=timeout)
+
+
+    def resume(self, callback=None):
+        """接管上次进程退出时本接口仍未结束的任务，需要开启任务日志，同一密钥只执行一次
+
+        参数:
+            callback: 可选，每个任务结束时以 Future 为参数调用
+        返回:
+            dict, task_id -> Future，任务结果同时写回日志
+        """
+        return self.journal.resume(self.poller, self.headers, endpoint=self.endpoint, callback=callback)
 
 
 # 使用示例
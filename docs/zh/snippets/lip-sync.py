@@ -5,9 +5,6 @@ import json
 API_URL = "www.dmxapi.cn" # API 节点
 DMX_API_TOKEN = "sk-XXXXXXXXXXXXX" # API 密钥
 
-# 创建HTTP连接对象，用于后续所有API请求
-conn = http.client.HTTPSConnection(API_URL)
-
 def kling_lip_sync():
     """调用 Kling AI 的口型同步API，提交一个口型同步任务
     
@@ -46,11 +43,13 @@ def kling_lip_sync():
     'Authorization': f'Bearer {DMX_API_TOKEN}',  # 使用Bearer令牌认证方式
     'Content-Type': 'application/json'  # 指定请求体格式为JSON
     }
+    conn = http.client.HTTPSConnection(API_URL)
     # 发送POST请求，路径为图像生成API端点
     conn.request("POST", "/kling/v1/videos/lip-sync", payload, headers)
     # 获取API响应并解析JSON数据
     res = conn.getresponse()
     json_data = json.loads(res.read().decode("utf-8"))
+    conn.close()
     # print(json_data)
     if json_data['code'] == 0:
         # 成功则返回提交的任务 id
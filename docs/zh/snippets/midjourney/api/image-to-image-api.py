@@ -2,20 +2,66 @@ import http.client
 import json
 import requests
 import base64
+import hashlib
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 
 # 配置全局变量
 API_URL = "www.dmxapi.cn" # API 节点
 DMX_API_TOKEN = "sk-XXXXXXXXXXXXX" # API 密钥
 
+# 图片下载配置
+IMAGE_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".dmxapi", "mj-image-cache") # 图片磁盘缓存目录
+MAX_IMAGE_BYTES = 20 * 1024 * 1024 # 单张图片最大字节数
+DOWNLOAD_TIMEOUT = (5, 30) # 连接超时、读取超时（秒）
+DOWNLOAD_WORKERS = 4 # 同时下载的图片数量
+
+# 共享会话，复用到图片源站的 keep-alive 连接
+session = requests.Session()
+session.mount("http://", HTTPAdapter(pool_connections=8, pool_maxsize=DOWNLOAD_WORKERS * 2))
+session.mount("https://", HTTPAdapter(pool_connections=8, pool_maxsize=DOWNLOAD_WORKERS * 2))
+
 # 获取图片的base64编码
 def get_image_base64(image_path):
     with open(image_path, "rb") as image_file:
         return base64.b64encode(image_file.read()).decode("utf-8")
 
+# 读取图片缓存，返回 (图片内容, 缓存校验信息)
+def _read_image_cache(cache_path):
+    try:
+        with open(cache_path + ".json", "r", encoding="utf-8") as meta_file:
+            meta = json.load(meta_file)
+        with open(cache_path, "rb") as image_file:
+            return image_file.read(), meta
+    except (OSError, ValueError):
+        return None, {}
+
+# 写入临时文件后替换目标文件；每次写入使用独立的临时文件，同时下载同一张图片的线程互不覆盖
+def _replace_file(path, data):
+    fd, tmp_path = tempfile.mkstemp(dir=IMAGE_CACHE_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as tmp_file:
+            tmp_file.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+# 写入图片缓存，先写临时文件再替换，避免并发时读到半个文件
+def _write_image_cache(cache_path, image_binary, meta):
+    os.makedirs(IMAGE_CACHE_DIR, exist_ok=True)
+    _replace_file(cache_path, image_binary)
+    _replace_file(cache_path + ".json", json.dumps(meta).encode("utf-8"))
+
 # 从URL获取图片并转换为base64格式
 def url_image_to_base64(image_url):
     """
     从URL获取图片并转换为base64格式
+
+    使用共享会话复用连接；已缓存的图片带上 ETag/Last-Modified 做条件请求，
+    源站返回 304 时直接使用磁盘缓存。下载以流式方式进行，超过 MAX_IMAGE_BYTES 时中止。
     
     参数:
         image_url (str): 图片的URL地址
@@ -24,11 +70,43 @@ def url_image_to_base64(image_url):
         str: base64编码的图片字符串
     """
     try:
+        cache_path = os.path.join(IMAGE_CACHE_DIR, hashlib.sha256(image_url.encode("utf-8")).hexdigest())
+        cached_binary, meta = _read_image_cache(cache_path)
+
+        # 有缓存时发送条件请求
+        headers = {}
+        if cached_binary is not None:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
         # 发送GET请求获取图片
-        response = requests.get(image_url)
+        with session.get(image_url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+            if response.status_code == 304 and cached_binary is not None:
+                image_binary = cached_binary
+            else:
+                response.raise_for_status()
+                if int(response.headers.get("Content-Length") or 0) > MAX_IMAGE_BYTES:
+                    raise ValueError(f"图片超过 {MAX_IMAGE_BYTES} 字节上限")
+                # 流式读取，超过大小上限时中止
+                chunks = []
+                received = 0
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    received += len(chunk)
+                    if received > MAX_IMAGE_BYTES:
+                        raise ValueError(f"图片超过 {MAX_IMAGE_BYTES} 字节上限")
+                    chunks.append(chunk)
+                image_binary = b"".join(chunks)
+                # 只有带校验信息的响应才写缓存，否则下次仍需完整下载
+                meta = {
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                }
+                if meta["etag"] or meta["last_modified"]:
+                    _write_image_cache(cache_path, image_binary, meta)
         
         # 将图片内容编码为base64
-        image_binary = response.content
         base64_encoded = base64.b64encode(image_binary).decode('utf-8')
         
         return base64_encoded
@@ -37,14 +115,28 @@ def url_image_to_base64(image_url):
         print(f"获取图片失败: {str(e)}")
         return None
 
-# 提交图生图任务
+# 并发获取多张图片，返回顺序与输入一致
+def urls_image_to_base64(image_urls):
+    """
+    并发获取多张URL图片并转换为base64格式
+
+    参数:
+        image_urls (list): 图片URL列表
+
+    返回:
+        list: base64编码的图片字符串列表，获取失败的位置为 None
+    """
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as executor:
+        return list(executor.map(url_image_to_base64, image_urls))
+
+# 提交图生图任务，image_path 可以是单个图片，也可以是多个图片组成的列表
 def midjourney_generate_image(image_path):
 
-    # 获取图片的base64编码
-    if image_path.startswith('https://') or image_path.startswith('http://'):
-        base64_string = url_image_to_base64(image_path)
-    else:
-        base64_string = get_image_base64(image_path)
+    # 获取图片的base64编码，多个URL图片并发下载
+    image_paths = [image_path] if isinstance(image_path, str) else list(image_path)
+    image_urls = [path for path in image_paths if path.startswith('https://') or path.startswith('http://')]
+    url_base64 = dict(zip(image_urls, urls_image_to_base64(image_urls)))
+    base64_strings = [url_base64[path] if path in url_base64 else get_image_base64(path) for path in image_paths]
 
     conn = http.client.HTTPSConnection(API_URL)
     payload = json.dumps({
@@ -52,7 +144,7 @@ def midjourney_generate_image(image_path):
        "botType": "NIJI_JOURNEY", # 模型类型，可选值 "MID_JOURNEY"（默认） 或者 "NIJI_JOURNEY"
        "prompt": "这是一个视频截图，请生成对应的吉卜力风格的图片", # 提示词，描述希望生成的图片内容
        "base64Array": [
-          "data:image/png;base64," + base64_string # 包含图片 base64 数据的数组，格式为 "data:image/png;base64,<base64字符串>"
+          "data:image/png;base64," + base64_string for base64_string in base64_strings # 包含图片 base64 数据的数组，格式为 "data:image/png;base64,<base64字符串>"
        ],
        "notifyHook": "string" # 回调通知的 URL，处理完成后会向该地址发送回调
     })
@@ -1,12 +1,18 @@
 import http.client
 import json
+import threading
 
 # 配置全局变量
 API_URL = "www.dmxapi.cn" # API 节点
 DMX_API_TOKEN = "sk-XXXXXXXXXXXXX" # API 密钥
 
-# 创建HTTP连接对象，用于后续所有API请求
-conn = http.client.HTTPSConnection(API_URL)
+# 轮询时会反复查询，每个线程保留一条连接复用
+_local = threading.local()
+
+def get_conn():
+    if not hasattr(_local, "conn"):
+        _local.conn = http.client.HTTPSConnection(API_URL)
+    return _local.conn
 
 def query_midjourney_task_api(task_id):
     # 设置 Request headers
@@ -18,6 +24,7 @@ def query_midjourney_task_api(task_id):
     query_path = f"/mj/task/{task_id}/fetch"
 
     try:
+        conn = get_conn()
         # request 请求规范：方法, URL, body, headers
         conn.request("GET", query_path, None, headers)
         # 获取响应并解析JSON数据
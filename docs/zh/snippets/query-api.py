@@ -1,12 +1,18 @@
 import http.client
 import json
+import threading
 
 # 配置全局变量
 API_URL = "www.dmxapi.cn" # API 节点
 DMX_API_TOKEN = "sk-XXXXXXXXXX" # API 密钥
 
-# 创建HTTP连接对象，用于后续所有API请求
-conn = http.client.HTTPSConnection(API_URL)
+# 轮询时会反复查询，每个线程保留一条连接复用
+_local = threading.local()
+
+def get_conn():
+    if not hasattr(_local, "conn"):
+        _local.conn = http.client.HTTPSConnection(API_URL)
+    return _local.conn
 
 def query_kling_image_url(task_id):
     """查询已提交的图像生成任务的状态和结果
@@ -24,6 +30,7 @@ def query_kling_image_url(task_id):
     headers = {
     'Authorization': f'Bearer {DMX_API_TOKEN}'
     }
+    conn = get_conn()
     # 发送GET请求查询任务状态
     conn.request("GET", query_path, None, headers)
     # 获取响应并解析JSON数据
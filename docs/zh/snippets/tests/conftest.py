@@ -0,0 +1,62 @@
+"""测试共用的 fixture
+
+在 docs/zh/snippets 目录下运行: python -m pytest -q
+所有测试都连接进程内启动的 MockServer，不访问线上接口，不消耗额度。
+"""
+import importlib.util
+import os
+import sys
+
+import pytest
+
+SNIPPETS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SNIPPETS_DIR)
+
+from dmxapi.mock_server import MockProfile, MockServer  # noqa: E402
+from dmxapi.retry import API, CONNECTION, SERVER, THROTTLED, RetryPolicy  # noqa: E402
+
+# 测试中的重试退避：次数与默认值相同，等待时间缩短到毫秒级
+FAST_BACKOFF = {CONNECTION: (3, 0.01, 0.02), THROTTLED: (5, 0.01, 0.02), SERVER: (3, 0.01, 0.02),
+                API: (2, 0.01, 0.02)}
+HEADERS = {
+    'Authorization': 'Bearer sk-test',
+    'Content-Type': 'application/json'
+}
+
+
+@pytest.fixture(scope="session", autouse=True)
+def state_dir(tmp_path_factory):
+    """任务日志和耗时统计写入临时目录，不读写 ~/.dmxapi"""
+    path = tmp_path_factory.mktemp("dmxapi")
+    saved = {name: os.environ.get(name) for name in ("DMXAPI_JOURNAL", "DMXAPI_POLL_STATS", "DMXAPI_RESULT_CACHE")}
+    os.environ["DMXAPI_JOURNAL"] = str(path / "journal.sqlite3")
+    os.environ["DMXAPI_POLL_STATS"] = str(path / "poll-stats.json")
+    os.environ.pop("DMXAPI_RESULT_CACHE", None)
+    yield path
+    for name, value in saved.items():
+        if value is None:
+            os.environ.pop(name, None)
+        else:
+            os.environ[name] = value
+
+
+@pytest.fixture
+def mock_server():
+    """几乎没有排队和生成时间的模拟服务，每个测试使用独立端口，共享的连接池、轮询器等互不影响"""
+    server = MockServer(MockProfile(queue_time=0, image_time=0.2, video_time=0.2, seed=0)).start()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def fast_retry():
+    """缩短退避时间的重试策略，赋给连接池的 retry 属性使用"""
+    return RetryPolicy(backoff=FAST_BACKOFF)
+
+
+def load_snippet(name):
+    """按文件名加载 kling-*.py 示例，例如 load_snippet("kling-text-to-image")"""
+    spec = importlib.util.spec_from_file_location(name.replace("-", "_"), os.path.join(SNIPPETS_DIR, f"{name}.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
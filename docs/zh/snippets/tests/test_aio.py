@@ -0,0 +1,64 @@
+import asyncio
+import socket
+import threading
+
+from conftest import HEADERS
+from dmxapi.aio import AsyncConnectionPool, AsyncKlingClient
+from dmxapi.retry import get_retry_policy
+
+PROMPTS = [f"第 {index} 只猫" for index in range(20)]
+
+
+def test_many_tasks_share_few_connections(mock_server):
+    async def main():
+        async with AsyncKlingClient("sk-test", mock_server.url, maxsize=4) as client:
+            results = await asyncio.gather(*[client.generate_image("kling-v1", prompt, timeout=30)
+                                             for prompt in PROMPTS])
+            return results, client.pool.stats()
+
+    results, stats = asyncio.run(main())
+    assert all(urls for urls in results)
+    assert mock_server.stats()["submits"] == len(PROMPTS)
+    assert stats["misses"] <= 4
+
+
+def test_wait_polls_through_transient_errors(mock_server):
+    mock_server.profile.image_time = 1
+
+    async def main():
+        async with AsyncKlingClient("sk-test", mock_server.url) as client:
+            task_id = await client.submit("/kling/v1/images/generations", {"model_name": "kling-v1", "prompt": "猫"})
+            # 提交成功后查询接口半数返回 503，轮询继续直到任务结束
+            mock_server.profile.server_error_rate = 0.5
+            return await client.wait("/kling/v1/images/generations", task_id, 0.05, 30)
+
+    data = asyncio.run(main())
+    assert data["task_status"] == "succeed"
+    assert mock_server.stats()["server_errors"] > 0
+
+
+def test_pool_created_outside_event_loop(mock_server):
+    # 在 asyncio.run 之外构造，先后用于两个事件循环
+    client = AsyncKlingClient("sk-test", mock_server.url)
+    for _ in range(2):
+        assert asyncio.run(client.generate_image("kling-v1", "猫", timeout=30))
+    assert mock_server.stats()["submits"] == 2
+
+
+def test_status_line_without_reason():
+    listener = socket.create_server(("127.0.0.1", 0))
+
+    def serve():
+        conn, _ = listener.accept()
+        with conn:
+            conn.recv(65536)
+            conn.sendall(b"HTTP/1.1 200\r\nContent-Length: 2\r\n\r\n{}")
+
+    threading.Thread(target=serve, daemon=True).start()
+    url = f"http://127.0.0.1:{listener.getsockname()[1]}"
+    try:
+        res = asyncio.run(AsyncConnectionPool(url).request("GET", "/", None, HEADERS))
+    finally:
+        listener.close()
+    assert (res.status, res.reason, res.read()) == (200, "", b"{}")
+    assert get_retry_policy(url).stats()["retries"] == {}
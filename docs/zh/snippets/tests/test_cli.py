@@ -0,0 +1,86 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import SNIPPETS_DIR
+from dmxapi import cli
+
+
+@pytest.fixture
+def dmx(mock_server, capsys):
+    """以 main() 运行一条 dmx 命令，返回 (退出码, 输出的 JSON)"""
+    def run(*argv):
+        code = cli.main([*argv, "--api-url", mock_server.url, "--token", "sk-test"])
+        out = capsys.readouterr().out
+        return code, json.loads(out) if out else None
+
+    return run
+
+
+def test_submit_without_waiting(mock_server, dmx):
+    code, record = dmx("t2i", "--prompt", "一只猫", "--model", "kling-v1", "-n", "2", "--set", "aspect_ratio=1:1",
+                       "--no-wait")
+    assert code == 0
+    assert record["status"] == "submitted"
+    assert mock_server._tasks[record["task_id"]].payload == {"prompt": "一只猫", "model_name": "kling-v1", "n": 2,
+                                                             "aspect_ratio": "1:1"}
+    assert mock_server.stats()["queries"] == 0
+
+
+def test_wait_and_download(tmp_path, mock_server, dmx):
+    code, record = dmx("t2i", "--prompt", "一只猫", "--set", "n=2", "--download-dir", str(tmp_path))
+    assert code == 0
+    assert record["status"] == "succeed"
+    assert len(record["result"]["images"]) == 2
+    assert sorted(record["files"]) == sorted(os.path.join(str(tmp_path), record["task_id"], name)
+                                             for name in os.listdir(tmp_path / record["task_id"])
+                                             if not name.endswith(".url"))
+
+
+def test_failed_task_exit_code(mock_server, dmx):
+    mock_server.profile.error_rate = 1.0
+    code, record = dmx("t2v", "--prompt", "海边日落")
+    assert code == 1
+    assert record["status"] == "failed"
+
+
+def test_fetch_submitted_task(mock_server, dmx):
+    mock_server.profile.image_time = 30
+    _, submitted = dmx("t2i", "--prompt", "一只猫", "--no-wait")
+    code, record = dmx("fetch", "t2i", submitted["task_id"])
+    assert code == 0
+    assert record["status"] == "processing"
+    # --wait 轮询到超时，以非 0 退出码结束
+    code, record = dmx("fetch", "t2i", submitted["task_id"], "--wait", "--timeout", "1")
+    assert code == 1
+    assert record == {"task_id": submitted["task_id"], "status": "timeout"}
+
+
+def test_midjourney_imagine_and_fetch(tmp_path, mock_server, dmx):
+    image = tmp_path / "ref.png"
+    image.write_bytes(b"\x89PNG\r\n\x1a\n")
+    _, submitted = dmx("mj-imagine", "--prompt", "吉卜力风格", "--image", str(image), "--no-wait")
+    assert mock_server._tasks[submitted["task_id"]].payload["base64Array"] == ["data:image/png;base64,iVBORw0KGgo="]
+    code, record = dmx("mj-fetch", submitted["task_id"], "--wait", "--timeout", "30")
+    assert code == 0
+    assert record["result"]["imageUrl"]
+
+
+def test_errors_reported_on_stderr(mock_server, capsys):
+    assert cli.main(["t2i", "--prompt", "一只猫", "--set", "aspect_ratio", "--api-url", mock_server.url,
+                     "--token", "sk-test"]) == 1
+    assert capsys.readouterr().err.startswith("dmx: --set 需要 KEY=VALUE 格式")
+    with pytest.raises(SystemExit):
+        cli.main(["t2i", "--prompt", "一只猫", "--api-url", mock_server.url, "--token", ""])
+    assert mock_server.stats()["submits"] == 0
+
+
+def test_import_does_not_load_poller():
+    # 只提交任务的调用不导入轮询器、下载器和图片预处理
+    code = ("import sys, dmxapi.cli, dmxapi.jobs, dmxapi.pool; "
+            "print([name for name in ('dmxapi.poller', 'dmxapi.download', 'dmxapi.preprocess') if name in sys.modules])")
+    out = subprocess.run([sys.executable, "-c", code], cwd=SNIPPETS_DIR, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "[]"
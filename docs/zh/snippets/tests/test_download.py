@@ -0,0 +1,156 @@
+import os
+import threading
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from conftest import HEADERS, load_snippet
+from dmxapi import download, jobs
+from dmxapi.download import Downloader
+from dmxapi.poller import get_poller
+from dmxapi.pool import get_pool
+
+FILE_SIZE = 2 * 1024 * 1024
+
+
+@pytest.fixture
+def result_url(mock_server):
+    """一个已完成任务的结果文件 url"""
+    mock_server.profile.file_size = FILE_SIZE
+    task_id = jobs.submit_job(get_pool(mock_server.url), HEADERS, "text2image", {"model_name": "kling-v1", "prompt": "猫"})
+    data = jobs.register_job(get_poller(mock_server.url), HEADERS, "text2image", task_id, 30).result()
+    return data["task_result"]["images"][0]["url"]
+
+
+def _fetch(url):
+    with urllib.request.urlopen(url) as res:
+        return res.read()
+
+
+class _Interrupted:
+    """读取 limit 字节后抛出 ConnectionResetError 的响应，模拟下载到一半网络中断"""
+
+    def __init__(self, res, limit):
+        self._res = res
+        self._left = limit
+        self.status = res.status
+        self.headers = res.headers
+
+    def read(self, size):
+        if self._left <= 0:
+            raise ConnectionResetError("连接被重置")
+        chunk = self._res.read(min(size, self._left))
+        self._left -= len(chunk)
+        return chunk
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._res.close()
+
+
+def test_resume_interrupted_download(tmp_path, monkeypatch, mock_server, result_url):
+    monkeypatch.setattr(download, "CHUNK_SIZE", 16 * 1024)
+    monkeypatch.setattr(download, "PROGRESS_EVERY", 64 * 1024)
+    dest = str(tmp_path)
+    first = Downloader(segments=2, segment_threshold=1024 * 1024)
+    open_url = first._open
+
+    def interrupted_open(url, headers=None):
+        res = open_url(url, headers)
+        if headers and headers.get("Range") != "bytes=0-0":
+            return _Interrupted(res, 300 * 1024)
+        return res
+
+    monkeypatch.setattr(first, "_open", interrupted_open)
+    with pytest.raises(ConnectionResetError):
+        first.download(result_url, dest)
+    name = download.filename_for(result_url)
+    assert not os.path.exists(os.path.join(dest, name))
+    assert os.path.exists(os.path.join(dest, f"{name}.part.json"))
+
+    second = Downloader(segments=2, segment_threshold=1024 * 1024)
+    path = second.download(result_url, dest)
+    stats = second.stats()
+    # 已保存进度的部分不再下载，两次合计正好是整个文件
+    assert stats["resumed_bytes"] > 0
+    assert stats["resumed_bytes"] + stats["bytes"] == FILE_SIZE
+    with open(path, "rb") as result:
+        assert result.read() == _fetch(result_url)
+    assert not os.path.exists(f"{path}.part.json")
+
+
+def test_existing_file_from_other_url_is_replaced(tmp_path, mock_server, result_url):
+    other_url = result_url.replace("-0.", "-1.")
+    downloader = Downloader()
+    path = downloader.download(result_url, str(tmp_path), "out.png")
+    assert downloader.download(result_url, str(tmp_path), "out.png") == path
+    assert downloader.stats()["skipped"] == 1
+    # 同名文件来自其他 url 时重新下载
+    downloader.download(other_url, str(tmp_path), "out.png")
+    assert downloader.stats()["skipped"] == 1
+    with open(path, "rb") as result:
+        assert result.read() == _fetch(other_url)
+
+
+def test_unknown_total_size_falls_back_to_plain_get(tmp_path):
+    content = os.urandom(50000)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            # 支持 Range 但不告知总大小：Content-Range: bytes 0-0/*
+            if self.headers.get("Range") == "bytes=0-0":
+                self.send_response(206)
+                self.send_header("Content-Range", "bytes 0-0/*")
+                self.send_header("Content-Length", "1")
+                self.end_headers()
+                self.wfile.write(content[:1])
+                return
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        path = Downloader().download(f"http://127.0.0.1:{server.server_port}/video.mp4", str(tmp_path))
+    finally:
+        server.shutdown()
+        server.server_close()
+    with open(path, "rb") as result:
+        assert result.read() == content
+
+
+def test_concurrent_downloads_to_same_path(tmp_path, monkeypatch, mock_server, result_url):
+    monkeypatch.setattr(download, "CHUNK_SIZE", 16 * 1024)
+    downloaders = [Downloader(segments=2, segment_threshold=1024 * 1024) for _ in range(6)]
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        paths = list(executor.map(lambda downloader: downloader.download(result_url, str(tmp_path)), downloaders))
+    # 同一路径依次下载，只有第一个调用实际下载，其余直接得到已完成的文件
+    assert len(set(paths)) == 1
+    assert sum(downloader.stats()["files"] for downloader in downloaders) == 1
+    assert sum(downloader.stats()["skipped"] for downloader in downloaders) == 5
+    assert sorted(os.listdir(tmp_path)) == sorted([os.path.basename(paths[0]), f"{os.path.basename(paths[0])}.url"])
+    with open(paths[0], "rb") as result:
+        assert result.read() == _fetch(result_url)
+
+
+def test_coalesced_generations_download_once(tmp_path, mock_server):
+    # 合并到同一个任务的调用都把结果下载到同一目录
+    mock_server.profile.file_size = FILE_SIZE
+    client = load_snippet("kling-text-to-video").KlingTextToVideo("sk-test", mock_server.url)
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        futures = [executor.submit(client.generate_video, "kling-v1", "一只猫", timeout=30, download_dir=str(tmp_path))
+                   for _ in range(6)]
+        results = [future.result() for future in futures]
+    assert mock_server.stats()["submits"] == 1
+    assert len(set(results)) == 1
+    assert not [name for name in os.listdir(tmp_path) if ".part" in name]
@@ -0,0 +1,29 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from dmxapi.encode_cache import EncodingCache
+
+
+def test_digest_index_is_bounded(tmp_path):
+    cache = EncodingCache(max_bytes=1024, max_digests=4)
+    for index in range(10):
+        path = tmp_path / f"{index}.png"
+        path.write_bytes(os.urandom(4096))
+        cache.get_encoded(str(path))
+        cache.digest(str(path))
+    # 编码结果超过内存层容量被淘汰，文件 key 索引也只保留最近使用的条目
+    assert cache.stats()["digests"] == 4
+    assert cache.stats()["bytes"] <= 1024
+
+
+def test_concurrent_disk_writes(tmp_path):
+    image = tmp_path / "a.png"
+    image.write_bytes(os.urandom(256 * 1024))
+    disk_dir = tmp_path / "cache"
+    caches = [EncodingCache(disk_dir=str(disk_dir)) for _ in range(8)]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda cache: cache.get_encoded(str(image)), caches))
+    assert len(set(results)) == 1
+    # 每个线程写各自的临时文件，最终只剩一个完整的缓存文件
+    assert [name.endswith(".b64") for name in os.listdir(disk_dir)] == [True]
+    assert EncodingCache(disk_dir=str(disk_dir)).get_encoded(str(image)) == results[0]
@@ -0,0 +1,58 @@
+from conftest import HEADERS
+from dmxapi import endpoints, jobs
+from dmxapi.intervals import MIN_SAMPLES, AdaptiveSchedule, CompletionStats
+from dmxapi.poller import Poller
+from dmxapi.pool import get_pool
+
+KEY = (endpoints.TEXT_TO_IMAGE, "kling-v1")
+
+
+def _stats(tmp_path, samples=()):
+    stats = CompletionStats(str(tmp_path / "poll-stats.json"))
+    for seconds in samples:
+        stats.record(KEY, seconds)
+    return stats
+
+
+def test_fixed_interval_until_enough_samples(tmp_path):
+    schedule = AdaptiveSchedule(_stats(tmp_path, [10] * (MIN_SAMPLES - 1)), floor=1, ceiling=30)
+    assert schedule.next_interval(KEY, 0, 2) == 2
+    # 固定间隔同样限制在 [floor, ceiling] 之间
+    assert schedule.next_interval(KEY, 0, 0.1) == 1
+    schedule.record(KEY, 10)
+    assert schedule.next_interval(KEY, 0, 2) == 5
+
+
+def test_interval_follows_completion_window(tmp_path):
+    schedule = AdaptiveSchedule(_stats(tmp_path, range(10, 21)), floor=1, ceiling=30)
+    # 预计完成前每次把剩余距离减半，进入 p10~p90 后按下限轮询，超过 p90 后逐步放宽
+    assert schedule.next_interval(KEY, 1, 2) == 5
+    assert schedule.next_interval(KEY, 10, 2) == 1
+    assert schedule.next_interval(KEY, 15, 2) == 1
+    assert schedule.next_interval(KEY, 29, 2) == 5
+    assert schedule.next_interval(KEY, 1000, 2) == 30
+
+
+def test_samples_survive_restart(tmp_path):
+    stats = _stats(tmp_path, [3, 1, 2, 5, 4])
+    stats.flush()
+    assert CompletionStats(stats.path).samples(KEY) == [1, 2, 3, 4, 5]
+    assert CompletionStats(stats.path).quantile(KEY, 0.1) == 1
+
+
+def test_learned_intervals_need_fewer_queries(tmp_path, mock_server):
+    mock_server.profile.image_time = 2
+    pool = get_pool(mock_server.url)
+    stats = _stats(tmp_path, [2.0] * MIN_SAMPLES)
+    queries = {}
+    for name, stats_key in (("fixed", None), ("adaptive", KEY)):
+        poller = Poller(mock_server.url, schedule=AdaptiveSchedule(stats, floor=0.1), list_page_size=0)
+        task_id = jobs.submit_job(pool, HEADERS, "text2image", {"model_name": "kling-v1", "prompt": name})
+        future = poller.register(endpoints.TEXT_TO_IMAGE, task_id, HEADERS, interval=0.1, timeout=30,
+                                 stats_key=stats_key)
+        assert future.result(timeout=30)["task_status"] == endpoints.STATUS_SUCCEED
+        queries[name] = poller.status_requests
+        poller.close()
+    # 按历史耗时在预计完成前稀疏查询，同样及时拿到结果，查询次数少得多
+    assert queries["adaptive"] * 2 < queries["fixed"]
+    assert len(stats.samples(KEY)) == MIN_SAMPLES + 1
@@ -0,0 +1,84 @@
+import os
+
+import pytest
+
+from conftest import HEADERS, load_snippet
+from dmxapi import endpoints, jobs
+from dmxapi.journal import STATUS_SUBMITTED, STATUS_SUBMITTING, TaskJournal, get_journal
+from dmxapi.poller import get_poller
+from dmxapi.pool import get_pool
+
+PAYLOAD = {"model_name": "kling-v1", "prompt": "一只猫"}
+
+
+def _submit(journal, server, kind="text2image"):
+    """按示例代码的顺序提交：先写日志，收到 task_id 后补记"""
+    entry = journal.begin(jobs.get_kind(kind).endpoint, PAYLOAD, HEADERS)
+    task_id = jobs.submit_job(get_pool(server.url), HEADERS, kind, PAYLOAD)
+    journal.submitted(entry, task_id)
+    return task_id
+
+
+def test_resume_after_restart(tmp_path, mock_server):
+    path = str(tmp_path / "journal.sqlite3")
+    task_id = _submit(TaskJournal(mock_server.url, path), mock_server)
+    assert TaskJournal(mock_server.url, path).get(task_id)["status"] == STATUS_SUBMITTED
+
+    # 新进程打开同一个日志文件，接管上次未结束的任务
+    journal = TaskJournal(mock_server.url, path)
+    resumed = journal.resume(get_poller(mock_server.url), HEADERS)
+    assert list(resumed) == [task_id]
+    assert resumed[task_id].result(timeout=30)["task_status"] == endpoints.STATUS_SUCCEED
+    assert journal.get(task_id)["status"] == endpoints.STATUS_SUCCEED
+    assert mock_server.stats()["submits"] == 1
+
+
+def test_resume_only_same_token(tmp_path, mock_server):
+    path = str(tmp_path / "journal.sqlite3")
+    _submit(TaskJournal(mock_server.url, path), mock_server)
+    other = dict(HEADERS, Authorization="Bearer sk-other")
+    assert TaskJournal(mock_server.url, path).resume(get_poller(mock_server.url), other) == {}
+
+
+def test_unconfirmed_submit_not_resumed(tmp_path, mock_server):
+    # 没有收到 task_id 的记录无法查询，保持 submitting 留给人工核对
+    path = str(tmp_path / "journal.sqlite3")
+    TaskJournal(mock_server.url, path).begin(endpoints.TEXT_TO_IMAGE, PAYLOAD, HEADERS)
+    journal = TaskJournal(mock_server.url, path)
+    assert journal.resume(get_poller(mock_server.url), HEADERS) == {}
+    assert [row["status"] for row in journal.query()] == [STATUS_SUBMITTING]
+
+
+def test_failed_submit_is_abandoned(tmp_path, mock_server):
+    # 提交时连接断开，请求不重发，日志中的记录标记为 error，不会一直停留在 submitting
+    journal = TaskJournal(mock_server.url, str(tmp_path / "journal.sqlite3"))
+    client = load_snippet("kling-text-to-image").KlingTextToImage("sk-test", mock_server.url, journal=journal)
+    mock_server.profile.drop_rate = 1.0
+    with pytest.raises(ConnectionError):
+        client.generate_image("kling-v1", "一只猫", timeout=30)
+    assert [row["status"] for row in client.journal.query()] == ["error"]
+
+
+def test_journal_off_by_default(tmp_path, monkeypatch, mock_server):
+    monkeypatch.delenv("DMXAPI_JOURNAL")
+    monkeypatch.setenv("HOME", str(tmp_path))
+    client = load_snippet("kling-text-to-image").KlingTextToImage("sk-test", mock_server.url)
+    assert client.journal is get_journal(mock_server.url)
+    assert not client.journal.enabled
+    assert client.generate_image("kling-v1", "一只猫", timeout=30)
+    assert client.resume() == {}
+    assert not os.listdir(tmp_path)
+
+
+def test_resume_scoped_to_client_endpoint(tmp_path, mock_server):
+    path = str(tmp_path / "journal.sqlite3")
+    image_task = _submit(TaskJournal(mock_server.url, path), mock_server)
+    video_task = _submit(TaskJournal(mock_server.url, path), mock_server, "text2video")
+    # 创建客户端不会接管任何任务，调用 resume() 时只接管本接口的任务
+    client = load_snippet("kling-text-to-video").KlingTextToVideo("sk-test", mock_server.url,
+                                                                  journal=TaskJournal(mock_server.url, path))
+    assert client.journal.resumed == {}
+    resumed = client.resume()
+    assert list(resumed) == [video_task]
+    assert resumed[video_task].result(timeout=30)["task_status"] == endpoints.STATUS_SUCCEED
+    assert client.journal.get(image_task)["status"] == STATUS_SUBMITTED
@@ -0,0 +1,96 @@
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from conftest import load_snippet
+from dmxapi import endpoints, metrics
+
+
+@pytest.fixture
+def recording():
+    metrics.registry.reset()
+    metrics.enable_metrics()
+    yield metrics.registry
+    metrics.disable_metrics()
+    metrics.registry.reset()
+
+
+def _samples(name, **labels):
+    return [sample for sample in metrics.snapshot().get(name, [])
+            if all(sample["labels"].get(key) == value for key, value in labels.items())]
+
+
+def _task_samples(name):
+    """任务指标在 Future 的回调中记录，可能晚于 generate 返回，等到出现为止"""
+    deadline = time.monotonic() + 5
+    while not _samples(name) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return _samples(name, endpoint=endpoints.TEXT_TO_IMAGE)
+
+
+def _generate(server):
+    client = load_snippet("kling-text-to-image").KlingTextToImage("sk-test", server.url)
+    return client.generate_image("kling-v1", "一只猫", timeout=30, use_cache=False, coalesce=False)
+
+
+def test_requests_and_tasks_recorded(recording, mock_server):
+    assert _generate(mock_server)
+    submit, = _samples("dmxapi_http_requests_total", method="POST", route=endpoints.TEXT_TO_IMAGE)
+    assert submit["value"] == 1
+    assert submit["labels"]["status"] == 200
+    # 查询请求按去掉任务 id 的路径模板聚合，请求数与服务端收到的查询一致
+    queries = sum(sample["value"] for sample in _samples("dmxapi_http_requests_total", method="GET"))
+    assert queries == mock_server.stats()["queries"]
+    assert all("{" in sample["labels"]["route"] for sample in _samples("dmxapi_http_requests_total", method="GET"))
+    ttfb, = _samples("dmxapi_http_ttfb_seconds", route=endpoints.TEXT_TO_IMAGE)
+    assert ttfb["count"] == 1 and ttfb["sum"] > 0
+    task, = _task_samples("dmxapi_tasks_total")
+    assert task["labels"]["outcome"] == endpoints.STATUS_SUCCEED and task["value"] == 1
+    polls, = _task_samples("dmxapi_task_polls")
+    assert polls["count"] == 1
+    # 连接复用：只有第一个请求新建连接
+    new, = _samples("dmxapi_http_connections_total", kind="new")
+    assert new["value"] == 1
+
+
+def test_nothing_recorded_when_disabled(mock_server):
+    metrics.registry.reset()
+    assert _generate(mock_server)
+    assert metrics.snapshot() == {}
+    assert metrics.prometheus_text() == "\n"
+
+
+def test_prometheus_text_format(recording):
+    recording.inc("dmxapi_http_requests_total", method="GET", route='/a"b\\c', status=200)
+    recording.observe("dmxapi_task_polls", 4, endpoint="/x")
+    recording.observe("dmxapi_task_polls", 60, endpoint="/x")
+    lines = metrics.prometheus_text().splitlines()
+    assert "# TYPE dmxapi_http_requests_total counter" in lines
+    assert 'dmxapi_http_requests_total{method="GET",route="/a\\"b\\\\c",status="200"} 1' in lines
+    assert "# TYPE dmxapi_task_polls histogram" in lines
+    # 直方图的桶为累计计数，+Inf 桶等于总数
+    assert 'dmxapi_task_polls_bucket{endpoint="/x",le="3"} 0' in lines
+    assert 'dmxapi_task_polls_bucket{endpoint="/x",le="5"} 1' in lines
+    assert 'dmxapi_task_polls_bucket{endpoint="/x",le="100"} 2' in lines
+    assert 'dmxapi_task_polls_bucket{endpoint="/x",le="+Inf"} 2' in lines
+    assert 'dmxapi_task_polls_sum{endpoint="/x"} 64' in lines
+    assert 'dmxapi_task_polls_count{endpoint="/x"} 2' in lines
+
+
+def test_serve_metrics_endpoint(recording, mock_server):
+    server = metrics.serve_metrics(port=0)
+    try:
+        assert _generate(mock_server)
+        assert _task_samples("dmxapi_tasks_total")
+        base = f"http://127.0.0.1:{server.server_port}"
+        with urllib.request.urlopen(f"{base}/metrics") as res:
+            assert res.headers["Content-Type"].startswith("text/plain")
+            text = res.read().decode("utf-8")
+        assert f'dmxapi_tasks_total{{endpoint="{endpoints.TEXT_TO_IMAGE}",outcome="succeed"}} 1' in text
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f"{base}/other")
+    finally:
+        server.shutdown()
+        server.server_close()
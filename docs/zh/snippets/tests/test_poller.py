@@ -0,0 +1,159 @@
+import threading
+
+import pytest
+
+from conftest import HEADERS
+from dmxapi import endpoints, jobs
+from dmxapi.intervals import AdaptiveSchedule, CompletionStats
+from dmxapi.poller import STATUS_TIMEOUT, Poller, TaskFailedError
+from dmxapi.pool import get_pool
+
+PAYLOAD = {"model_name": "kling-v1", "prompt": "一只猫"}
+
+
+@pytest.fixture
+def make_poller(tmp_path, mock_server):
+    """使用独立耗时统计、轮询间隔下限 0.1 秒的轮询器，测试结束时关闭"""
+    pollers = []
+
+    def make(**kwargs):
+        schedule = AdaptiveSchedule(CompletionStats(str(tmp_path / "poll-stats.json")), floor=0.1)
+        poller = Poller(mock_server.url, schedule=schedule, **kwargs)
+        pollers.append(poller)
+        return poller
+
+    yield make
+    for poller in pollers:
+        poller.close()
+
+
+def _submit(server, count, kind="text2image"):
+    pool = get_pool(server.url)
+    return [jobs.submit_job(pool, HEADERS, kind, PAYLOAD) for _ in range(count)]
+
+
+def _poll_threads():
+    return [thread for thread in threading.enumerate() if thread.name.startswith("dmxapi-poll")]
+
+
+def test_many_tasks_on_few_threads(mock_server, make_poller):
+    threads = len(_poll_threads())
+    poller = make_poller(workers=2, list_page_size=0)
+    futures = [poller.register(endpoints.TEXT_TO_IMAGE, task_id, HEADERS, interval=0.1, timeout=30)
+               for task_id in _submit(mock_server, 20)]
+    assert all(future.result(timeout=30)["task_status"] == endpoints.STATUS_SUCCEED for future in futures)
+    # 查询线程数固定，不随任务数量增长
+    assert len(_poll_threads()) - threads <= 2
+    assert poller.status_requests >= 20
+    assert poller.pending() == 0
+
+
+def test_failed_task_raises(mock_server, make_poller):
+    mock_server.profile.error_rate = 1.0
+    poller = make_poller(list_page_size=0)
+    task_id, = _submit(mock_server, 1)
+    with pytest.raises(TaskFailedError):
+        poller.register(endpoints.TEXT_TO_IMAGE, task_id, HEADERS, interval=0.1, timeout=30).result(timeout=30)
+
+
+def test_timeout_resolves_to_none(mock_server, make_poller):
+    mock_server.profile.image_time = 30
+    poller = make_poller(list_page_size=0)
+    task_id, = _submit(mock_server, 1)
+    assert poller.register(endpoints.TEXT_TO_IMAGE, task_id, HEADERS, interval=0.1, timeout=0.5).result(timeout=30) is None
+
+
+def test_duplicate_register_shares_polling(mock_server, make_poller):
+    poller = make_poller(list_page_size=0)
+    task_id, = _submit(mock_server, 1)
+    first = poller.register(endpoints.TEXT_TO_IMAGE, task_id, HEADERS, interval=0.1, timeout=30)
+    second = poller.register(endpoints.TEXT_TO_IMAGE, task_id, HEADERS, interval=0.1, timeout=30)
+    assert second is first
+    # 撤销其中一次注册不影响另一方，两次都撤销后取消轮询
+    other, = _submit(mock_server, 1)
+    watched = poller.register(endpoints.TEXT_TO_IMAGE, other, HEADERS, interval=0.1, timeout=30)
+    poller.register(endpoints.TEXT_TO_IMAGE, other, HEADERS, interval=0.1, timeout=30)
+    poller.unwatch(endpoints.TEXT_TO_IMAGE, other)
+    assert not watched.cancelled()
+    poller.unwatch(endpoints.TEXT_TO_IMAGE, other)
+    assert watched.cancelled()
+    assert first.result(timeout=30)["task_status"] == endpoints.STATUS_SUCCEED
+
+
+def test_list_poll_batches_group(mock_server, make_poller):
+    mock_server.profile.image_time = 1
+    poller = make_poller()
+    futures = [poller.register(endpoints.TEXT_TO_IMAGE, task_id, HEADERS, interval=0.1, timeout=30)
+               for task_id in _submit(mock_server, 30)]
+    assert all(future.result(timeout=30)["task_status"] == endpoints.STATUS_SUCCEED for future in futures)
+    # 组内任务由列表查询一起刷新，查询次数远少于逐个查询
+    assert poller.list_refreshed >= 30
+    assert poller.list_requests * 5 < poller.list_refreshed
+    assert mock_server.stats()["queries"] == poller.status_requests
+
+
+def test_small_group_queries_directly(mock_server, make_poller):
+    poller = make_poller()
+    futures = [poller.register(endpoints.TEXT_TO_IMAGE, task_id, HEADERS, interval=0.1, timeout=30)
+               for task_id in _submit(mock_server, 2)]
+    assert all(future.result(timeout=30) for future in futures)
+    assert poller.list_requests == 0
+    assert poller.status_requests >= 2
+
+
+def test_unsupported_list_falls_back_to_direct_queries(mock_server, make_poller):
+    # 列表接口返回业务错误时暂停列表查询，到期任务改为单独查询，不会卡住
+    mock_server._list_kling = lambda handler, endpoint, query: handler.send_json(
+        400, {"code": 1201, "message": "不支持列表查询"})
+    poller = make_poller()
+    futures = [poller.register(endpoints.TEXT_TO_IMAGE, task_id, HEADERS, interval=0.1, timeout=30)
+               for task_id in _submit(mock_server, 5)]
+    assert all(future.result(timeout=30)["task_status"] == endpoints.STATUS_SUCCEED for future in futures)
+    assert poller.list_requests == 1
+    assert poller.list_refreshed == 0
+
+
+def test_iter_status_yields_transitions_in_order(mock_server, make_poller):
+    mock_server.profile.queue_time = 0.5
+    mock_server.profile.image_time = 0.5
+    poller = make_poller()
+    task_ids = _submit(mock_server, 3)
+    events = list(poller.iter_status(endpoints.TEXT_TO_IMAGE, task_ids, HEADERS, interval=0.1, timeout=30))
+    for task_id in task_ids:
+        transitions = [(event.previous, event.status) for event in events if event.task_id == task_id]
+        assert transitions == [(None, endpoints.STATUS_SUBMITTED),
+                               (endpoints.STATUS_SUBMITTED, endpoints.STATUS_PROCESSING),
+                               (endpoints.STATUS_PROCESSING, endpoints.STATUS_SUCCEED)]
+    assert sum(event.final for event in events) == 3
+
+
+def test_iter_status_ends_with_failed(mock_server, make_poller):
+    mock_server.profile.error_rate = 1.0
+    poller = make_poller()
+    task_id, = _submit(mock_server, 1)
+    events = list(poller.iter_status(endpoints.TEXT_TO_IMAGE, task_id, HEADERS, interval=0.1, timeout=30))
+    assert events[-1].status == endpoints.STATUS_FAILED
+    assert events[-1].message == "模拟任务失败"
+    assert [event.final for event in events].count(True) == 1
+
+
+def test_iter_status_ends_with_timeout(mock_server, make_poller):
+    mock_server.profile.image_time = 30
+    poller = make_poller()
+    task_id, = _submit(mock_server, 1)
+    events = list(poller.iter_status(endpoints.TEXT_TO_IMAGE, task_id, HEADERS, interval=0.1, timeout=0.5))
+    assert [event.status for event in events] == [endpoints.STATUS_PROCESSING, STATUS_TIMEOUT]
+    assert events[-1].data is None
+
+
+def test_iter_status_stops_polling_when_abandoned(mock_server, make_poller):
+    mock_server.profile.image_time = 30
+    poller = make_poller()
+    task_ids = _submit(mock_server, 2)
+    # 已有其他注册方的任务继续轮询，只被迭代关注的任务随即取消
+    kept = poller.register(endpoints.TEXT_TO_IMAGE, task_ids[0], HEADERS, interval=0.1, timeout=30)
+    events = poller.iter_status(endpoints.TEXT_TO_IMAGE, task_ids, HEADERS, interval=0.1, timeout=30)
+    next(events)
+    events.close()
+    assert not kept.done()
+    assert poller.pending() == 1
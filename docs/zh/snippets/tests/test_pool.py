@@ -0,0 +1,102 @@
+import base64
+import json
+
+import pytest
+
+from conftest import HEADERS
+from dmxapi import configure_encoding_cache, endpoints, jobs
+from dmxapi.body import FileBase64, FileChangedError, StreamingJSONBody
+from dmxapi.pool import ConnectionPool
+from dmxapi.retry import API
+
+PAYLOAD = {"model_name": "kling-v1", "prompt": "一只猫"}
+
+
+@pytest.fixture
+def pool(mock_server, fast_retry):
+    pool = ConnectionPool(mock_server.url)
+    pool.retry = fast_retry
+    yield pool
+    pool.close()
+
+
+def test_get_retried_on_server_error(mock_server, pool):
+    mock_server.profile.server_error_rate = 1.0
+    res = pool.request("GET", endpoints.query_path(endpoints.TEXT_TO_IMAGE, "x"), None, HEADERS)
+    # 503 + 业务码 5001 属于 API 类别：首次请求 + 2 次重试，用尽后返回最后一次的响应
+    assert res.status == 503
+    assert mock_server.stats()["server_errors"] == 3
+    assert pool.retry.stats()["retries"][API] == 2
+
+
+def test_get_recovers_after_transient_errors(mock_server, pool):
+    task_id = jobs.submit_job(pool, HEADERS, "text2image", PAYLOAD)
+    mock_server.profile.server_error_rate = 0.5
+    res = pool.request("GET", endpoints.query_path(endpoints.TEXT_TO_IMAGE, task_id), None, HEADERS)
+    assert res.status == 200
+    assert json.loads(res.read())["data"]["task_id"] == task_id
+
+
+def test_post_retried_when_rejected(mock_server, pool):
+    # 503 说明服务端没有受理，POST 也可以重试，用尽后不产生任务
+    mock_server.profile.server_error_rate = 1.0
+    with pytest.raises(Exception, match="API调用失败"):
+        jobs.submit_job(pool, HEADERS, "text2image", PAYLOAD)
+    assert mock_server.stats()["server_errors"] == 3
+    assert mock_server.stats()["submits"] == 0
+
+
+def test_post_not_resent_after_connection_dropped(mock_server, pool):
+    # 请求体已完整写出后连接断开，服务端可能已经受理，重发会产生重复的付费任务
+    mock_server.profile.drop_rate = 1.0
+    with pytest.raises(ConnectionError):
+        jobs.submit_job(pool, HEADERS, "text2image", PAYLOAD)
+    assert mock_server.stats()["requests"] == 1
+
+
+def test_post_not_resent_on_reused_connection(mock_server, pool):
+    jobs.submit_job(pool, HEADERS, "text2image", PAYLOAD)
+    assert pool.stats()["idle"] == 1
+    mock_server.reset()
+    mock_server.profile.drop_rate = 1.0
+    with pytest.raises(ConnectionError):
+        pool.request("POST", endpoints.TEXT_TO_IMAGE, StreamingJSONBody(PAYLOAD), HEADERS)
+    assert pool.stats()["hits"] == 1
+    assert mock_server.stats()["requests"] == 1
+
+
+def test_get_resent_after_connection_dropped(mock_server, pool):
+    mock_server.profile.drop_rate = 1.0
+    with pytest.raises(ConnectionError):
+        pool.request("GET", endpoints.query_path(endpoints.TEXT_TO_IMAGE, "x"), None, HEADERS)
+    # 幂等的 GET 每次断开都立即换新连接重发一次，再按 CONNECTION 类别退避重试 3 次
+    assert mock_server.stats()["dropped"] == 8
+
+
+def test_streaming_body_is_valid_json(tmp_path):
+    image = tmp_path / "a.png"
+    image.write_bytes(bytes(range(256)) * 1000)
+    body = StreamingJSONBody({"prompt": "猫", "image": FileBase64(str(image))})
+    data = b"".join(bytes(segment) for segment in body)
+    assert len(data) == body.content_length
+    assert json.loads(data) == {"prompt": "猫", "image": base64.b64encode(image.read_bytes()).decode("ascii")}
+    # 重发时再次迭代得到相同的内容
+    assert b"".join(bytes(segment) for segment in body) == data
+
+
+@pytest.mark.parametrize("max_bytes", [0, 64 * 1024 * 1024])
+def test_file_changed_after_body_created(tmp_path, mock_server, pool, max_bytes):
+    # 分别走流式读取和编码缓存两条路径
+    configure_encoding_cache(max_bytes=max_bytes)
+    image = tmp_path / "a.png"
+    image.write_bytes(bytes(range(256)) * 1000)
+    body = StreamingJSONBody(dict(PAYLOAD, image=FileBase64(str(image))))
+    image.write_bytes(bytes(range(256)) * 1001)
+    try:
+        with pytest.raises(FileChangedError):
+            pool.request("POST", endpoints.IMAGE_TO_IMAGE, body, HEADERS)
+    finally:
+        configure_encoding_cache()
+    # 写出一半的连接已关闭，不会被下一个请求复用
+    assert pool.stats()["idle"] == 0
+    assert jobs.submit_job(pool, HEADERS, "text2image", PAYLOAD)
@@ -0,0 +1,117 @@
+import base64
+import io
+import os
+
+import pytest
+
+from conftest import load_snippet
+from dmxapi import endpoints
+from dmxapi.preprocess import ImagePreprocessor, configure_preprocess
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def _photo(path, size=(2400, 1600), orientation=None):
+    """保存一张带噪点的 JPEG，orientation 为 EXIF 方向"""
+    image = Image.effect_noise(size, 64).convert("RGB")
+    options = {"quality": 95}
+    if orientation:
+        exif = Image.Exif()
+        exif[0x0112] = orientation
+        options["exif"] = exif.tobytes()
+    image.save(path, **options)
+    return str(path)
+
+
+@pytest.fixture
+def preprocessor(tmp_path):
+    preprocessor = ImagePreprocessor(processes=0, cache_dir=str(tmp_path / "cache"))
+    yield preprocessor
+    preprocessor.close()
+
+
+def test_large_photo_resized_and_rotated(tmp_path, preprocessor):
+    src = _photo(tmp_path / "photo.jpg", orientation=6)
+    result = preprocessor.prepare(src, endpoints.IMAGE_TO_VIDEO)
+    assert result != src and result.endswith(".jpg")
+    with Image.open(result) as image:
+        # 先按 EXIF 方向摆正（宽高互换），再缩小到接口的分辨率上限，元数据不保留
+        assert image.size == (1280, 1920)
+        assert image.getexif().get(0x0112) is None
+    stats = preprocessor.stats()
+    assert stats["processed"] == 1
+    assert 0 < stats["bytes_out"] < stats["bytes_in"]
+    assert stats["upload_seconds_saved"] > 0
+
+
+def test_results_reused_across_runs(tmp_path, preprocessor):
+    src = _photo(tmp_path / "photo.jpg")
+    first = preprocessor.prepare(src)
+    assert preprocessor.prepare(src) == first
+    assert preprocessor.stats()["processed"] == 1
+    # 新进程使用同一目录时直接复用之前的处理结果
+    again = ImagePreprocessor(processes=0, cache_dir=preprocessor.cache_dir)
+    assert again.prepare(src) == first
+    assert again.stats()["reused"] == 1 and again.stats()["processed"] == 0
+
+
+def test_small_and_unreadable_files_pass_through(tmp_path, preprocessor):
+    small = _photo(tmp_path / "small.jpg", size=(64, 64))
+    broken = tmp_path / "broken.png"
+    broken.write_bytes(b"not an image")
+    audio = tmp_path / "voice.mp3"
+    audio.write_bytes(b"ID3")
+    assert preprocessor.prepare(small) == small
+    assert preprocessor.prepare(str(broken)) == str(broken)
+    assert preprocessor.prepare(str(audio)) == str(audio)
+    assert preprocessor.stats()["passthrough"] == 2
+    assert preprocessor.stats()["bytes_saved"] == 0
+
+
+def test_transparent_png_stays_lossless(tmp_path, preprocessor):
+    src = tmp_path / "mask.png"
+    Image.new("RGBA", (3000, 1000), (255, 0, 0, 128)).save(src)
+    result = preprocessor.prepare(str(src))
+    assert result.endswith(".png")
+    with Image.open(result) as image:
+        assert image.mode == "RGBA"
+        assert image.size == (2048, 683)
+        assert image.getpixel((10, 10)) == (255, 0, 0, 128)
+
+
+def test_crop_to_aspect_ratio(tmp_path):
+    src = _photo(tmp_path / "photo.jpg", size=(1600, 1600))
+    cropping = ImagePreprocessor(processes=0, crop=True, cache_dir=str(tmp_path / "cache"))
+    with Image.open(cropping.prepare(src, aspect_ratio="16:9")) as image:
+        assert image.size == (1600, 900)
+    # 不开启 crop 时忽略 aspect_ratio，只重新编码
+    plain = ImagePreprocessor(processes=0, min_bytes=0, cache_dir=str(tmp_path / "cache"))
+    with Image.open(plain.prepare(src, aspect_ratio="16:9")) as image:
+        assert image.size == (1600, 1600)
+
+
+def test_prepare_many_in_worker_processes(tmp_path):
+    paths = [_photo(tmp_path / f"photo-{index}.jpg") for index in range(3)]
+    preprocessor = ImagePreprocessor(processes=2, cache_dir=str(tmp_path / "cache"))
+    try:
+        results = preprocessor.prepare_many(paths + paths[:1])
+    finally:
+        preprocessor.close()
+    assert results[0] == results[3]
+    assert len(set(results)) == 3
+    assert preprocessor.stats()["processed"] == 3
+
+
+def test_client_uploads_preprocessed_image(tmp_path, mock_server):
+    configure_preprocess(processes=0, cache_dir=str(tmp_path / "cache"))
+    try:
+        src = _photo(tmp_path / "photo.jpg")
+        client = load_snippet("kling-image-to-image").KlingImageToImage("sk-test", mock_server.url)
+        assert client.generate_image("kling-v1", "一只猫", src, timeout=30)
+    finally:
+        configure_preprocess(enabled=False)
+    task, = mock_server._tasks.values()
+    uploaded = base64.b64decode(task.payload["image"])
+    assert len(uploaded) < os.path.getsize(src)
+    with Image.open(io.BytesIO(uploaded)) as image:
+        assert image.size == (2048, 1365)
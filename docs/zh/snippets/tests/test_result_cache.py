@@ -0,0 +1,67 @@
+import time
+
+import pytest
+
+from conftest import load_snippet
+from dmxapi import configure_result_cache
+
+
+@pytest.fixture
+def client(mock_server):
+    yield load_snippet("kling-text-to-image").KlingTextToImage("sk-test", mock_server.url)
+    configure_result_cache(None)
+
+
+def _generate(client, prompt, **kwargs):
+    return client.generate_image("kling-v1", prompt, timeout=30, **kwargs)
+
+
+def test_repeat_request_served_from_cache(tmp_path, mock_server, client):
+    client.results = configure_result_cache(str(tmp_path), ttl=3600)
+    first = _generate(client, "猫")
+    assert _generate(client, "猫") == first
+    assert mock_server.stats()["submits"] == 1
+    # use_cache=False 不读缓存，提交新任务
+    assert _generate(client, "猫", use_cache=False) != first
+    assert mock_server.stats()["submits"] == 2
+    # 只关闭合并时仍然复用缓存
+    assert _generate(client, "猫", coalesce=False) == first
+    assert mock_server.stats()["submits"] == 2
+
+
+def test_entry_expires_after_ttl(tmp_path, mock_server, client):
+    client.results = configure_result_cache(str(tmp_path), ttl=0.5)
+    _generate(client, "猫")
+    _generate(client, "猫")
+    assert mock_server.stats()["submits"] == 1
+    time.sleep(0.6)
+    _generate(client, "猫")
+    assert mock_server.stats()["submits"] == 2
+    assert client.results.stats()["expired"] == 1
+
+
+def test_entry_expires_with_signed_url(tmp_path, mock_server, client):
+    # 结果 url 在任务完成约 3 秒后过期（签名时间取整到秒），缓存提前 url_margin 秒失效，不会返回已过期的 url
+    mock_server.profile.url_ttl = 3
+    client.results = configure_result_cache(str(tmp_path), ttl=3600, url_margin=1)
+    first = _generate(client, "猫")
+    assert _generate(client, "猫") == first
+    assert mock_server.stats()["submits"] == 1
+    time.sleep(2.2)
+    assert _generate(client, "猫") != first
+    assert mock_server.stats()["submits"] == 2
+
+
+def test_stored_files_outlive_signed_url(tmp_path, mock_server, client):
+    # 已保存结果文件的条目在 url 过期后仍可用于 download_dir
+    mock_server.profile.url_ttl = 2
+    client.results = configure_result_cache(str(tmp_path / "cache"), ttl=3600, store_files=True, url_margin=0)
+    first = _generate(client, "猫", download_dir=str(tmp_path / "a"))
+    time.sleep(2.2)
+    second = _generate(client, "猫", download_dir=str(tmp_path / "b"))
+    assert mock_server.stats()["submits"] == 1
+    with open(first[0], "rb") as a, open(second[0], "rb") as b:
+        assert a.read() == b.read()
+    # url 已过期，只需要 url 的调用重新生成
+    _generate(client, "猫")
+    assert mock_server.stats()["submits"] == 2
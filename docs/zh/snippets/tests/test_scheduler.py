@@ -0,0 +1,144 @@
+import threading
+import time
+
+import pytest
+
+from conftest import load_snippet
+from dmxapi import endpoints
+from dmxapi.intervals import MIN_SAMPLES, CompletionStats
+from dmxapi.scheduler import DeadlineExceededError, QueueTimeoutError, SubmitScheduler
+
+
+def test_in_flight_limit_prevents_rejections(mock_server):
+    # 服务端每个模型最多 2 个进行中的任务，本地按同样的限制排队，不会收到 1303
+    mock_server.profile.max_running = 2
+    client = load_snippet("kling-text-to-image").KlingTextToImage("sk-test", mock_server.url)
+    client.scheduler.set_limit(model_name="kling-v1", max_in_flight=2)
+    params = [{"model_name": "kling-v1", "prompt": f"第 {index} 只猫", "timeout": 30} for index in range(6)]
+    errors = [error for _, _, error in client.generate_many(params)]
+    assert errors == [None] * 6
+    assert mock_server.stats()["submits"] == 6
+    assert mock_server.stats()["rejected"] == 0
+    assert client.scheduler.stats()["rules"][0]["in_flight"] == 0
+
+
+def test_quota_applies_per_model():
+    scheduler = SubmitScheduler([{"model_name": "kling-v1", "max_in_flight": 1}])
+    held = scheduler.acquire(endpoints.TEXT_TO_IMAGE, "kling-v1")
+    # 其他模型不受 kling-v1 的限制
+    scheduler.acquire(endpoints.TEXT_TO_IMAGE, "kling-v1-6", timeout=0.5).release()
+    with pytest.raises(QueueTimeoutError):
+        scheduler.acquire(endpoints.TEXT_TO_IMAGE, "kling-v1", timeout=0.2)
+    held.release()
+    scheduler.acquire(endpoints.TEXT_TO_IMAGE, "kling-v1", timeout=0.5).release()
+    assert scheduler.stats()["priorities"]["normal"]["timeout"] == 1
+
+
+def test_rate_limit_spaces_submissions():
+    scheduler = SubmitScheduler([{"rate": 20, "burst": 1}])
+    start = time.monotonic()
+    for _ in range(6):
+        scheduler.acquire(endpoints.TEXT_TO_IMAGE).release()
+    # 第一次使用满桶的令牌，之后每 0.05 秒一个
+    assert time.monotonic() - start >= 0.2
+
+
+def test_release_wakes_waiting_thread():
+    scheduler = SubmitScheduler([{"max_in_flight": 1}])
+    held = scheduler.acquire(endpoints.TEXT_TO_IMAGE)
+    acquired = threading.Event()
+
+    def wait_for_permit():
+        with scheduler.acquire(endpoints.TEXT_TO_IMAGE, timeout=5):
+            acquired.set()
+
+    thread = threading.Thread(target=wait_for_permit)
+    thread.start()
+    assert not acquired.wait(0.2)
+    held.release()
+    assert acquired.wait(5)
+    thread.join()
+
+
+def _queue_in_order(scheduler, requests):
+    """按顺序排入等待许可的线程，返回 (线程列表, 取得许可的顺序)"""
+    granted = []
+    threads = []
+    for name, kwargs in requests:
+        def wait_for_permit(name=name, kwargs=kwargs):
+            with scheduler.acquire(endpoints.TEXT_TO_VIDEO, "kling-v1", timeout=5, **kwargs):
+                granted.append(name)
+        thread = threading.Thread(target=wait_for_permit)
+        thread.start()
+        threads.append(thread)
+        # 等到该线程已在队列中，保证入队顺序
+        while scheduler.stats()["queued"] < len(threads):
+            time.sleep(0.01)
+    return threads, granted
+
+
+def test_priority_then_deadline_order():
+    scheduler = SubmitScheduler([{"max_in_flight": 1}])
+    held = scheduler.acquire(endpoints.TEXT_TO_VIDEO, "kling-v1")
+    now = time.time()
+    threads, granted = _queue_in_order(scheduler, [
+        ("batch", {"priority": "batch"}),
+        ("normal-late", {"deadline": now + 60}),
+        ("normal-early", {"deadline": now + 30}),
+        ("interactive", {"priority": "interactive"}),
+    ])
+    held.release()
+    for thread in threads:
+        thread.join()
+    # 优先级高的先提交，同一优先级内截止时间早的先提交
+    assert granted == ["interactive", "normal-early", "normal-late", "batch"]
+
+
+def test_head_of_queue_reserves_shared_slot():
+    # 交互任务等待账号总并发时为自己预留名额，不会被后到的批量任务抢走
+    scheduler = SubmitScheduler([{"max_in_flight": 2}, {"model_name": "kling-v1", "mode": "pro", "max_in_flight": 1}])
+    pro = scheduler.acquire(endpoints.TEXT_TO_VIDEO, "kling-v1", "pro")
+    other = scheduler.acquire(endpoints.TEXT_TO_VIDEO, "kling-v1", "std")
+    threads, granted = _queue_in_order(scheduler, [
+        ("interactive", {"priority": "interactive", "mode": "pro"}),
+        ("batch", {"priority": "batch", "mode": "std"}),
+    ])
+    other.release()
+    time.sleep(0.2)
+    # 空出的总并发名额留给排在前面的交互任务，批量任务不能先提交
+    assert granted == []
+    assert scheduler.stats()["queued"] == 2
+    pro.release()
+    for thread in threads:
+        thread.join()
+    # 两个名额同时空出后都能取得许可，记录先后取决于线程调度
+    assert sorted(granted) == ["batch", "interactive"]
+
+
+def test_deadline_expires_while_queued():
+    scheduler = SubmitScheduler([{"max_in_flight": 1}])
+    held = scheduler.acquire(endpoints.TEXT_TO_VIDEO, "kling-v1")
+    start = time.monotonic()
+    # 最晚提交时间为截止时间减去预计耗时，到时仍未取得许可就放弃，不等到 timeout
+    with pytest.raises(DeadlineExceededError):
+        scheduler.acquire(endpoints.TEXT_TO_VIDEO, "kling-v1", timeout=5, deadline=time.time() + 0.5, expected=0.2)
+    assert time.monotonic() - start < 1
+    assert scheduler.stats()["priorities"]["normal"]["expired"] == 1
+    assert scheduler.stats()["queued"] == 0
+    held.release()
+
+
+def test_deadline_already_unreachable():
+    with pytest.raises(DeadlineExceededError):
+        SubmitScheduler().acquire(endpoints.TEXT_TO_VIDEO, "kling-v1", deadline=time.time() + 1, expected=60)
+
+
+def test_client_gives_up_when_estimate_exceeds_timeout(tmp_path, mock_server):
+    # 按历史耗时已无法在 timeout 内完成的任务不提交
+    client = load_snippet("kling-text-to-video").KlingTextToVideo("sk-test", mock_server.url)
+    client.poller.schedule.stats = CompletionStats(str(tmp_path / "poll-stats.json"))
+    for _ in range(MIN_SAMPLES):
+        client.poller.schedule.stats.record((client.endpoint, "kling-v1", "std", "5"), 120)
+    with pytest.raises(DeadlineExceededError):
+        client.generate_video("kling-v1", "一只猫", timeout=30)
+    assert mock_server.stats()["submits"] == 0
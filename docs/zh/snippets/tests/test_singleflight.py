@@ -0,0 +1,81 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from conftest import HEADERS, load_snippet
+from dmxapi import endpoints
+from dmxapi.body import FileBase64
+from dmxapi.poller import TaskFailedError
+from dmxapi.singleflight import SingleFlight, payload_key
+
+
+@pytest.fixture
+def client(mock_server):
+    mock_server.profile.image_time = 1
+    return load_snippet("kling-text-to-image").KlingTextToImage("sk-test", mock_server.url)
+
+
+def _concurrently(*funcs):
+    """每个函数在一个线程中同时开始调用，按顺序返回结果或异常"""
+    barrier = threading.Barrier(len(funcs))
+
+    def call(func):
+        barrier.wait()
+        try:
+            return func()
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=len(funcs)) as executor:
+        return list(executor.map(call, funcs))
+
+
+def test_identical_calls_share_one_task(mock_server, client):
+    results = _concurrently(*[lambda: client.generate_image("kling-v1", "一只猫", timeout=30)] * 8)
+    assert mock_server.stats()["submits"] == 1
+    assert all(result == results[0] for result in results)
+    assert client.flights.stats() == {"leaders": 1, "shared": 7, "in_flight": 0}
+    # 已结束的调用不再合并，之后的相同调用提交新任务
+    assert client.generate_image("kling-v1", "一只猫", timeout=30) != results[0]
+    assert mock_server.stats()["submits"] == 2
+
+
+def test_coalesce_off_submits_every_call(mock_server, client):
+    _concurrently(*[lambda: client.generate_image("kling-v1", "一只猫", timeout=30, coalesce=False)] * 8)
+    assert mock_server.stats()["submits"] == 8
+
+
+def test_different_requests_not_merged(mock_server, client):
+    other = load_snippet("kling-text-to-image").KlingTextToImage("sk-other", mock_server.url)
+    _concurrently(lambda: client.generate_image("kling-v1", "一只猫", timeout=30),
+                  lambda: client.generate_image("kling-v1", "一只狗", timeout=30),
+                  lambda: other.generate_image("kling-v1", "一只猫", timeout=30))
+    # 提示词不同或 API 密钥不同的请求各自提交
+    assert mock_server.stats()["submits"] == 3
+
+
+def test_failure_shared_by_all_callers(mock_server, client):
+    mock_server.profile.error_rate = 1.0
+    results = _concurrently(*[lambda: client.generate_image("kling-v1", "一只猫", timeout=30)] * 8)
+    assert mock_server.stats()["submits"] == 1
+    assert all(isinstance(result, TaskFailedError) for result in results)
+
+
+def test_single_flight_releases_key_after_error():
+    flights = SingleFlight()
+    with pytest.raises(ValueError):
+        flights.run("key", lambda: (_ for _ in ()).throw(ValueError("失败")))
+    assert flights.run("key", lambda: 1) == 1
+    assert flights.in_flight() == 0
+
+
+def test_payload_key_normalization(tmp_path):
+    first, second = tmp_path / "a.png", tmp_path / "b.png"
+    first.write_bytes(b"same image")
+    second.write_bytes(b"same image")
+    # 字段顺序不影响 key，内容相同的本地文件副本视为同一张图片
+    assert payload_key(endpoints.IMAGE_TO_IMAGE, {"prompt": "猫", "image": FileBase64(str(first))}, HEADERS) == \
+        payload_key(endpoints.IMAGE_TO_IMAGE, {"image": FileBase64(str(second)), "prompt": "猫"}, HEADERS)
+    assert payload_key(endpoints.IMAGE_TO_IMAGE, {"prompt": "猫"}, HEADERS) != \
+        payload_key(endpoints.IMAGE_TO_IMAGE, {"prompt": "猫"}, dict(HEADERS, Authorization="Bearer sk-other"))
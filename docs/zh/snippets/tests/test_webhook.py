@@ -0,0 +1,102 @@
+import json
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from conftest import HEADERS, load_snippet
+from dmxapi import endpoints, jobs
+from dmxapi.intervals import AdaptiveSchedule, CompletionStats
+from dmxapi.poller import Poller, TaskFailedError
+from dmxapi.pool import get_pool
+from dmxapi.webhook import WebhookReceiver, enable_webhook
+
+PAYLOAD = {"model_name": "kling-v1", "prompt": "一只猫"}
+
+
+@pytest.fixture
+def receiver():
+    receiver = WebhookReceiver().start()
+    yield receiver
+    receiver.close()
+
+
+@pytest.fixture
+def poller(tmp_path, mock_server, receiver):
+    """接入回调接收器的轮询器，兜底轮询间隔由各测试设置"""
+    poller = Poller(mock_server.url, schedule=AdaptiveSchedule(CompletionStats(str(tmp_path / "poll-stats.json")),
+                                                                floor=0.1))
+    poller.use_webhook(receiver, fallback_interval=30)
+    yield poller
+    poller.close()
+
+
+def _submit(server, receiver):
+    return jobs.submit_job(get_pool(server.url), HEADERS, "text2image", PAYLOAD, callback_url=receiver.url)
+
+
+def test_callback_resolves_task_without_polling(mock_server, receiver, poller):
+    future = poller.register(endpoints.TEXT_TO_IMAGE, _submit(mock_server, receiver), HEADERS, timeout=30)
+    assert future.result(timeout=10)["task_status"] == endpoints.STATUS_SUCCEED
+    # 结果在回调处理中设置，计数随后更新，这里只检查没有发出查询
+    assert receiver.received == 1
+    assert mock_server.stats()["queries"] == 0
+
+
+def test_failed_callback_raises(mock_server, receiver, poller):
+    mock_server.profile.error_rate = 1.0
+    future = poller.register(endpoints.TEXT_TO_IMAGE, _submit(mock_server, receiver), HEADERS, timeout=30)
+    with pytest.raises(TaskFailedError):
+        future.result(timeout=10)
+    assert mock_server.stats()["queries"] == 0
+
+
+def test_lost_callback_falls_back_to_polling(mock_server, receiver, poller):
+    # 服务端没有推送回调时，按兜底间隔轮询拿到结果
+    mock_server.profile.callbacks = False
+    poller.push_fallback_interval = 0.5
+    future = poller.register(endpoints.TEXT_TO_IMAGE, _submit(mock_server, receiver), HEADERS, timeout=30)
+    assert future.result(timeout=10)["task_status"] == endpoints.STATUS_SUCCEED
+    assert poller.pushed_results == 0
+    assert receiver.received == 0
+    assert 1 <= mock_server.stats()["queries"] <= 3
+
+
+def test_callback_before_register_is_claimed(mock_server, receiver, poller):
+    task_id = _submit(mock_server, receiver)
+    deadline = time.monotonic() + 10
+    while receiver.received == 0 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    # 回调先于注册到达，由接收器暂存，注册时直接结束
+    future = poller.register(endpoints.TEXT_TO_IMAGE, task_id, HEADERS, timeout=30)
+    assert future.done()
+    assert future.result()["task_id"] == task_id
+    assert receiver.claimed == 1
+    assert mock_server.stats()["queries"] == 0
+
+
+def test_unknown_path_and_body_rejected(receiver):
+    def post(url, body):
+        request = urllib.request.Request(url, json.dumps(body).encode("utf-8"), {'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request) as res:
+                return res.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    assert post(f"http://{receiver.host}:{receiver.port}/other", {"task_id": "x", "task_status": "succeed"}) == 404
+    assert post(receiver.url, {"unexpected": True}) == 400
+    assert receiver.received == 0
+
+
+def test_client_fills_callback_url(mock_server):
+    receiver = enable_webhook(mock_server.url, fallback_interval=30)
+    try:
+        client = load_snippet("kling-text-to-image").KlingTextToImage("sk-test", mock_server.url)
+        assert client.generate_image("kling-v1", "一只猫", timeout=30)
+        # 回调地址由轮询器自动填写，结果由回调推送，没有查询请求
+        assert receiver.received == 1
+        assert mock_server.stats()["queries"] == 0
+    finally:
+        receiver.close()
@@ -5,9 +5,6 @@ import json
 API_URL = "www.dmxapi.cn" # API 节点
 DMX_API_TOKEN = "sk-XXXXXXXXXXXXX" # API 密钥
 
-# 创建HTTP连接对象，用于后续所有API请求
-conn = http.client.HTTPSConnection(API_URL)
-
 def kling_generate_image():
     """调用 Kling AI 的图像生成API，提交一个图像生成任务
     
@@ -30,11 +27,13 @@ def kling_generate_image():
     'Authorization': f'Bearer {DMX_API_TOKEN}',  # 使用Bearer令牌认证方式
     'Content-Type': 'application/json'  # 指定请求体格式为JSON
     }
+    conn = http.client.HTTPSConnection(API_URL)
     # 发送POST请求，路径为图像生成API端点
     conn.request("POST", "/kling/v1/images/generations", payload, headers)
     # 获取API响应并解析JSON数据
     res = conn.getresponse()
     json_data = json.loads(res.read().decode("utf-8"))
+    conn.close()
     # print(json_data)
     if json_data['code'] == 0:
         # 成功则返回提交的任务 id
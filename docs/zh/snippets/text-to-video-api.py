@@ -5,9 +5,6 @@ import json
 API_URL = "www.dmxapi.cn"  # API 节点
 DMX_API_TOKEN = "sk-XXXXXXXXXXXXXX"  # API 密钥
 
-# 创建HTTP连接对象，用于后续所有API请求
-conn = http.client.HTTPSConnection(API_URL)
-
 def kling_text_generate_video():
     """调用 Kling AI 的视频生成API，提交一个视频生成任务
     
@@ -52,12 +49,14 @@ def kling_text_generate_video():
         'Content-Type': 'application/json'  # 指定请求体格式为JSON
     }
     
+    conn = http.client.HTTPSConnection(API_URL)
     # 发送POST请求，路径为视频生成API端点
     conn.request("POST", "/kling/v1/videos/text2video", payload, headers)
     
     # 获取API响应并解析JSON数据
     res = conn.getresponse()
     json_data = json.loads(res.read().decode("utf-8"))
+    conn.close()
     # print(json_data)
     
     if json_data['code'] == 0:
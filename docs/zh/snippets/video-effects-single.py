@@ -6,9 +6,6 @@ import base64
 API_URL = "www.dmxapi.cn"  # API 节点
 DMX_API_TOKEN = "sk-XXXXXXXXXXXX"  # API 密钥
 
-# 创建HTTP连接对象，用于后续所有API请求
-conn = http.client.HTTPSConnection(API_URL)
-
 # 将图片转换为 base64 编码形式
 def get_image_base64(image_path):
     """将图片转换为 base64 编码形式
@@ -45,12 +42,14 @@ def kling_video_effects_single():
         'Content-Type': 'application/json'  # 指定请求体格式为JSON
     }
     
+    conn = http.client.HTTPSConnection(API_URL)
     # 发送POST请求，路径为视频生成API端点
     conn.request("POST", "/kling/v1/videos/effects", payload, headers)
     
     # 获取API响应并解析JSON数据
     res = conn.getresponse()
     json_data = json.loads(res.read().decode("utf-8"))
+    conn.close()
     print(json_data)
     
     # if json_data['code'] == 0:
@@ -5,9 +5,6 @@ import json
 API_URL = "www.dmxapi.cn"  # API 节点
 DMX_API_TOKEN = "sk-XXXXXXXXXXX"  # API 密钥
 
-# 创建HTTP连接对象，用于后续所有API请求
-conn = http.client.HTTPSConnection(API_URL)
-
 def kling_video_extend():
     """调用 Kling AI 的视频延长API，提交一个视频延长任务
     
@@ -30,12 +27,14 @@ def kling_video_extend():
         'Content-Type': 'application/json'  # 指定请求体格式为JSON
     }
     
+    conn = http.client.HTTPSConnection(API_URL)
     # 发送POST请求，路径为视频生成API端点
     conn.request("POST", "/kling/v1/videos/video-extend", payload, headers)
     
     # 获取API响应并解析JSON数据
     res = conn.getresponse()
     json_data = json.loads(res.read().decode("utf-8"))
+    conn.close()
     # print(json_data)
     
     if json_data['code'] == 0: